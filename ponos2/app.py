@@ -1,5 +1,8 @@
 # app.py
 import paho.mqtt.client as mqtt
+import asyncio
+import json
+import logging
 import queue
 import sys
 import time
@@ -7,9 +10,18 @@ import os
 import subprocess
 import signal
 import platform
+import threading
+from pathlib import Path
 import config as _cfg
+import fastlog
+import metrics
+from heartbeat import Heartbeat, ONLINE, OFFLINE
 from config import ID, BROKER, PORT
+from child_watch import ChildWatcher
 from mode_registry import ModeRegistry, ModeConfig
+from mode_pool import ModePool
+from mqtt_bus import BusServer, default_socket_path
+from topic_router import TopicRouter
 
 #BROKER = "192.168.1.75"
 #PORT = 1883
@@ -17,52 +29,128 @@ from mode_registry import ModeRegistry, ModeConfig
 
 
 TOPIC_MODE = f"arena/point/{ID}/mode"
-SUPER_TOPIC = "arena/supertopic"
-TOPICS = [
-    TOPIC_MODE,
-    f"arena/point/{ID}/action",
-    f"arena/point/{ID}/status",
-    f"arena/point/{ID}/event",
-    f"arena/point/{ID}/heartbeat",
-    f"arena/point/{ID}/hit",
-    f"arena/point/{ID}/time",
-    SUPER_TOPIC,
-]
-
-# подписки для режима «Купол», если в config.py указаны идентификаторы
-_extra_topics = []
-_dome_id = getattr(_cfg, "DOME_ID", None)
-_terminal_id = getattr(_cfg, "DOME_TERMINAL_ID", None)
-if _dome_id:
-    _extra_topics.append(f"arena/dome/{_dome_id}/state")
-if _terminal_id:
-    _extra_topics.append(f"arena/dome/bonus/{_terminal_id}/activate")
-    _extra_topics.append(f"arena/dome/bonus/{_terminal_id}/choice")
-
-TOPICS.extend(_extra_topics)
-
+# запрос журнала по MQTT: payload — сколько последних записей (пусто — все), ответ JSON-строками
+TOPIC_LOG_DUMP = f"arena/point/{ID}/log/dump"
+TOPIC_LOG = f"arena/point/{ID}/log"
+TOPIC_METRICS = f"arena/point/{ID}/metrics"
+# пульс раз в HEARTBEAT_INTERVAL с; retained-статус on/off, off — также Last Will
+TOPIC_HEARTBEAT = f"arena/point/{ID}/heartbeat"
+
+log = logging.getLogger("supervisor")
 # очередь команд из MQTT — чтение из неё будет в главном потоке
 cmd_queue = queue.Queue()
+# цикл asyncio супервизора и событие «есть новые команды» (будится из потока paho)
+_loop: asyncio.AbstractEventLoop | None = None
+_wakeup: asyncio.Event | None = None
 
 # Словарь запущенных дочерних процессов: name -> Popen
+# меняется из потока смены режима (start_mode в executor), читается из цикла событий — только под замком
 processes = {}
+_processes_lock = threading.RLock()
+_watcher: ChildWatcher | None = None
+# текущий режим для пульса: (mode_id, в хосте ли, monotonic запуска)
+current_mode: tuple[str, bool, float] | None = None
+HEARTBEAT_INTERVAL = float(getattr(_cfg, "HEARTBEAT_INTERVAL", 1.0) or 0)
 registry = ModeRegistry()
+REGISTRY_WATCH = bool(getattr(_cfg, "MODE_REGISTRY_WATCH", True))
+# пул прогретых интерпретаторов (PySide6/paho уже импортированы)
+pool = ModePool(
+    size=getattr(_cfg, "MODE_POOL_SIZE", 1),
+    refill_delay=getattr(_cfg, "MODE_POOL_REFILL_DELAY", 3.0),
+)
+
+# общий Qt-хост для режимов с "inprocess": true в manifest.json
+HOST_NAME = "__host__"
+HOST_SCRIPT = Path(__file__).resolve().parent / "mode_host.py"
+HOST_ENABLED = bool(getattr(_cfg, "MODE_HOST_ENABLED", True))
+# режимы, которые хост не смог загрузить (ответ "failed <mode_id>") — запускаются отдельным процессом
+host_failures = queue.Queue()
+
+# единственное подключение к брокеру: режимы работают через локальную шину
+BUS_ENABLED = bool(getattr(_cfg, "MQTT_BUS_ENABLED", True))
+BUS_SOCKET = getattr(_cfg, "MQTT_BUS_SOCKET", None) or default_socket_path(ID)
+bus: BusServer | None = None
+# обработчики по топикам: супервизор подписан только на то, что кто-то читает
+router: TopicRouter | None = None
+
+# метрики супервизора (режимы публикуют свои в TOPIC_METRICS/<режим>)
+METRICS_ENABLED = bool(getattr(_cfg, "METRICS_ENABLED", True))
+METRICS_INTERVAL = float(getattr(_cfg, "METRICS_INTERVAL", 10.0))
+METRICS_HTTP_PORT = int(getattr(_cfg, "METRICS_HTTP_PORT", 0) or 0)
+metrics_registry = metrics.Registry()
+metrics_registry.gauge("cmd_queue_depth", "Mode commands waiting for the supervisor", fn=cmd_queue.qsize)
+prometheus: metrics.PrometheusServer | None = None
+
+# смена режима: sequential — старые процессы по очереди, parallel — все сразу,
+# overlap — новый режим запускается, пока старые ещё завершаются
+HANDOVER_POLICIES = ("sequential", "parallel", "overlap")
+HANDOVER = str(getattr(_cfg, "MODE_HANDOVER", "parallel")).strip().lower()
+if HANDOVER not in HANDOVER_POLICIES:
+    log.warning("⚠️ Неизвестная политика MODE_HANDOVER=%r, использую parallel", HANDOVER)
+    HANDOVER = "parallel"
+
+# метрики завершения: name -> {"count", "last", "max", "total", "stage"}
+teardown_stats = {}
+_teardown_lock = threading.Lock()
+_retiring: list[threading.Thread] = []  # фоновые завершения (overlap)
 
 def on_connect(client, userdata, flags, rc):
-    print("✅ Подключено к брокеру, код:", rc)
+    log.info("✅ Подключено к брокеру, код: %s", rc)
     if rc != 0:
-        print("⚠️ Код подключения не нулевой, возможно ошибка.")
-    for t in TOPICS:
-        client.subscribe(t)
-        print("📡 Подписка на", t)
-
-def on_message(client, userdata, msg):
-    topic = msg.topic
+        log.warning("⚠️ Код подключения не нулевой, возможно ошибка.")
+    if router is not None:
+        router.on_connect(rc)
+        log.info("📡 Подписки: %s", ", ".join(router.filters()))
+    if rc == 0 and HEARTBEAT_INTERVAL > 0:
+        # перекрываем retained "off" от Last Will прошлого соединения
+        client.publish(TOPIC_HEARTBEAT, ONLINE, qos=1, retain=True)
+    if bus is not None:
+        bus.on_upstream_connect(rc)
+
+def on_disconnect(client, userdata, rc):
+    if router is not None:
+        router.on_disconnect()
+    if bus is not None:
+        bus.on_upstream_disconnect()
+
+def on_mode_message(client, userdata, msg):
     payload = msg.payload.decode(errors="ignore")
-    print("📩 Получено сообщение:", topic, "→", payload)
-
-    if topic == TOPIC_MODE:
-        cmd_queue.put(payload)
+    log.info("📩 Команда режима: %s", payload)
+    cmd_queue.put(payload)
+    _wake_supervisor()
+
+def on_log_dump(client, userdata, msg):
+    text = msg.payload.decode(errors="ignore").strip()
+    limit = int(text) if text.isdigit() else None
+    lines = fastlog.dump("json", limit)
+    client.publish(TOPIC_LOG, "\n".join(lines), qos=1)
+    log.info("📤 Журнал (%s записей) отправлен в %s", len(lines), TOPIC_LOG)
+
+def on_mode_metrics(client, userdata, msg):
+    if prometheus is None:
+        return
+    try:
+        snapshot = json.loads(msg.payload)
+    except ValueError:
+        return
+    prometheus.update_mode(msg.topic.rsplit("/", 1)[-1], snapshot)
+
+def setup_routing(client: mqtt.Client) -> TopicRouter:
+    """Повесить на client роутер топиков с обработчиками супервизора."""
+    global router
+    router = TopicRouter(client, metrics_registry)
+    router.add(TOPIC_MODE, on_mode_message)
+    router.add(TOPIC_LOG_DUMP, on_log_dump)
+    return router
+
+def _wake_supervisor():
+    loop, wakeup = _loop, _wakeup
+    if loop is None or wakeup is None:
+        return
+    try:
+        loop.call_soon_threadsafe(wakeup.set)
+    except RuntimeError:
+        pass  # цикл уже закрыт
 
 def _is_alive(proc: subprocess.Popen) -> bool:
     return proc and (proc.poll() is None)
@@ -73,158 +161,440 @@ def _graceful_terminate(proc: subprocess.Popen, name: str, timeout1=2, timeout2=
        2) wait timeout1,
        3) proc.terminate(), wait timeout2,
        4) proc.kill() если всё ещё жив.
+    Возвращает, на каком шаге процесс завершился: exited/sigint/terminate/kill.
     """
     if proc is None:
-        return
+        return "exited"
 
     if proc.poll() is not None:
-        print(f"ℹ️ Процесс {name} уже завершился с кодом {proc.returncode}.")
-        return
+        log.info("ℹ️ Процесс %s уже завершился с кодом %s.", name, proc.returncode)
+        return "exited"
 
-    print(f"⏳ Попытка корректно завершить процесс {name} (pid={proc.pid})...")
+    log.info("⏳ Попытка корректно завершить процесс %s (pid=%s)...", name, proc.pid)
 
     try:
         if platform.system() != "Windows":
             # сначала посылаем SIGINT (как если бы нажали Ctrl+C)
             try:
                 proc.send_signal(signal.SIGINT)
-                print(f"🟡 Отправлен SIGINT процессу {name}.")
+                log.info("🟡 Отправлен SIGINT процессу %s.", name)
             except Exception as e:
-                print("⚠️ Не удалось отправить SIGINT:", e)
+                log.warning("⚠️ Не удалось отправить SIGINT: %s", e)
         else:
             # на Windows SIGINT может не сработать для дочернего процесса — будем пробовать terminate ниже
-            print("ℹ️ Windows: пропускаем SIGINT (будет использован terminate).")
+            log.info("ℹ️ Windows: пропускаем SIGINT (будет использован terminate).")
     except Exception as e:
-        print("⚠️ Ошибка при попытке послать сигнал:", e)
+        log.warning("⚠️ Ошибка при попытке послать сигнал: %s", e)
 
     # ждём коротко
     try:
         proc.wait(timeout=timeout1)
-        print(f"✅ Процесс {name} завершился после SIGINT с кодом {proc.returncode}.")
-        return
+        log.info("✅ Процесс %s завершился после SIGINT с кодом %s.", name, proc.returncode)
+        return "sigint"
     except subprocess.TimeoutExpired:
-        print(f"⌛ Процесс {name} не завершился после SIGINT, пробуем terminate()...")
+        log.info("⌛ Процесс %s не завершился после SIGINT, пробуем terminate()...", name)
 
     # затем terminate()
     try:
         proc.terminate()
-        print(f"🟠 Отправлен terminate() процессу {name}.")
+        log.info("🟠 Отправлен terminate() процессу %s.", name)
     except Exception as e:
-        print("⚠️ Ошибка при terminate():", e)
+        log.warning("⚠️ Ошибка при terminate(): %s", e)
 
     try:
         proc.wait(timeout=timeout2)
-        print(f"✅ Процесс {name} корректно завершился после terminate() с кодом {proc.returncode}.")
-        return
+        log.info("✅ Процесс %s корректно завершился после terminate() с кодом %s.", name, proc.returncode)
+        return "terminate"
     except subprocess.TimeoutExpired:
-        print(f"❗ Процесс {name} не завершился после terminate(), выполняю kill().")
+        log.warning("❗ Процесс %s не завершился после terminate(), выполняю kill().", name)
 
     # финальный шаг: kill
     try:
         proc.kill()
         proc.wait(timeout=1)
-        print(f"🔥 Процесс {name} принудительно убит (kill).")
+        log.warning("🔥 Процесс %s принудительно убит (kill).", name)
     except Exception as e:
-        print("⚠️ Не удалось убить процесс:", e)
+        log.warning("⚠️ Не удалось убить процесс: %s", e)
+    return "kill"
+
+def _record_teardown(name: str, seconds: float, stage: str):
+    with _teardown_lock:
+        st = teardown_stats.setdefault(name, {"count": 0, "last": 0.0, "max": 0.0, "total": 0.0, "stage": ""})
+        st["count"] += 1
+        st["last"] = seconds
+        st["max"] = max(st["max"], seconds)
+        st["total"] += seconds
+        st["stage"] = stage
+        avg = st["total"] / st["count"]
+    metrics_registry.histogram("mode_teardown_ms", "Time for an outgoing mode process to exit, ms",
+                               mode=name).observe(seconds * 1000.0)
+    log.info("📊 %s завершён за %.2f с (%s); среднее %.2f с, максимум %.2f с", name, seconds, stage, avg, st['max'])
+
+def _teardown(proc: subprocess.Popen, name: str):
+    t0 = time.monotonic()
+    stage = _graceful_terminate(proc, name)
+    _record_teardown(name, time.monotonic() - t0, stage)
+
+def _take_processes(except_name: str | None = None) -> list:
+    """Забрать из словаря процессы на завершение (кроме except_name, если он жив)."""
+    victims = []
+    with _processes_lock:
+        for name in list(processes.keys()):
+            proc = processes.get(name)
+            if except_name is not None and name == except_name:
+                # если хотим сохранить конкретный процесс, проверим жив ли он — если нет, удалим из словаря
+                if not _is_alive(proc):
+                    processes.pop(name, None)
+                else:
+                    log.info("🔒 Оставляем процесс %s (pid=%s)", name, proc.pid)
+                continue
+            processes.pop(name, None)
+            if proc is not None:
+                victims.append((name, proc))
+    return victims
+
+def _get_process(name: str) -> subprocess.Popen | None:
+    with _processes_lock:
+        return processes.get(name)
+
+def _processes_snapshot() -> dict:
+    with _processes_lock:
+        return dict(processes)
+
+def _add_process(name: str, proc: subprocess.Popen):
+    """Записать запущенный процесс и сразу поставить его на слежение в цикле событий."""
+    with _processes_lock:
+        processes[name] = proc
+    loop = _loop
+    if loop is not None:
+        # ребёнок может завершиться ещё до конца смены режима — не ждём watcher.sync()
+        loop.call_soon_threadsafe(_watch_child, name, proc)
+
+def _watch_child(name: str, proc: subprocess.Popen):
+    if _watcher is not None and _get_process(name) is proc:
+        _watcher.watch(name, proc)
+
+def _retire(victims: list, policy: str = HANDOVER, wait: bool = True):
+    """Завершить процессы: по очереди (sequential) или параллельно в потоках."""
+    if not victims:
+        return
+    if policy == "sequential":
+        for name, proc in victims:
+            _teardown(proc, name)
+        return
+    threads = []
+    for name, proc in victims:
+        t = threading.Thread(target=_teardown, args=(proc, name), name=f"teardown-{name}", daemon=True)
+        t.start()
+        threads.append(t)
+    if wait:
+        for t in threads:
+            t.join()
+    else:
+        _retiring[:] = [t for t in _retiring if t.is_alive()] + threads
+
+def _join_retiring():
+    for t in list(_retiring):
+        t.join()
+    _retiring.clear()
 
 def stop_all_processes(except_name: str | None = None):
     """Завершить все дочерние процессы, кроме опционально указанного."""
-    global processes
-    names = list(processes.keys())
-    for name in names:
-        if except_name is not None and name == except_name:
-            # если хотим сохранить конкретный процесс, проверим жив ли он — если нет, удалим из словаря
-            proc = processes.get(name)
-            if not _is_alive(proc):
-                processes.pop(name, None)
-            else:
-                print(f"🔒 Оставляем процесс {name} (pid={proc.pid})")
-            continue
-
-        proc = processes.get(name)
-        if proc is None:
-            processes.pop(name, None)
-            continue
-        _graceful_terminate(proc, name)
-        # очистим запись
-        processes.pop(name, None)
+    policy = "sequential" if HANDOVER == "sequential" else "parallel"
+    _retire(_take_processes(except_name), policy)
+
+def _ensure_host() -> subprocess.Popen | None:
+    """Вернуть живой процесс Qt-хоста, при необходимости запустив его."""
+    proc = _get_process(HOST_NAME)
+    if _is_alive(proc):
+        return proc
+    try:
+        proc = subprocess.Popen([sys.executable, str(HOST_SCRIPT)], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                cwd=str(HOST_SCRIPT.parent))
+    except Exception as e:
+        log.error("❌ Не удалось запустить хост режимов: %s", e)
+        return None
+    threading.Thread(target=_read_host_status, args=(proc,), name="host-status", daemon=True).start()
+    _add_process(HOST_NAME, proc)
+    log.info("🏠 Хост режимов запущен (pid=%s).", proc.pid)
+    return proc
+
+def _read_host_status(proc: subprocess.Popen):
+    """Ответы хоста на load: loaded/failed <mode_id>, по строке на команду."""
+    for raw in proc.stdout:
+        status, _, mode_id = raw.decode(errors="ignore").strip().partition(" ")
+        if status == "failed" and mode_id:
+            host_failures.put(mode_id)
+            _wake_supervisor()
+
+def _host_fallback(mode_id: str):
+    """Хост не загрузил режим — запускаем его отдельным процессом, если он всё ещё текущий."""
+    mode = current_mode
+    if mode is None or mode[0] != mode_id or not mode[1]:
+        return  # уже переключились на другой режим
+    config = registry.get(mode_id)
+    if config is None:
+        log.error("❌ Режим '%s' не найден в каталоге modes/", mode_id)
+        return
+    log.warning("⚠️ Хост не загрузил режим %s, запускаю отдельным процессом.", mode_id)
+    _launch_mode(mode_id, config, hosted=False)
+
+def _host_send(command: str) -> bool:
+    proc = _get_process(HOST_NAME)
+    if not _is_alive(proc):
+        return False
+    try:
+        proc.stdin.write((command + "\n").encode("utf-8"))
+        proc.stdin.flush()
+        return True
+    except Exception as e:
+        log.warning("⚠️ Хост режимов не принял команду: %s", e)
+        return False
 
 def start_mode(mode_id: str):
     """Запуск режима из реестра manifest'ов."""
     mode: ModeConfig | None = registry.get(mode_id)
     if mode is None:
-        print(f"❌ Режим '{mode_id}' не найден в каталоге modes/")
+        log.error("❌ Режим '%s' не найден в каталоге modes/", mode_id)
         return
 
-    # Закрываем ВСЕ другие перед стартом
-    stop_all_processes(except_name=None)
+    # Закрываем ВСЕ другие перед стартом (хост только выгружает текущий режим)
+    hosted = HOST_ENABLED and mode.inprocess
+    if not hosted:
+        _host_send("unload")
+    outgoing = _take_processes(except_name=HOST_NAME)
+
+    if HANDOVER == "overlap":
+        # новый режим стартует сразу, старые завершаются в фоне
+        _launch_mode(mode_id, mode, hosted)
+        _retire(outgoing, "parallel", wait=False)
+    else:
+        _retire(outgoing, HANDOVER)
+        _launch_mode(mode_id, mode, hosted)
+
+def _launch_mode(mode_id: str, mode: ModeConfig, hosted: bool):
+    global current_mode
+    current_mode = (mode_id, hosted, time.monotonic())
+    if hosted:
+        if _ensure_host() is not None and _host_send(f"load {mode_id}"):
+            log.info("🏠 Режим %s (%s) загружается в хосте.", mode.name, mode_id)
+            return
+        current_mode = (mode_id, False, current_mode[2])
+        log.warning("⚠️ Хост недоступен, запускаю %s отдельным процессом.", mode_id)
 
     cmd = [sys.executable, str(mode.entry)] + list(mode.args)
     pretty_cmd = " ".join(cmd)
-    print(f"🚀 Запуск режима {mode.name} ({mode_id}): {pretty_cmd}")
+    log.info("🚀 Запуск режима %s (%s): %s", mode.name, mode_id, pretty_cmd)
+
+    proc = pool.acquire(mode) if mode.prewarm else None
+    if proc is not None:
+        _add_process(mode_id, proc)
+        log.info("🟢 Процесс %s запущен из прогретого пула (pid=%s).", mode_id, proc.pid)
+        return
+
+    # запасной путь: обычный холодный запуск
     try:
         proc = subprocess.Popen(cmd, cwd=str(mode.workdir))
-        processes[mode_id] = proc
-        print(f"🟢 Процесс {mode_id} запущен (pid={proc.pid}).")
+        _add_process(mode_id, proc)
+        log.info("🟢 Процесс %s запущен (pid=%s).", mode_id, proc.pid)
     except Exception as e:
-        print("❌ Не удалось запустить процесс:", e)
+        log.error("❌ Не удалось запустить процесс: %s", e)
+
+def _on_child_exit(name: str, proc: subprocess.Popen):
+    # процессы, которые сейчас завершает супервизор, уже убраны из словаря
+    with _processes_lock:
+        if processes.get(name) is not proc:
+            return
+        processes.pop(name, None)
+    log.info("ℹ️ Процесс %s завершился самостоятельно с кодом %s, удаляю из списка.", name, proc.returncode)
+
+def _current_mode_pid() -> int | None:
+    if current_mode is None:
+        return None
+    mode_id, hosted, _ = current_mode
+    proc = _get_process(HOST_NAME if hosted else mode_id)
+    return proc.pid if _is_alive(proc) else None
+
+async def _heartbeat(client: mqtt.Client):
+    """Пульс из цикла событий: если цикл завис, пульс пропадает, а lag показывает задержки."""
+    loop = asyncio.get_running_loop()
+    beat = Heartbeat()
+    due = loop.time()
+    while True:
+        due += HEARTBEAT_INTERVAL
+        await asyncio.sleep(max(0.0, due - loop.time()))
+        lag_ms = (loop.time() - due) * 1000.0
+        if lag_ms > HEARTBEAT_INTERVAL * 1000.0:
+            due = loop.time()  # после долгого зависания не догоняем пропущенные удары
+        mode = current_mode
+        payload = beat.beat(mode[0] if mode else None, _current_mode_pid(), mode[2] if mode else None, lag_ms)
+        client.publish(TOPIC_HEARTBEAT, payload, qos=0)
+
+async def _supervise(client: mqtt.Client | None = None):
+    """Цикл событий супервизора: команды из MQTT, выход дочерних процессов, таймер пула."""
+    global _loop, _wakeup, _watcher
+    loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    _loop = loop
+    watcher = _watcher = ChildWatcher(loop, _on_child_exit)
+    log.info("👀 Слежение за дочерними процессами: %s", watcher.mode)
+    registry_fd = registry.watch() if REGISTRY_WATCH else None
+    if registry_fd is not None:
+        loop.add_reader(registry_fd, registry.on_watch_ready)
+        log.info("👀 Каталог modes/ отслеживается: новые режимы подхватываются без перезапуска")
+    refill = None
+    switching = False
+
+    def refill_pool():
+        if not switching:
+            pool.maintain()
+
+    def schedule_refill():
+        nonlocal refill
+        if refill is not None:
+            refill.cancel()
+        delay = pool.refill_in()
+        refill = loop.call_later(delay, refill_pool) if delay is not None else None
+
+    watcher.sync(_processes_snapshot())
+    schedule_refill()
+    heartbeat = loop.create_task(_heartbeat(client)) if client is not None and HEARTBEAT_INTERVAL > 0 else None
+    if not cmd_queue.empty() or not host_failures.empty():
+        _wakeup.set()
+    try:
+        while True:
+            await _wakeup.wait()
+            _wakeup.clear()
+            while True:
+                try:
+                    cmd = cmd_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                cmd = cmd.strip()
+                if not cmd:
+                    continue
+
+                log.info("▶ Получена команда: %s", cmd)
+
+                if cmd in registry:
+                    # завершение старых процессов блокирует — выполняем вне цикла событий
+                    switching = True
+                    started = time.monotonic()
+                    try:
+                        await loop.run_in_executor(None, start_mode, cmd)
+                    finally:
+                        switching = False
+                    metrics_registry.histogram("mode_switch_ms", "start_mode() duration in the supervisor, ms",
+                                               mode=cmd).observe((time.monotonic() - started) * 1000.0)
+                    watcher.sync(_processes_snapshot())
+                    schedule_refill()
+                else:
+                    log.warning("Неизвестная команда: %s", cmd)
+
+            while True:
+                try:
+                    mode_id = host_failures.get_nowait()
+                except queue.Empty:
+                    break
+                await loop.run_in_executor(None, _host_fallback, mode_id)
+                watcher.sync(_processes_snapshot())
+                schedule_refill()
+    finally:
+        _loop = None
+        _watcher = None
+        if heartbeat is not None:
+            heartbeat.cancel()
+        if refill is not None:
+            refill.cancel()
+        watcher.close()
+        if registry_fd is not None:
+            loop.remove_reader(registry_fd)
+            registry.close()
+
+def _start_metrics(client: mqtt.Client):
+    """Периодическая публикация метрик и HTTP для Prometheus; возвращает издателя (или None)."""
+    global prometheus
+    if not METRICS_ENABLED:
+        return None
+    if METRICS_HTTP_PORT:
+        try:
+            prometheus = metrics.PrometheusServer(metrics_registry, METRICS_HTTP_PORT).start()
+            router.add(f"{TOPIC_METRICS}/+", on_mode_metrics)
+        except OSError as e:
+            log.warning("⚠️ HTTP для метрик не запущен (порт %s): %s", METRICS_HTTP_PORT, e)
+    return metrics.MetricsPublisher(metrics_registry, TOPIC_METRICS, METRICS_INTERVAL, client).start()
 
 def main():
+    global bus
+    fastlog.setup("supervisor")
     client = mqtt.Client()
     client.on_connect = on_connect
-    client.on_message = on_message
+    client.on_disconnect = on_disconnect
+    setup_routing(client)
+    if HEARTBEAT_INTERVAL > 0:
+        # брокер сам пометит точку мёртвой, если соединение оборвётся
+        client.will_set(TOPIC_HEARTBEAT, OFFLINE, qos=1, retain=True)
+
+    # шину поднимаем до запуска дочерних процессов: они наследуют PONOS_MQTT_BUS
+    if BUS_ENABLED:
+        bus = BusServer(client, BUS_SOCKET, router, metrics_registry)
+        if bus.start():
+            client.on_publish = bus.on_publish
+        else:
+            bus = None
 
     try:
         client.connect(BROKER, PORT, 60)
     except Exception as e:
-        print("❌ Не удалось подключиться к брокеру MQTT:", e)
+        log.error("❌ Не удалось подключиться к брокеру MQTT: %s", e)
+        if bus is not None:
+            bus.stop()
         return
 
     client.loop_start()
+    metrics_publisher = _start_metrics(client)
+    pool.maintain()
+    if HOST_ENABLED and any(m.inprocess for m in registry.list_modes()):
+        _ensure_host()
 
-    print("⏳ Контроллер запущен. Ожидание команд (mode). Ctrl+C — выход.")
+    log.info("⏳ Контроллер запущен. Ожидание команд (mode). Ctrl+C — выход.")
 
     try:
-        while True:
-            try:
-                cmd = cmd_queue.get(timeout=1)  # ждём команду 1 сек
-            except queue.Empty:
-                # при пустой очереди можно проверять живость процессов и очищать завершённые
-                # удаляем из словаря процессы, которые умерли
-                for n, p in list(processes.items()):
-                    if not _is_alive(p):
-                        print(f"ℹ️ Процесс {n} завершился самостоятельно с кодом {p.returncode}, удаляю из списка.")
-                        processes.pop(n, None)
-                continue
-
-            cmd = cmd.strip()
-            if not cmd:
-                continue
-
-            print("▶ Получена команда:", cmd)
-
-            if cmd in registry:
-                start_mode(cmd)
-            else:
-                print("Неизвестная команда:", cmd)
-
+        asyncio.run(_supervise(client))
     except KeyboardInterrupt:
-        print("\n🛑 Остановка контроллера по Ctrl+C")
+        log.info("🛑 Остановка контроллера по Ctrl+C")
     finally:
         # корректно завершить все дочерние процессы перед выходом
-        print("🏁 Завершаю все дочерние процессы...")
+        log.info("🏁 Завершаю все дочерние процессы...")
+        _host_send("quit")
         stop_all_processes(except_name=None)
+        _join_retiring()
+        pool.close()
+        if bus is not None:
+            bus.stop()
+        if metrics_publisher is not None:
+            metrics_publisher.stop()
+        if prometheus is not None:
+            prometheus.stop()
+
+        if HEARTBEAT_INTERVAL > 0:
+            # при штатном disconnect Last Will не отправляется — статус публикуем сами
+            try:
+                client.publish(TOPIC_HEARTBEAT, OFFLINE, qos=1, retain=True).wait_for_publish(timeout=1.0)
+            except Exception as e:
+                log.warning("⚠️ Не удалось опубликовать статус off: %s", e)
 
         # остановим MQTT loop перед disconnect
         try:
             client.loop_stop()
         except Exception as e:
-            print("⚠️ Ошибка при остановке loop:", e)
+            log.warning("⚠️ Ошибка при остановке loop: %s", e)
         try:
             client.disconnect()
         except Exception as e:
-            print("⚠️ Ошибка при отключении от брокера:", e)
-        print("✅ MQTT отключён. Выход.")
+            log.warning("⚠️ Ошибка при отключении от брокера: %s", e)
+        log.info("✅ MQTT отключён. Выход.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+import subprocess
+from typing import Callable, Dict, Mapping, Tuple
+
+
+class ChildWatcher:
+    """Reports child exits on the asyncio loop as soon as they happen.
+
+    ``on_exit(name, proc)`` runs on the loop thread after the child has been
+    reaped. Linux 5.3+ gets one pidfd per child registered with
+    ``loop.add_reader``; elsewhere a SIGCHLD handler checks all children, and as
+    a last resort they are polled every ``poll_interval`` seconds.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 on_exit: Callable[[str, subprocess.Popen], None],
+                 poll_interval: float = 1.0) -> None:
+        self._loop = loop
+        self._on_exit = on_exit
+        self._poll_interval = poll_interval
+        self._watched: Dict[int, Tuple[str, subprocess.Popen, int | None]] = {}
+        self._poll_handle: asyncio.TimerHandle | None = None
+        self.mode = self._pick_mode()
+
+    def _pick_mode(self) -> str:
+        if hasattr(os, "pidfd_open"):
+            try:
+                os.close(os.pidfd_open(os.getpid()))
+                return "pidfd"
+            except OSError:
+                pass
+        if hasattr(signal, "SIGCHLD"):
+            try:
+                self._loop.add_signal_handler(signal.SIGCHLD, self._check_all)
+                return "sigchld"
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass
+        self._poll_handle = self._loop.call_later(self._poll_interval, self._poll)
+        return "poll"
+
+    def watch(self, name: str, proc: subprocess.Popen) -> None:
+        entry = self._watched.get(proc.pid)
+        if entry is not None and entry[1] is proc:
+            return
+        fd = None
+        if self.mode == "pidfd":
+            try:
+                fd = os.pidfd_open(proc.pid)
+            except ProcessLookupError:
+                # уже подобран кем-то ещё — сообщаем сразу
+                proc.poll()
+                self._loop.call_soon(self._on_exit, name, proc)
+                return
+            self._loop.add_reader(fd, self._on_pidfd, proc.pid)
+        self._watched[proc.pid] = (name, proc, fd)
+        if self.mode != "pidfd" and proc.poll() is not None:
+            self._loop.call_soon(self._check_all)
+
+    def sync(self, processes: Mapping[str, subprocess.Popen]) -> None:
+        """Watch every process in ``processes`` and forget the ones no longer there."""
+        current = {proc.pid: proc for proc in processes.values() if proc is not None}
+        for pid, (_, proc, _fd) in list(self._watched.items()):
+            if current.get(pid) is not proc:
+                self._forget(pid)
+        for name, proc in processes.items():
+            if proc is not None:
+                self.watch(name, proc)
+
+    def _forget(self, pid: int) -> Tuple[str, subprocess.Popen, int | None] | None:
+        entry = self._watched.pop(pid, None)
+        if entry is not None and entry[2] is not None:
+            self._loop.remove_reader(entry[2])
+            os.close(entry[2])
+        return entry
+
+    def _on_pidfd(self, pid: int) -> None:
+        entry = self._forget(pid)
+        if entry is None:
+            return
+        name, proc, _ = entry
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            return
+        self._on_exit(name, proc)
+
+    def _check_all(self) -> None:
+        for pid, (name, proc, _) in list(self._watched.items()):
+            if proc.poll() is not None:
+                self._forget(pid)
+                self._on_exit(name, proc)
+
+    def _poll(self) -> None:
+        self._check_all()
+        self._poll_handle = self._loop.call_later(self._poll_interval, self._poll)
+
+    def close(self) -> None:
+        for pid in list(self._watched):
+            self._forget(pid)
+        if self.mode == "sigchld":
+            self._loop.remove_signal_handler(signal.SIGCHLD)
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
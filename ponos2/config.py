@@ -1,5 +1,8 @@
-BROKER = "192.168.1.21"
-PORT = 1883
+import os
+
+# PONOS_BROKER/PONOS_PORT позволяют направить точку на локальный брокер (стенд, бенчмарки)
+BROKER = os.environ.get("PONOS_BROKER", "192.168.1.21")
+PORT = int(os.environ.get("PONOS_PORT", "1883"))
 ID = "02" 
 USER = "5 уровень"
 
@@ -11,6 +14,8 @@ DOME_DEFAULT_CHOICE = "keep_ammo" # keep_ammo или super_shots
 DOME_TIMEOUT_SEC = 45
 DOME_HP_MAX = 1000
 DOME_HIT_DAMAGE = 120
+DOME_LEDGER_PATH = None           # файл журнала урона (None — только в памяти); после рестарта дисплея HP восстанавливается
+DOME_LEDGER_RESUME_SEC = 120      # продолжать игру из журнала, если последнее попадание не старше (сек)
 DOME_TEAM_NAMES = {
     "red": "Красные",
     "blue": "Синие",
@@ -20,3 +25,39 @@ DOME_TEAM_COLORS = {
     "blue": "#4df0ff",
     "default": "#8bdfff",
 }
+
+# супервизор: пул прогретых процессов для быстрого переключения режимов
+MODE_POOL_SIZE = 1                # 0 — отключить пул, всегда холодный запуск
+MODE_POOL_REFILL_DELAY = 3.0      # пауза (сек) перед прогревом замены
+MODE_HOST_ENABLED = True          # режимы с "inprocess": true грузятся в общий Qt-хост
+MQTT_BUS_ENABLED = True           # режимы используют подключение супервизора через локальный сокет
+MQTT_BUS_SOCKET = None            # None — /tmp/ponos_mqtt_<ID>.sock
+MODE_REGISTRY_WATCH = True        # следить за modes/ (inotify): новые/изменённые режимы без перезапуска
+MODE_HANDOVER = "parallel"        # sequential | parallel | overlap (новый режим стартует, пока старый завершается)
+HEARTBEAT_INTERVAL = 1.0          # сек между пульсами в arena/point/<ID>/heartbeat; 0 — без пульса и Last Will
+
+# аптечка: постоянный издатель лечений
+MEDKIT_MAX_PENDING = 64           # лимит очереди неотправленных лечений
+MEDKIT_COALESCE = False           # True — пачка тапов уходит одним "heal:<count>"
+
+# купол / терминал: доставка MQTT-событий в GUI-поток
+MODE_EVENT_POLL_MS = 0            # 0 — будить GUI только при событиях; >0 — старый опрос очереди таймером (мс)
+
+# журнал: запись в фоне, последние записи в памяти (дамп при падении и по MQTT arena/point/<ID>/log/dump)
+LOG_LEVEL = "INFO"
+LOG_RING_SIZE = 2000
+
+# компактные бинарные кадры (hit, состояние купола, бонусы терминала); приём понимает оба формата всегда,
+# флаг включает только отправку — включать, когда все получатели обновлены
+BINARY_PAYLOADS = False
+
+# критичные события (итоги раунда, захват точки, выбор бонуса): журнал на диске до PUBACK,
+# после переподключения и рестарта неподтверждённое отправляется снова — доставка «хотя бы раз»,
+# без OUTBOX_EVENT_IDS повтор неотличим от оригинала, получатель должен применять его идемпотентно
+OUTBOX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox")  # None — только в памяти
+OUTBOX_EVENT_IDS = False          # id в самих событиях (токен -> {"event": ..., "id": ...}) — включать, когда получатели обновлены
+
+# метрики: arena/point/<ID>/metrics (режимы — .../metrics/<режим>) и Prometheus на 127.0.0.1
+METRICS_ENABLED = True
+METRICS_INTERVAL = float(os.environ.get("PONOS_METRICS_INTERVAL", "10"))  # сек между публикациями
+METRICS_HTTP_PORT = 9108          # 0 — без HTTP
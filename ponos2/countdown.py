@@ -0,0 +1,124 @@
+# countdown.py
+"""Whole-second countdown driven by a ``time.monotonic()`` deadline.
+
+Decrementing a counter on every fire of a 1000 ms ``QTimer`` loses time
+under GUI load: a fire that comes more than an interval late is dropped,
+and the round gets a second longer each time. ``Countdown`` keeps the
+deadline instead and sleeps until the next moment the displayed value
+(``ceil`` of the time left) changes, so a late wake-up is absorbed by the
+next one rather than added to the round::
+
+    countdown = Countdown(parent)
+    countdown.changed.connect(on_seconds)    # только когда меняется показываемое число
+    countdown.expired.connect(on_timeout)
+    countdown.start(45)
+    countdown.pause()
+    countdown.resume()
+
+``expired`` is only emitted from the event loop, never from inside
+``pause()``/``stop()``: if the deadline has already passed when the caller
+stops the countdown, ``pause()`` returns True and ``expired`` follows as the
+next event. The caller sets its own "game over" state first and ignores it.
+
+``clock`` can be replaced (tests, replays); it must be monotonic.
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Callable
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal
+
+
+class Countdown(QObject):
+    changed = Signal(int)   # новое показываемое число секунд
+    expired = Signal()
+
+    def __init__(self, parent: QObject | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        super().__init__(parent)
+        self._clock = clock
+        self._deadline: float | None = None  # задан, пока отсчёт идёт
+        self._left = 0.0                       # остаток на паузе / после остановки
+        self._shown = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self._wake)
+
+    @property
+    def remaining(self) -> int:
+        """Seconds to show: the time left rounded up (45.0 .. 44.001 -> 45)."""
+        return self._shown
+
+    @property
+    def active(self) -> bool:
+        return self._deadline is not None
+
+    @property
+    def paused(self) -> bool:
+        return self._deadline is None and self._left > 0
+
+    def time_left(self) -> float:
+        if self._deadline is None:
+            return self._left
+        return max(0.0, self._deadline - self._clock())
+
+    def start(self, seconds: float) -> None:
+        """(Re)start from ``seconds``."""
+        self._deadline = self._clock() + max(0.0, float(seconds))
+        self._wake()
+
+    def pause(self) -> bool:
+        """Pause; True if the time had already run out (``expired`` is then queued, not emitted here)."""
+        if self._deadline is None:
+            return False
+        left = self.time_left()
+        if left <= 0:
+            # срок вышел, а таймер ещё не успел сработать: expired — следующим событием, а не внутри вызова,
+            # чтобы вызывающий успел записать исход (код введён, выбор сделан) раньше обработчика
+            self._deadline = None
+            self._left = 0.0
+            self._timer.start(0)
+            return True
+        self._left = left
+        self._deadline = None
+        self._timer.stop()
+        self._show(math.ceil(left))
+        return False
+
+    def resume(self) -> None:
+        if self._deadline is not None or self._left <= 0:
+            return
+        self._deadline = self._clock() + self._left
+        self._wake()
+
+    def stop(self) -> bool:
+        """Stop where it is; the shown value stays. Same return value as ``pause()``."""
+        return self.pause()
+
+    def reset(self, seconds: float = 0) -> None:
+        """Stop and show ``seconds`` without counting them down."""
+        self._timer.stop()
+        self._deadline = None
+        self._left = max(0.0, float(seconds))
+        self._show(math.ceil(self._left))
+
+    def _show(self, value: int) -> None:
+        if value != self._shown:
+            self._shown = value
+            self.changed.emit(value)
+
+    def _wake(self) -> None:
+        left = self.time_left()
+        shown = math.ceil(left)
+        if shown <= 0:
+            self._deadline = None
+            self._left = 0.0
+            self._timer.stop()
+            self._show(0)
+            self.expired.emit()
+            return
+        self._show(shown)
+        # проснуться сразу после того, как остаток опустится до shown - 1
+        self._timer.start(max(1, math.ceil((left - (shown - 1)) * 1000.0)))
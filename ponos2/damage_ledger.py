@@ -0,0 +1,186 @@
+# damage_ledger.py
+"""Damage bookkeeping for the dome: running leader and an append-only hit log.
+
+``LeaderTracker`` keeps per-team totals and the current leader in O(1) per
+hit. Damage only grows, so the leader can only change to the team that was
+just hit; ties go to the team that scored first, the same rule as
+``max(totals.items(), key=...)`` over an insertion-ordered dict.
+
+``DamageLedger`` stores (timestamp, team, damage) in parallel ``array``
+columns (14 bytes per hit in memory) and optionally mirrors them to a file of
+fixed 28-byte records, so a restarted display can rebuild HP with
+``replay()``. A record with an empty team marks a reset; its damage field is
+the new HP maximum. A record with the team ``HP_MARK`` sets the current HP
+(a correction from the server) without touching the damage totals. If the
+file cannot be written, the ledger carries on in memory only.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import struct
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+log = logging.getLogger(__name__)
+
+RECORD = struct.Struct("<dI16s")  # time.time(), урон (или hp_max для сброса), команда
+HP_MARK = "="  # «команда» записи с текущим HP; попадания с таким токеном купол отбрасывает
+
+
+class LeaderTracker:
+    __slots__ = ("totals", "leader", "_order")
+
+    def __init__(self) -> None:
+        self.totals: Dict[str, int] = {}
+        self.leader = ""
+        self._order: Dict[str, int] = {}
+
+    def add(self, team: str, damage: int) -> str:
+        """Add damage for ``team`` and return the leader after it."""
+        total = self.totals.get(team, 0) + damage
+        if team not in self._order:
+            self._order[team] = len(self._order)
+        self.totals[team] = total
+        leader = self.leader
+        if not leader:
+            self.leader = team
+        elif team != leader:
+            best = self.totals[leader]
+            if total > best or (total == best and self._order[team] < self._order[leader]):
+                self.leader = team
+        return self.leader
+
+    def clear(self) -> None:
+        self.totals.clear()
+        self._order.clear()
+        self.leader = ""
+
+
+class DamageLedger:
+    """Append-only hit log; team names are interned into a small table."""
+
+    def __init__(self, path: str | os.PathLike | None = None) -> None:
+        self.times = array("d")
+        self.teams = array("H")
+        self.damage = array("I")
+        self._names: List[str] = [""]
+        self._index: Dict[str, int] = {"": 0}
+        self._path = os.fspath(path) if path else None
+        self._file = None
+        if self._path:
+            self._load()
+            try:
+                self._file = open(self._path, "ab")
+            except OSError as e:
+                log.warning("⚠️ Журнал урона %s недоступен: %s", self._path, e)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _team_id(self, team: str) -> int:
+        idx = self._index.get(team)
+        if idx is None:
+            idx = self._index[team] = len(self._names)
+            self._names.append(team)
+        return idx
+
+    def _append(self, ts: float, team: str, damage: int) -> None:
+        self.times.append(ts)
+        self.teams.append(self._team_id(team))
+        self.damage.append(damage)
+
+    def append(self, ts: float, team: str, damage: int) -> None:
+        self._append(ts, team, damage)
+        if self._file is not None:
+            try:
+                self._file.write(RECORD.pack(ts, damage, team.encode("utf-8")[:16]))
+            except OSError as e:
+                self._drop_file(e)
+
+    def mark_reset(self, ts: float, hp_max: int) -> None:
+        """Start a new game: drop the history and record the HP it starts from."""
+        self.times = array("d")
+        self.teams = array("H")
+        self.damage = array("I")
+        if self._file is not None:
+            try:
+                self._file.seek(0)
+                self._file.truncate()
+            except OSError as e:
+                self._drop_file(e)
+        self.append(ts, "", hp_max)
+        self.flush()
+
+    def mark_hp(self, ts: float, hp_current: int) -> None:
+        """Record the current HP set from outside (the server), keeping the damage history."""
+        self.append(ts, HP_MARK, hp_current)
+        self.flush()
+
+    def _drop_file(self, error: OSError) -> None:
+        log.warning("⚠️ Журнал урона не записан, дальше только в памяти: %s", error)
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+
+    def flush(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except OSError as e:
+                log.warning("⚠️ Журнал урона не записан: %s", e)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def _load(self) -> None:
+        try:
+            with open(self._path, "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            log.warning("⚠️ Журнал урона %s не прочитан: %s", self._path, e)
+            return
+        usable = len(data) - len(data) % RECORD.size  # хвост от оборванной записи отбрасываем
+        for ts, damage, raw in RECORD.iter_unpack(data[:usable]):
+            self._append(ts, raw.rstrip(b"\0").decode("utf-8", errors="ignore"), damage)
+
+    def records(self) -> Iterator[Tuple[float, str, int]]:
+        names = self._names
+        for ts, team, damage in zip(self.times, self.teams, self.damage):
+            yield ts, names[team], damage
+
+    def replay(self, hp_max: int) -> Tuple[int, int, LeaderTracker]:
+        """Rebuild ``(hp_max, hp_current, leader tracker)`` from the log since the last reset."""
+        tracker = LeaderTracker()
+        hp = hp_max
+        for _, team, damage in self.records():
+            if not team:
+                hp_max = hp = damage
+                tracker.clear()
+            elif team == HP_MARK:
+                hp = min(hp_max, damage)
+            else:
+                hp = max(0, hp - damage)
+                tracker.add(team, damage)
+        return hp_max, hp, tracker
+
+    def breakdown(self) -> Dict[str, dict]:
+        """Per-team hits, damage and first/last hit time for the post-game summary."""
+        result: Dict[str, dict] = {}
+        for ts, team, damage in self.records():
+            if not team or team == HP_MARK:
+                continue
+            row = result.get(team)
+            if row is None:
+                row = result[team] = {"hits": 0, "damage": 0, "first": ts, "last": ts}
+            row["hits"] += 1
+            row["damage"] += damage
+            row["last"] = ts
+        return result
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, List
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal
+
+
+class EventPump(QObject):
+    """Hands events from worker threads (paho callbacks) to the GUI thread.
+
+    ``post()`` is thread-safe. The queued ``wakeup`` signal is emitted only when
+    the buffer goes from empty to non-empty, so a burst of messages costs one
+    GUI wakeup and ``handler`` receives the whole burst as one batch. Nothing
+    runs while no events arrive.
+    """
+
+    wakeup = Signal()
+
+    def __init__(self, handler: Callable[[List[Any]], None], parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self._handler = handler
+        self._items: deque = deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self.wakeup.connect(self.drain, Qt.QueuedConnection)
+
+    def post(self, item: Any) -> None:
+        with self._lock:
+            self._items.append(item)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.wakeup.emit()
+
+    def depth(self) -> int:
+        return len(self._items)
+
+    def drain(self) -> None:
+        with self._lock:
+            batch = list(self._items)
+            self._items.clear()
+            self._scheduled = False
+        if batch:
+            self._handler(batch)
+
+
+def make_event_source(handler: Callable[[List[Any]], None], poll_ms: int = 0):
+    """Return ``(sink, timer, depth)``: ``sink(event)`` is safe to call from any
+    thread, ``handler`` gets the events in batches on the GUI thread and
+    ``depth()`` tells how many are still waiting.
+
+    With ``poll_ms <= 0`` an EventPump wakes the GUI thread only when events
+    arrive and ``timer`` is None. Otherwise events go to a queue drained by
+    ``timer`` every ``poll_ms`` (the old polling behaviour); start it yourself.
+    """
+    if poll_ms <= 0:
+        pump = EventPump(handler)
+        return pump.post, None, pump.depth
+    events: queue.Queue = queue.Queue()
+
+    def drain() -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(events.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            handler(batch)
+
+    timer = QTimer()
+    timer.setInterval(poll_ms)
+    timer.timeout.connect(drain)
+    return events.put_nowait, timer, events.qsize
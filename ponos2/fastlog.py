@@ -0,0 +1,167 @@
+# fastlog.py
+"""Shared non-blocking logging for the supervisor and the modes.
+
+``setup()`` routes the root logger into a queue: the calling thread (GUI,
+paho, supervisor loop) only checks the level and enqueues the record, while a
+background ``QueueListener`` formats it, writes it to stderr and keeps the
+last ``ring_size`` records in memory. ``dump()`` returns that ring (text or
+JSON lines) — on crash it is written next to the other temp files, and the
+supervisor can publish it over MQTT on request.
+
+Use %-style arguments (``log.info("hit %s", team)``): the message is only
+built if the level is enabled, and then in the writer thread.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import threading
+from collections import deque
+from typing import List
+
+FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+_listener: logging.handlers.QueueListener | None = None
+_ring: "RingHandler | None" = None
+_name = "ponos"
+_lock = threading.Lock()
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RingHandler(logging.Handler):
+    """Keeps the most recent records (already formatted) in a bounded deque."""
+
+    def __init__(self, size: int) -> None:
+        super().__init__()
+        self.records: deque = deque(maxlen=max(1, int(size)))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            record.message = record.getMessage()
+            self.records.append(record)
+        except Exception:
+            self.handleError(record)
+
+
+def setup(name: str, level: str | int | None = None, ring_size: int | None = None) -> logging.Logger:
+    """Install the queue-based root handler once per process and return ``logging.getLogger(name)``."""
+    global _listener, _ring, _name
+    with _lock:
+        if _listener is None:
+            try:
+                import config as _cfg
+            except Exception:
+                _cfg = None
+            if level is None:
+                level = getattr(_cfg, "LOG_LEVEL", "INFO")
+            if ring_size is None:
+                ring_size = getattr(_cfg, "LOG_RING_SIZE", 2000)
+            _name = name
+
+            stream = logging.StreamHandler(sys.stderr)
+            stream.setFormatter(logging.Formatter(FORMAT))
+            _ring = RingHandler(ring_size)
+            log_queue: queue.SimpleQueue = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(log_queue, stream, _ring, respect_handler_level=True)
+            _listener.start()
+
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(_DeferredQueueHandler(log_queue))
+            root.setLevel(level if isinstance(level, int) else str(level).upper())
+            atexit.register(shutdown)
+            install_crash_dump()
+    return logging.getLogger(name)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a library module; the process entry point calls ``setup()``."""
+    return logging.getLogger(name)
+
+
+def dump(fmt: str = "text", limit: int | None = None) -> List[str]:
+    """Recent records from the ring buffer, oldest first, as text or JSON lines."""
+    if _ring is None:
+        return []
+    records = list(_ring.records)
+    if limit is not None:
+        records = records[-limit:]
+    if fmt == "json":
+        return [json.dumps({
+            "t": round(r.created, 3),
+            "level": r.levelname,
+            "logger": r.name,
+            "thread": r.threadName,
+            "msg": r.message,
+        }, ensure_ascii=False) for r in records]
+    formatter = logging.Formatter(FORMAT)
+    return [formatter.format(r) for r in records]
+
+
+def dump_to_file(reason: str = "") -> str | None:
+    """Write the ring buffer to ``<tmp>/ponos_<name>_<pid>.log``; returns the path."""
+    path = os.path.join(tempfile.gettempdir(), f"ponos_{_name}_{os.getpid()}.log")
+    try:
+        with open(path, "w", encoding="utf-8") as fh:
+            if reason:
+                fh.write(f"# {reason}\n")
+            fh.write("\n".join(dump()))
+            fh.write("\n")
+    except OSError:
+        return None
+    return path
+
+
+def install_crash_dump() -> None:
+    """Dump the ring buffer when an uncaught exception ends the main thread or kills a worker thread."""
+    prev_hook = sys.excepthook
+    prev_thread_hook = threading.excepthook
+
+    def hook(exc_type, exc, tb):
+        logging.getLogger(_name).critical("Необработанное исключение", exc_info=(exc_type, exc, tb))
+        flush()
+        path = dump_to_file(f"crash: {exc_type.__name__}: {exc}")
+        if path:
+            print(f"💥 Последние записи журнала сохранены в {path}", file=sys.stderr)
+        prev_hook(exc_type, exc, tb)
+
+    def thread_hook(args):
+        logging.getLogger(_name).critical(
+            "Необработанное исключение в потоке %s", getattr(args.thread, "name", "?"),
+            exc_info=(args.exc_type, args.exc_value, args.exc_traceback))
+        prev_thread_hook(args)
+
+    sys.excepthook = hook
+    threading.excepthook = thread_hook
+
+
+def flush() -> None:
+    """Wait until the writer thread has handled everything queued so far."""
+    global _listener
+    with _lock:
+        listener = _listener
+        if listener is None:
+            return
+        listener.stop()
+        listener.start()
+
+
+def shutdown() -> None:
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
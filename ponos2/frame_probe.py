@@ -0,0 +1,48 @@
+"""First-frame probe used by the mode-switch benchmark.
+
+Modes call ``report_first_frame(engine)`` right after loading their QML. When
+``PONOS_FRAME_PROBE`` points to a file, the first ``frameSwapped`` of the root
+window appends ``"<pid> <time.monotonic()>"`` to it; otherwise nothing happens.
+"""
+import os
+import time
+
+PROBE_ENV = "PONOS_FRAME_PROBE"
+
+
+def _write_mark(path: str) -> None:
+    line = f"{os.getpid()} {time.monotonic():.6f}\n"
+    try:
+        with open(path, "a", encoding="ascii") as fh:
+            fh.write(line)
+    except OSError:
+        pass
+
+
+def report_first_window_frame(window) -> None:
+    path = os.environ.get(PROBE_ENV)
+    if not path or window is None:
+        return
+
+    state = {"done": False}
+
+    def on_frame():
+        if state["done"]:
+            return
+        state["done"] = True
+        _write_mark(path)
+
+    if hasattr(window, "frameSwapped"):
+        window.frameSwapped.connect(on_frame)
+    else:
+        # окно из Loader приходит как QWindow — подключаемся к сигналу по имени
+        from PySide6.QtCore import QObject, SIGNAL
+        QObject.connect(window, SIGNAL("frameSwapped()"), on_frame)
+
+
+def report_first_frame(engine) -> None:
+    if not os.environ.get(PROBE_ENV):
+        return
+    roots = engine.rootObjects()
+    if roots:
+        report_first_window_frame(roots[0])
@@ -0,0 +1,82 @@
+# heartbeat.py
+"""Supervisor heartbeat: a tiny JSON message per second on ``arena/point/{ID}/heartbeat``.
+
+Beats are QoS 0 and not retained. The retained value of the topic is the
+point's status: ``{"s":"on"}`` on every connect, ``{"s":"off"}`` on a clean
+exit and as the Last Will, so the broker marks a dead point by itself.
+
+Beat format (short keys, ~100 bytes)::
+
+    {"s":"on","m":"dome","pid":1234,"up":3600,"mup":42,
+     "cpu":37.5,"rss":81234,"lag":0.8,"load":1.2}
+
+``cpu`` (% of one core) and ``rss`` (KiB) belong to the active mode's
+process; ``lag`` is how late the supervisor loop woke up for this beat, ms.
+Fields that cannot be read (no /proc, no mode running) are left out.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+
+ONLINE = json.dumps({"s": "on"}, separators=(",", ":"))
+OFFLINE = json.dumps({"s": "off"}, separators=(",", ":"))
+
+try:
+    _TICKS = os.sysconf("SC_CLK_TCK")
+    _PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+except (AttributeError, ValueError, OSError):
+    _TICKS = _PAGE_KB = 0
+
+
+def read_proc(pid: int) -> tuple[float, int] | None:
+    """(CPU seconds used, RSS in KiB) of ``pid`` from /proc, or None."""
+    if not _TICKS:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as fh:
+            stat = fh.read()
+        with open(f"/proc/{pid}/statm", "rb") as fh:
+            statm = fh.read().split()
+    except OSError:
+        return None
+    # имя процесса в скобках может содержать пробелы — считаем поля после ')'
+    fields = stat[stat.rfind(b")") + 2:].split()
+    cpu = (int(fields[11]) + int(fields[12])) / _TICKS  # utime + stime
+    return cpu, int(statm[1]) * _PAGE_KB
+
+
+class Heartbeat:
+    """Builds beats; CPU % is the delta since the previous beat for the same pid."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self._last: tuple[int, float, float] | None = None  # pid, cpu, monotonic
+
+    def beat(self, mode: str | None, pid: int | None, mode_started: float | None, lag_ms: float) -> str:
+        now = time.monotonic()
+        data: dict = {"s": "on"}
+        if mode:
+            data["m"] = mode
+        if pid:
+            data["pid"] = pid
+        data["up"] = int(now - self.started)
+        if mode_started is not None:
+            data["mup"] = int(now - mode_started)
+        usage = read_proc(pid) if pid else None
+        if usage is not None:
+            cpu, rss = usage
+            last = self._last
+            if last is not None and last[0] == pid and now > last[2]:
+                data["cpu"] = round(100.0 * (cpu - last[1]) / (now - last[2]), 1)
+            data["rss"] = rss
+            self._last = (pid, cpu, now)
+        else:
+            self._last = None
+        data["lag"] = round(max(0.0, lag_ms), 1)
+        try:
+            data["load"] = round(os.getloadavg()[0], 2)
+        except (AttributeError, OSError):
+            pass
+        return json.dumps(data, separators=(",", ":"))
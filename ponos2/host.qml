@@ -0,0 +1,25 @@
+import QtQuick 2.15
+
+// Корневой объект хоста режимов: окно режима (Window из его QML)
+// подгружается через Loader и заменяется при переключении.
+Item {
+    id: host
+    objectName: "modeHost"
+
+    // transientParent: null — окно режима показывается сразу как самостоятельное,
+    // а не ждёт видимости родительского окна (у хоста его нет)
+    function loadMode(url) {
+        modeLoader.setSource(url, { "transientParent": null })
+        return modeLoader.item
+    }
+
+    function unloadMode() {
+        modeLoader.source = ""
+    }
+
+    Loader {
+        id: modeLoader
+        objectName: "modeLoader"
+        asynchronous: false
+    }
+}
@@ -0,0 +1,351 @@
+# metrics.py
+"""Counters, gauges and latency histograms for the supervisor and the modes.
+
+Every process (or hosted mode) owns a ``Registry``. ``MetricsPublisher``
+sends a compact JSON snapshot of it to MQTT every few seconds; the
+supervisor additionally serves Prometheus text on ``127.0.0.1:<port>/metrics``
+including the latest snapshot of each mode.
+
+Snapshot format (short keys, one message per interval)::
+
+    {"t": 1700000000, "c": {"mqtt_messages_total{topic=...}": 12},
+     "g": {"cmd_queue_depth": 0},
+     "h": {"hit_latency_ms": [count, sum, p50, p95, p99]}}
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Tuple
+
+log = logging.getLogger(__name__)
+
+# границы корзин гистограмм, мс
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+def percentile(values: Iterable[float], pct: float) -> float:
+    """Nearest-rank percentile of raw samples; 0.0 for an empty sample."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100.0) - 1))]
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value", "_fn")
+
+    def __init__(self, fn: Callable[[], float] | None = None) -> None:
+        self.value = 0.0
+        self._fn = fn
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def get(self) -> float:
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return 0.0
+        return self.value
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum", "_lock")
+
+    def __init__(self, bounds: Iterable[float] = DEFAULT_BUCKETS_MS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # последняя — +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the last finite bound for +Inf)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return float(self.bounds[min(i, len(self.bounds) - 1)])
+        return float(self.bounds[-1])
+
+
+class Registry:
+    """Named metrics with optional labels; lookups are cached so hot paths keep the object."""
+
+    def __init__(self) -> None:
+        self._counters: Dict[str, Tuple[str, Counter]] = {}
+        self._gauges: Dict[str, Tuple[str, Gauge]] = {}
+        self._histograms: Dict[str, Tuple[str, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str = "", **labels: str) -> Counter:
+        return self._get(self._counters, Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", fn: Callable[[], float] | None = None, **labels: str) -> Gauge:
+        return self._get(self._gauges, lambda: Gauge(fn), name, help, labels)
+
+    def histogram(self, name: str, help: str = "", buckets: Iterable[float] = DEFAULT_BUCKETS_MS,
+                  **labels: str) -> Histogram:
+        return self._get(self._histograms, lambda: Histogram(buckets), name, help, labels)
+
+    def _get(self, table, factory, name, help, labels):
+        key = _key(name, labels)
+        item = table.get(key)
+        if item is not None:
+            return item[1]
+        with self._lock:
+            item = table.get(key)
+            if item is None:
+                item = table[key] = (name, factory())
+                if help:
+                    self._help.setdefault(name, help)
+        return item[1]
+
+    def snapshot(self) -> dict:
+        return {
+            "t": int(time.time()),
+            "c": {k: v.value for k, (_, v) in list(self._counters.items())},
+            "g": {k: v.get() for k, (_, v) in list(self._gauges.items())},
+            "h": {k: [h.count, round(h.sum, 3), h.quantile(0.5), h.quantile(0.95), h.quantile(0.99)]
+                  for k, (_, h) in list(self._histograms.items())},
+        }
+
+    def render_prometheus(self, extra_labels: Dict[str, str] | None = None) -> List[str]:
+        lines: List[str] = []
+        typed = set()
+
+        def head(name: str, kind: str) -> None:
+            if name in typed:
+                return
+            typed.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def with_labels(key: str, extra: Dict[str, str]) -> str:
+            if not extra:
+                return key
+            add = ",".join(f'{k}="{v}"' for k, v in sorted(extra.items()))
+            if key.endswith("}"):
+                return key[:-1] + "," + add + "}"
+            return key + "{" + add + "}"
+
+        extra = extra_labels or {}
+        for key, (name, c) in sorted(self._counters.items()):
+            head(name, "counter")
+            lines.append(f"{with_labels(key, extra)} {c.value:g}")
+        for key, (name, g) in sorted(self._gauges.items()):
+            head(name, "gauge")
+            lines.append(f"{with_labels(key, extra)} {g.get():g}")
+        for key, (name, h) in sorted(self._histograms.items()):
+            head(name, "histogram")
+            base = key[len(name):]
+            labels = dict(extra)
+            if base:
+                for part in base[1:-1].split(","):
+                    k, _, v = part.partition("=")
+                    labels[k] = v.strip('"')
+            with h._lock:
+                counts, total, acc = list(h.counts), h.count, h.sum
+            running = 0
+            for bound, n in zip(list(h.bounds) + ["+Inf"], counts):
+                running += n
+                lines.append(f"{name}_bucket{_labels_text({**labels, 'le': str(bound)})} {running}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {acc:g}")
+            lines.append(f"{name}_count{_labels_text(labels)} {total}")
+        return lines
+
+
+def _labels_text(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def snapshot_to_prometheus(snapshot: dict, labels: Dict[str, str]) -> List[str]:
+    """Render a compact snapshot received over MQTT (no bucket data: histograms become summaries)."""
+    lines: List[str] = []
+
+    def split(key: str) -> Tuple[str, Dict[str, str]]:
+        name, _, rest = key.partition("{")
+        merged = dict(labels)
+        if rest:
+            for part in rest[:-1].split(","):
+                k, _, v = part.partition("=")
+                merged[k] = v.strip('"')
+        return name, merged
+
+    for key, value in (snapshot.get("c") or {}).items():
+        name, lb = split(key)
+        lines.append(f"{name}{_labels_text(lb)} {float(value):g}")
+    for key, value in (snapshot.get("g") or {}).items():
+        name, lb = split(key)
+        lines.append(f"{name}{_labels_text(lb)} {float(value):g}")
+    for key, value in (snapshot.get("h") or {}).items():
+        name, lb = split(key)
+        try:
+            count, total, p50, p95, p99 = value
+        except (TypeError, ValueError):
+            continue
+        for q, v in (("0.5", p50), ("0.95", p95), ("0.99", p99)):
+            lines.append(f"{name}{_labels_text({**lb, 'quantile': q})} {float(v):g}")
+        lines.append(f"{name}_sum{_labels_text(lb)} {float(total):g}")
+        lines.append(f"{name}_count{_labels_text(lb)} {int(count)}")
+    return lines
+
+
+class MetricsPublisher:
+    """Publishes ``registry.snapshot()`` to ``topic`` every ``interval`` seconds from a daemon thread.
+
+    Without ``client`` it opens its own via ``make_client()`` (the supervisor's bus when available).
+    """
+
+    def __init__(self, registry: Registry, topic: str, interval: float = 10.0, client=None) -> None:
+        self._registry = registry
+        self._topic = topic
+        self._interval = max(1.0, float(interval))
+        self._own_client = client is None
+        self._client = client
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "MetricsPublisher":
+        if self._client is None:
+            from config import BROKER, PORT
+            from mqtt_bus import make_client
+
+            self._client = make_client()
+            try:
+                self._client.connect(BROKER, PORT, 60)
+            except Exception as e:
+                log.warning("⚠️ Метрики: подключение не удалось: %s", e)
+            self._client.loop_start()
+        self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+        self._thread.start()
+        return self
+
+    def publish_now(self) -> None:
+        body = json.dumps(self._registry.snapshot(), separators=(",", ":"), ensure_ascii=False)
+        try:
+            self._client.publish(self._topic, body, qos=0)
+        except Exception as e:
+            log.warning("⚠️ Метрики: публикация в %s не удалась: %s", self._topic, e)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.publish_now()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        if self._own_client and self._client is not None:
+            try:
+                self._client.loop_stop()
+                self._client.disconnect()
+            except Exception:
+                pass
+
+
+class PrometheusServer:
+    """``GET /metrics`` on a local port: the registry plus the latest snapshot of each mode."""
+
+    def __init__(self, registry: Registry, port: int, host: str = "127.0.0.1") -> None:
+        self._registry = registry
+        self._modes: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802 - имя задаёт http.server
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = server.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+
+    def start(self) -> "PrometheusServer":
+        threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+        log.info("📈 Метрики Prometheus: http://127.0.0.1:%s/metrics", self.port)
+        return self
+
+    def update_mode(self, mode: str, snapshot: dict) -> None:
+        with self._lock:
+            self._modes[mode] = snapshot
+
+    def render(self) -> str:
+        lines = self._registry.render_prometheus({"process": "supervisor"})
+        with self._lock:
+            modes = dict(self._modes)
+        for mode, snapshot in sorted(modes.items()):
+            lines.extend(snapshot_to_prometheus(snapshot, {"process": mode}))
+        return "\n".join(lines) + "\n"
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def mode_metrics(mode: str) -> Tuple[Registry, MetricsPublisher | None]:
+    """Registry for one mode and a started publisher to ``arena/point/{ID}/metrics/{mode}``.
+
+    The publisher is None when ``METRICS_ENABLED`` is off; the registry is usable either way.
+    """
+    import config as _cfg
+
+    registry = Registry()
+    if not getattr(_cfg, "METRICS_ENABLED", True):
+        return registry, None
+    topic = f"arena/point/{_cfg.ID}/metrics/{mode}"
+    publisher = MetricsPublisher(registry, topic, getattr(_cfg, "METRICS_INTERVAL", 10.0)).start()
+    return registry, publisher
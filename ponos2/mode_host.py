@@ -0,0 +1,245 @@
+# mode_host.py
+"""Long-lived Qt host for modes that opt in with ``"inprocess": true``.
+
+The supervisor starts this script once and sends it commands over stdin:
+
+    load <mode_id>   — stop the current mode and show ``mode_id`` through the Loader
+    unload           — stop the current mode and leave the screen to another process
+    quit             — exit the host
+
+and answers each ``load`` on stdout with ``loaded <mode_id>`` or ``failed
+<mode_id>``, so the supervisor can start a mode that did not load as a
+separate process. The registry is re-read on every ``load`` and a mode's
+module is imported again when its entry file changes, so modes added or
+edited while the host runs are picked up like in the supervisor.
+
+A mode plugs in by exposing ``create_hosted_mode(argv) -> HostedMode`` in its
+entry module; the same factory drives standalone runs via ``run_standalone``.
+"""
+from __future__ import annotations
+
+import importlib.util
+import logging
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict, List, TextIO, Tuple
+
+from PySide6.QtCore import QObject, Qt, QUrl, Signal
+from PySide6.QtQml import QQmlApplicationEngine
+from PySide6.QtWidgets import QApplication
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import fastlog  # noqa: E402
+from frame_probe import report_first_frame, report_first_window_frame  # noqa: E402
+
+log = logging.getLogger("host")
+
+HOST_QML = PROJECT_ROOT / "host.qml"
+FACTORY_NAME = "create_hosted_mode"
+
+
+@dataclass(slots=True)
+class HostedMode:
+    """What a mode plugin hands over to the host: its QML and backend objects."""
+
+    qml_file: Path
+    context: Dict[str, Any] = field(default_factory=dict)
+    on_loaded: Callable[[Any], None] | None = None
+    on_stop: Callable[[], None] | None = None
+
+    def loaded(self, root) -> None:
+        if self.on_loaded is not None:
+            self.on_loaded(root)
+
+    def stop(self) -> None:
+        if self.on_stop is not None:
+            self.on_stop()
+
+
+def run_standalone(factory: Callable[[List[str]], HostedMode], argv: List[str] | None = None) -> int:
+    """Run a mode in its own process (the classic ``python <entry>`` path)."""
+    app = QApplication(sys.argv)
+    mode = factory(list(sys.argv[1:] if argv is None else argv))
+    engine = QQmlApplicationEngine()
+    context = engine.rootContext()
+    for name, value in mode.context.items():
+        context.setContextProperty(name, value)
+    engine.load(QUrl.fromLocalFile(str(mode.qml_file)))
+    if not engine.rootObjects():
+        log.warning("Ошибка загрузки QML %s", mode.qml_file)
+        mode.stop()
+        return -1
+    mode.loaded(engine.rootObjects()[0])
+    report_first_frame(engine)
+    try:
+        return app.exec()
+    finally:
+        mode.stop()
+
+
+class ModeHost(QObject):
+    commandReceived = Signal(str)
+
+    def __init__(self, engine: QQmlApplicationEngine, registry, status: TextIO | None = None) -> None:
+        super().__init__()
+        self._engine = engine
+        self._registry = registry
+        self._status = status  # канал ответов супервизору (stdout хоста)
+        self._modules: Dict[str, Tuple[ModuleType, Path, int]] = {}  # mode_id -> (модуль, entry, mtime_ns)
+        self._current: HostedMode | None = None
+        self._current_id = ""
+        self._context_names: List[str] = []
+        self._root = engine.rootObjects()[0]
+        self.commandReceived.connect(self._on_command, Qt.QueuedConnection)
+
+    def start_reader(self) -> None:
+        def read_commands():
+            for line in sys.stdin:
+                line = line.strip()
+                if line:
+                    self.commandReceived.emit(line)
+            # супервизор закрыл канал — завершаемся
+            self.commandReceived.emit("quit")
+
+        threading.Thread(target=read_commands, name="host-commands", daemon=True).start()
+
+    def _import_mode(self, mode_id: str) -> ModuleType | None:
+        mode = self._registry.get(mode_id)
+        if mode is None:
+            log.warning("⚠️ [HOST] режим '%s' не найден", mode_id)
+            return None
+        try:
+            mtime = mode.entry.stat().st_mtime_ns
+        except OSError:
+            mtime = 0
+        name = f"ponos_mode_{mode_id}"
+        cached = self._modules.get(mode_id)
+        if cached is not None:
+            if cached[1] == mode.entry and cached[2] == mtime:
+                return cached[0]
+            # entry изменился — старый модуль выбрасываем, иначе хост так и крутил бы прежний код
+            del self._modules[mode_id]
+            sys.modules.pop(name, None)
+            log.info("[HOST] %s изменился, модуль режима %s загружается заново", mode.entry, mode_id)
+        spec = importlib.util.spec_from_file_location(name, mode.entry)
+        if spec is None or spec.loader is None:
+            log.warning("⚠️ [HOST] не удалось загрузить модуль %s", mode.entry)
+            return None
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except (Exception, SystemExit) as exc:
+            sys.modules.pop(name, None)
+            log.warning("⚠️ [HOST] ошибка импорта %s: %s", mode.entry, exc)
+            return None
+        if not callable(getattr(module, FACTORY_NAME, None)):
+            log.warning("⚠️ [HOST] в %s нет %s()", mode.entry, FACTORY_NAME)
+            return None
+        self._modules[mode_id] = (module, mode.entry, mtime)
+        return module
+
+    def unload(self) -> None:
+        if self._current is None:
+            return
+        current, self._current = self._current, None
+        self._root.unloadMode()
+        try:
+            current.stop()
+        except Exception as exc:
+            log.warning("⚠️ [HOST] ошибка остановки режима %s: %s", self._current_id, exc)
+        context = self._engine.rootContext()
+        for name in self._context_names:
+            context.setContextProperty(name, None)
+        self._context_names = []
+        log.info("[HOST] режим %s выгружен", self._current_id)
+        self._current_id = ""
+
+    def load(self, mode_id: str) -> bool:
+        loaded = self._load(mode_id)
+        self._report("loaded" if loaded else "failed", mode_id)
+        return loaded
+
+    def _report(self, status: str, mode_id: str) -> None:
+        if self._status is None:
+            return
+        try:
+            self._status.write(f"{status} {mode_id}\n")
+            self._status.flush()
+        except (OSError, ValueError) as exc:
+            log.warning("⚠️ [HOST] супервизор не получил ответ '%s %s': %s", status, mode_id, exc)
+
+    def _load(self, mode_id: str) -> bool:
+        started = time.monotonic()
+        self.unload()
+        self._registry.reload()  # stat-only; режимы, найденные супервизором после старта хоста
+        module = self._import_mode(mode_id)
+        mode_cfg = self._registry.get(mode_id)
+        if module is None or mode_cfg is None:
+            return False
+        try:
+            hosted: HostedMode = getattr(module, FACTORY_NAME)(list(mode_cfg.args))
+        except (Exception, SystemExit) as exc:  # argparse в фабрике завершает процесс — а он общий
+            log.warning("⚠️ [HOST] не удалось создать режим %s: %r", mode_id, exc)
+            return False
+
+        context = self._engine.rootContext()
+        for name, value in hosted.context.items():
+            context.setContextProperty(name, value)
+        self._context_names = list(hosted.context)
+        self._current = hosted
+        self._current_id = mode_id
+
+        item = self._root.loadMode(QUrl.fromLocalFile(str(hosted.qml_file)))
+        if item is None:
+            log.warning("⚠️ [HOST] не удалось загрузить QML %s", hosted.qml_file)
+            self.unload()
+            return False
+        hosted.loaded(item)
+        report_first_window_frame(item)
+        log.info("[HOST] режим %s загружен за %.0f мс", mode_id, (time.monotonic() - started) * 1000)
+        return True
+
+    def _on_command(self, line: str) -> None:
+        cmd, _, arg = line.partition(" ")
+        if cmd == "load" and arg:
+            self.load(arg.strip())
+        elif cmd == "unload":
+            self.unload()
+        elif cmd == "quit":
+            self.unload()
+            QApplication.quit()
+        else:
+            log.warning("⚠️ [HOST] неизвестная команда: %s", line)
+
+
+def main() -> int:
+    fastlog.setup("host")
+    from mode_registry import ModeRegistry
+
+    # stdout — только для ответов супервизору; случайный print() режима уходит в stderr
+    status, sys.stdout = sys.stdout, sys.stderr
+    app = QApplication(sys.argv)
+    engine = QQmlApplicationEngine()
+    engine.load(QUrl.fromLocalFile(str(HOST_QML)))
+    if not engine.rootObjects():
+        log.warning("⚠️ [HOST] не удалось загрузить %s", HOST_QML)
+        return -1
+    host = ModeHost(engine, ModeRegistry(), status)
+    host.start_reader()
+    log.info("[HOST] хост режимов готов")
+    try:
+        return app.exec()
+    finally:
+        host.unload()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# mode_launcher.py
+"""Warm interpreter used by the supervisor's mode pool.
+
+The process imports PySide6 and paho up front and then blocks on stdin until
+the supervisor sends a single JSON line describing which mode to run:
+
+    {"entry": "/abs/path/mode.py", "workdir": "/abs/path", "args": [...]}
+
+After that it behaves exactly like ``python <entry> <args>`` started in
+``workdir``, so signals and exit codes stay the same for the supervisor.
+"""
+import json
+import os
+import runpy
+import sys
+
+# прогреваем тяжёлые импорты до получения команды
+import paho.mqtt.client  # noqa: F401
+from PySide6 import QtCore, QtGui, QtQml, QtQuick, QtWidgets  # noqa: F401
+
+
+def _detach_stdin() -> None:
+    try:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+    except OSError:
+        pass
+
+
+def main() -> int:
+    try:
+        line = sys.stdin.readline()
+    except KeyboardInterrupt:
+        return 0
+    if not line.strip():
+        # супервизор закрыл канал — пул сворачивается
+        return 0
+
+    spec = json.loads(line)
+    entry = str(spec["entry"])
+    workdir = str(spec.get("workdir") or os.path.dirname(entry))
+    args = [str(a) for a in spec.get("args") or []]
+
+    _detach_stdin()
+    os.chdir(workdir)
+    sys.argv = [entry] + args
+    sys.path[0] = os.path.dirname(entry)
+    runpy.run_path(entry, run_name="__main__")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
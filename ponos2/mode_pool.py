@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import logging
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from mode_registry import ModeConfig
+
+log = logging.getLogger(__name__)
+
+
+class ModePool:
+    """Keeps interpreters with PySide6/paho already imported, ready to become a mode.
+
+    ``acquire()`` hands a warm process the mode's entry and returns it as a
+    regular ``Popen``; the caller owns it from then on. Refilling is deferred by
+    ``refill_delay`` seconds so that warming a replacement does not compete for
+    CPU with the mode that has just been started.
+    """
+
+    def __init__(self, size: int = 1, refill_delay: float = 3.0, launcher: Path | None = None) -> None:
+        self._size = max(0, int(size))
+        self._refill_delay = max(0.0, float(refill_delay))
+        self._launcher = Path(launcher) if launcher else Path(__file__).resolve().parent / "mode_launcher.py"
+        self._idle: List[subprocess.Popen] = []
+        self._refill_at: float | None = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0 and self._launcher.exists()
+
+    def _spawn(self) -> subprocess.Popen | None:
+        try:
+            proc = subprocess.Popen(
+                [sys.executable, str(self._launcher)],
+                stdin=subprocess.PIPE,
+                cwd=str(self._launcher.parent),
+            )
+        except Exception as e:
+            log.warning("⚠️ Не удалось запустить прогретый процесс: %s", e)
+            return None
+        log.info("♨️ Прогретый процесс готовится (pid=%s).", proc.pid)
+        return proc
+
+    def _prune(self) -> None:
+        alive = []
+        for proc in self._idle:
+            if proc.poll() is None:
+                alive.append(proc)
+            else:
+                log.info("ℹ️ Прогретый процесс pid=%s завершился с кодом %s.", proc.pid, proc.returncode)
+        self._idle = alive
+
+    def refill_in(self) -> float | None:
+        """Seconds until ``maintain()`` has work to do; ``None`` if no refill is pending."""
+        if not self.enabled or self._refill_at is None:
+            return None
+        return max(0.0, self._refill_at - time.monotonic())
+
+    def maintain(self) -> None:
+        """Top the pool up to ``size`` once the refill delay has passed."""
+        if not self.enabled or self._refill_at is None:
+            return
+        if time.monotonic() < self._refill_at:
+            return
+        self._prune()
+        while len(self._idle) < self._size:
+            proc = self._spawn()
+            if proc is None:
+                break
+            self._idle.append(proc)
+        self._refill_at = None
+
+    def acquire(self, mode: ModeConfig) -> subprocess.Popen | None:
+        """Turn a warm process into ``mode``; ``None`` means the caller should Popen."""
+        if not self.enabled:
+            return None
+        self._prune()
+        spec = json.dumps({
+            "entry": str(mode.entry),
+            "workdir": str(mode.workdir),
+            "args": list(mode.args),
+        }, ensure_ascii=False)
+        while self._idle:
+            proc = self._idle.pop(0)
+            try:
+                proc.stdin.write((spec + "\n").encode("utf-8"))
+                proc.stdin.close()
+            except Exception as e:
+                log.warning("⚠️ Прогретый процесс pid=%s не принял команду: %s", proc.pid, e)
+                self._discard(proc)
+                continue
+            self._refill_at = time.monotonic() + self._refill_delay
+            return proc
+        self._refill_at = time.monotonic() + self._refill_delay
+        return None
+
+    def _discard(self, proc: subprocess.Popen) -> None:
+        try:
+            proc.kill()
+            proc.wait(timeout=1)
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """Stop all idle warm processes (closing stdin lets them exit on their own)."""
+        idle, self._idle = self._idle, []
+        self._refill_at = None
+        for proc in idle:
+            try:
+                proc.stdin.close()
+            except Exception:
+                pass
+        for proc in idle:
+            try:
+                proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self._discard(proc)
@@ -2,8 +2,16 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from pathlib import Path
+import ctypes
+import ctypes.util
 import json
-from typing import Dict, Iterable, List
+import logging
+import os
+import struct
+import sys
+from typing import Dict, Iterable, List, Set, Tuple
+
+log = logging.getLogger(__name__)
 
 
 @dataclass(slots=True)
@@ -16,56 +24,292 @@ class ModeConfig:
     workdir: Path
     description: str = ""
     args: List[str] = field(default_factory=list)
+    prewarm: bool = True
+    inprocess: bool = False
+
+
+INDEX_VERSION = 1
+INDEX_NAME = ".registry_cache.json"
+
+
+def _stat_key(manifest: Path) -> List[int] | None:
+    """(mtime_ns, size) of the manifest plus mtime_ns of its directory (entry files added/removed)."""
+    try:
+        st = manifest.stat()
+        dir_st = manifest.parent.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size, dir_st.st_mtime_ns]
+
+
+def _mode_to_json(mode: ModeConfig) -> dict:
+    return {
+        "id": mode.id,
+        "name": mode.name,
+        "entry": str(mode.entry),
+        "workdir": str(mode.workdir),
+        "description": mode.description,
+        "args": list(mode.args),
+        "prewarm": mode.prewarm,
+        "inprocess": mode.inprocess,
+    }
+
+
+def _mode_from_json(data: dict) -> ModeConfig:
+    return ModeConfig(
+        id=data["id"],
+        name=data["name"],
+        entry=Path(data["entry"]),
+        workdir=Path(data["workdir"]),
+        description=data.get("description", ""),
+        args=list(data.get("args") or []),
+        prewarm=bool(data.get("prewarm", True)),
+        inprocess=bool(data.get("inprocess", False)),
+    )
+
+
+def parse_manifest(manifest: Path) -> ModeConfig | None:
+    """Parse and validate one manifest.json; prints the reason and returns None if it is unusable."""
+    try:
+        data = json.loads(manifest.read_text(encoding="utf-8"))
+    except Exception as exc:
+        log.warning("⚠️ Не удалось прочитать %s: %s", manifest, exc)
+        return None
+
+    mode_id = str(data.get("id") or "").strip()
+    entry = str(data.get("entry") or "").strip()
+    if not mode_id or not entry:
+        log.warning("⚠️ Пропускаю %s: не хватает id или entry", manifest)
+        return None
+
+    workdir = manifest.parent
+    entry_path = (workdir / entry).resolve()
+    if not entry_path.exists():
+        log.warning("⚠️ Пропускаю %s: файл %s не найден", manifest, entry_path)
+        return None
+
+    args = data.get("args") or []
+    if not isinstance(args, list):
+        log.warning("⚠️ Пропускаю %s: поле args должно быть списком", manifest)
+        return None
+
+    prewarm = data.get("prewarm", True)
+    inprocess = data.get("inprocess", False)
+    if not isinstance(prewarm, bool) or not isinstance(inprocess, bool):
+        log.warning("⚠️ Пропускаю %s: поля prewarm/inprocess должны быть true/false", manifest)
+        return None
+
+    description = str(data.get("description") or "").strip()
+    return ModeConfig(
+        id=mode_id,
+        name=str(data.get("name") or mode_id),
+        entry=entry_path,
+        workdir=workdir,
+        description=description,
+        args=[str(a) for a in args],
+        prewarm=prewarm,
+        inprocess=inprocess,
+    )
+
+
+class _Inotify:
+    """Minimal inotify(7) binding via ctypes: a non-blocking fd plus directory watches."""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, Path] = {}
+
+    def add(self, path: Path) -> None:
+        if path in self._dirs.values():
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), self.MASK)
+        if wd >= 0:
+            self._dirs[wd] = path
+
+    def read(self) -> Set[Path]:
+        """Drain pending events; returns the directories that changed (and ``name`` children)."""
+        changed: Set[Path] = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            if not buf:
+                return changed
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = self._EVENT.unpack_from(buf, offset)
+                offset += self._EVENT.size
+                name = buf[offset:offset + length].rstrip(b"\0").decode(errors="ignore")
+                offset += length
+                directory = self._dirs.get(wd)
+                if directory is None:
+                    continue
+                if mask & self.IN_DELETE_SELF:
+                    self._dirs.pop(wd, None)
+                changed.add(directory / name if name else directory)
+
+    def close(self) -> None:
+        os.close(self.fd)
 
 
 class ModeRegistry:
-    """Scans the modes directory and exposes metadata for each mode."""
+    """Scans the modes directory and exposes metadata for each mode.
+
+    Parsed manifests are cached by (mtime_ns, size, directory mtime_ns), so
+    ``reload()`` only re-parses manifests that changed; the index is saved to
+    ``modes/.registry_cache.json`` and reused on the next start. ``watch()``
+    returns an inotify fd for the caller's event loop; ``on_watch_ready()``
+    then picks up new, edited and removed modes.
+    """
 
-    def __init__(self, modes_root: Path | None = None) -> None:
+    def __init__(self, modes_root: Path | None = None, use_index: bool = True) -> None:
         project_root = Path(__file__).resolve().parent
         self._modes_dir = Path(modes_root) if modes_root else project_root / "modes"
+        self._index_path = self._modes_dir / INDEX_NAME if use_index else None
         self._modes: Dict[str, ModeConfig] = {}
+        # manifest path -> (stat key, ModeConfig или None для негодного manifest)
+        self._entries: Dict[str, Tuple[List[int], ModeConfig | None]] = {}
+        self._inotify: _Inotify | None = None
+        self._load_index()
         self.reload()
 
-    def reload(self) -> None:
-        """Re-read all manifest.json files."""
-        self._modes.clear()
-        if not self._modes_dir.exists():
+    def _load_index(self) -> None:
+        if self._index_path is None:
+            return
+        try:
+            data = json.loads(self._index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
             return
+        if data.get("version") != INDEX_VERSION or data.get("modes_dir") != str(self._modes_dir):
+            return
+        try:
+            for path, item in (data.get("entries") or {}).items():
+                mode = _mode_from_json(item["mode"]) if item.get("mode") else None
+                self._entries[path] = (list(item["key"]), mode)
+        except (KeyError, TypeError, ValueError):
+            self._entries.clear()
 
-        for manifest in sorted(self._modes_dir.glob("*/manifest.json")):
-            try:
-                data = json.loads(manifest.read_text(encoding="utf-8"))
-            except Exception as exc:
-                print(f"⚠️ Не удалось прочитать {manifest}: {exc}")
-                continue
+    def _save_index(self) -> None:
+        if self._index_path is None:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "modes_dir": str(self._modes_dir),
+            "entries": {
+                path: {"key": key, "mode": _mode_to_json(mode) if mode else None}
+                for path, (key, mode) in self._entries.items()
+            },
+        }
+        tmp = self._index_path.with_name(self._index_path.name + ".tmp")
+        try:
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self._index_path)
+        except OSError:
+            pass  # каталог только для чтения — просто без кэша
 
-            mode_id = str(data.get("id") or "").strip()
-            entry = str(data.get("entry") or "").strip()
-            if not mode_id or not entry:
-                print(f"⚠️ Пропускаю {manifest}: не хватает id или entry")
-                continue
+    def reload(self, force: bool = False) -> None:
+        """Re-read manifest.json files that changed since the last scan (all of them with ``force``)."""
+        if force:
+            self._entries.clear()
+        manifests = sorted(self._modes_dir.glob("*/manifest.json")) if self._modes_dir.exists() else []
+        if self._update({str(m) for m in manifests}, prune=True):
+            self._save_index()
 
-            workdir = manifest.parent
-            entry_path = (workdir / entry).resolve()
-            if not entry_path.exists():
-                print(f"⚠️ Пропускаю {manifest}: файл {entry_path} не найден")
+    def refresh(self, manifests: Iterable[Path]) -> None:
+        """Re-check only the given manifest paths (added, edited or removed)."""
+        if self._update({str(m) for m in manifests}, prune=False):
+            self._save_index()
+
+    def _update(self, paths: Set[str], prune: bool) -> bool:
+        changed = False
+        entries = dict(self._entries)
+        if prune:
+            for path in set(entries) - paths:
+                entries.pop(path)
+                changed = True
+        for path in sorted(paths):
+            key = _stat_key(Path(path))
+            if key is None:
+                changed |= entries.pop(path, None) is not None
+                continue
+            cached = entries.get(path)
+            if cached is not None and cached[0] == key:
                 continue
+            entries[path] = (key, parse_manifest(Path(path)))
+            changed = True
+        if not changed and self._modes:
+            return False
 
-            args = data.get("args") or []
-            if not isinstance(args, list):
-                print(f"⚠️ Пропускаю {manifest}: поле args должно быть списком")
+        modes: Dict[str, ModeConfig] = {}
+        for path in sorted(entries):
+            mode = entries[path][1]
+            if mode is not None:
+                modes[mode.id] = mode
+        self._entries = entries
+        self._modes = modes  # подмена целиком: читатели из других потоков видят старый или новый словарь
+        return changed
+
+    def watch(self) -> int | None:
+        """Start watching modes/ with inotify; returns the fd to poll, or None if unavailable."""
+        if self._inotify is not None:
+            return self._inotify.fd
+        if not sys.platform.startswith("linux") or not self._modes_dir.exists():
+            return None
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as exc:
+            log.warning("⚠️ inotify недоступен, новые режимы появятся только после перезапуска: %s", exc)
+            return None
+        self._inotify.add(self._modes_dir)
+        for manifest in self._modes_dir.glob("*/manifest.json"):
+            self._inotify.add(manifest.parent)
+        return self._inotify.fd
+
+    def on_watch_ready(self) -> None:
+        """Handle pending inotify events: re-check the affected manifests only."""
+        if self._inotify is None:
+            return
+        manifests: Set[Path] = set()
+        for path in self._inotify.read():
+            if path.parent == self._modes_dir:
+                # новый/удалённый/переименованный каталог режима
+                if path.is_dir():
+                    self._inotify.add(path)
+                manifests.add(path / "manifest.json")
+            elif path == self._modes_dir:
                 continue
+            else:
+                manifests.add(path.parent / "manifest.json" if path.name != "manifest.json" else path)
+        if not manifests:
+            return
+        before = set(self._modes)
+        self.refresh(manifests)
+        after = set(self._modes)
+        for mode_id in sorted(after - before):
+            log.info("🆕 Найден новый режим: %s", mode_id)
+        for mode_id in sorted(before - after):
+            log.info("🗑️ Режим удалён: %s", mode_id)
 
-            description = str(data.get("description") or "").strip()
-            self._modes[mode_id] = ModeConfig(
-                id=mode_id,
-                name=str(data.get("name") or mode_id),
-                entry=entry_path,
-                workdir=workdir,
-                description=description,
-                args=[str(a) for a in args],
-            )
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
 
     def get(self, mode_id: str) -> ModeConfig | None:
         return self._modes.get(mode_id)
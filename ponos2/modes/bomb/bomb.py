@@ -2,10 +2,7 @@ import sys
 import threading
 from pathlib import Path
 
-import paho.mqtt.client as mqtt
-from PySide6.QtCore import QObject, Signal, Property, QTimer, Slot, QUrl
-from PySide6.QtWidgets import QApplication
-from PySide6.QtQml import QQmlApplicationEngine
+from PySide6.QtCore import QObject, Signal, Property, Slot
 
 MODE_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = MODE_DIR.parent.parent
@@ -13,6 +10,16 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from config import ID, BROKER, PORT
+from countdown import Countdown
+import fastlog
+import metrics
+from mode_host import HostedMode, run_standalone
+from mqtt_bus import make_client
+from outbound import OutboundPublisher
+from outbox import open_outbox
+from payloads import INT, PayloadDecoders
+
+log = fastlog.setup("bomb")
 
 TOPIC = f"arena/point/{ID}/time"
 SUPER_TOPIC = "arena/supertopic"
@@ -31,39 +38,50 @@ class Backend(QObject):
         self._winnerText = ""
         self._inputCode = ""
         self._correct_code = None
-        self._timerRemaining = 0
         self._timerTotal = 0
-        self._timerRunning = False
         self._gameEnded = False
         self._receivedTime = None
         self._super_event_sent = False
+        self._decoders = PayloadDecoders().add(TOPIC, "time", INT)
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self._tick)
+        self.countdown = Countdown(self)
+        self.countdown.changed.connect(self.timerChanged)
+        self.countdown.expired.connect(self._on_expired)
 
-        self._client = mqtt.Client()
+        self._client = make_client()
         self._client.on_connect = self._on_connect
         self._client.on_message = self._on_message
+        self._client.on_disconnect = lambda client, userdata, rc: self._outbound.offline()
+        # итог игры публикуется в фоне — экран победы не ждёт брокера; до PUBACK он в журнале
+        self._stats, self._stats_publisher = metrics.mode_metrics("bomb")
+        self._outbound = OutboundPublisher(self._client, stats=self._stats, name="bomb",
+                                           outbox=open_outbox("bomb"), parent=self)
         try:
             self._client.connect(BROKER, PORT, 60)
         except Exception as e:
-            print(f"[MQTT] Connect error: {e}")
+            log.warning("[MQTT] Connect error: %s", e)
 
         self._mqtt_thread = threading.Thread(target=self._client.loop_forever, daemon=True)
         self._mqtt_thread.start()
+
+    def shutdown(self):
+        """Stop the countdown and close the MQTT connection (mode is being unloaded)."""
+        self.countdown.stop()
+        self._outbound.close()
+        if self._stats_publisher is not None:
+            self._stats_publisher.stop()
+        try:
+            self._client.disconnect()
+        except Exception as e:
+            log.warning("[MQTT] Disconnect error: %s", e)
+        self._mqtt_thread.join(timeout=1.0)
     
     def _publish_super_event(self, payload: str):
         """Publish a single-shot event to the shared arena topic."""
         if self._super_event_sent:
             return
         self._super_event_sent = True
-        try:
-            info = self._client.publish(SUPER_TOPIC, payload, qos=1, retain=False)
-            # publish() is async; wait briefly for completion
-            info.wait_for_publish()
-            print(f"[MQTT] published '{payload}' to {SUPER_TOPIC}")
-        except Exception as exc:
-            print(f"[MQTT] failed to publish '{payload}' to {SUPER_TOPIC}: {exc}")
+        self._outbound.publish(SUPER_TOPIC, payload, tag=payload, durable=True)
 
     # --- QML свойства ---
     @Property(str, notify=screenTextChanged)
@@ -76,7 +94,7 @@ class Backend(QObject):
 
     @Property(int, notify=timerChanged)
     def timerRemaining(self):
-        return int(self._timerRemaining)
+        return self.countdown.remaining
 
     @Property(int, notify=timerChanged)
     def timerTotal(self):
@@ -87,27 +105,20 @@ class Backend(QObject):
             return
         if seconds is None:
             seconds = self._receivedTime if self._receivedTime is not None else DEFAULT_SECONDS_IF_NO_MQTT
-        self._timerRemaining = seconds
         self._timerTotal = seconds
-        self._timerRunning = True
-        self.timer.start(1000)
+        self.countdown.start(seconds)
         self.timerChanged.emit()
-        print(f"[TIMER] started for {seconds} seconds")
+        log.info("[TIMER] started for %s seconds", seconds)
 
-    def _tick(self):
-        if not self._timerRunning or self._gameEnded:
+    def _on_expired(self):
+        if self._gameEnded:
             return
-        self._timerRemaining -= 1
-        self.timerChanged.emit()
-        if self._timerRemaining <= 0:
-            self.timer.stop()
-            self._timerRunning = False
-            self._gameEnded = True
-            self._winnerText = "ТЕРРОРИСТЫ ПОБЕДИЛИ!"
-            self.winnerTextChanged.emit()
-            print("[GAME] timer ended: terrorists won")
-            self.gameEnded.emit()
-            self._publish_super_event(f"bomb_esplose_terrorists_{ID}")
+        self._gameEnded = True
+        self._winnerText = "ТЕРРОРИСТЫ ПОБЕДИЛИ!"
+        self.winnerTextChanged.emit()
+        log.info("[GAME] timer ended: terrorists won")
+        self.gameEnded.emit()
+        self._publish_super_event(f"bomb_esplose_terrorists_{ID}")
 
     def _pressNumber(self, num):
         if self._gameEnded:
@@ -174,13 +185,11 @@ class Backend(QObject):
             return True
 
         if self._inputCode == self._correct_code:
-            if self._timerRunning:
-                self.timer.stop()
-                self._timerRunning = False
-            self._gameEnded = True
+            self._gameEnded = True  # раньше остановки: истёкший в ту же миллисекунду отсчёт уже ничего не решит
+            self.countdown.stop()
             self._winnerText = "СПЕЦНАЗ ПОБЕДИЛ!"
             self.winnerTextChanged.emit()
-            print("[GAME] correct code entered: spetsnaz won")
+            log.info("[GAME] correct code entered: spetsnaz won")
             self.gameEnded.emit()
             self._publish_super_event(f"bomb_defused_spetsnaz_{ID}")
             self._inputCode = ""
@@ -193,27 +202,26 @@ class Backend(QObject):
 
     # --- MQTT ---
     def _on_connect(self, client, userdata, flags, rc):
-        print(f"[MQTT] Connected with rc = {rc}")
+        log.info("[MQTT] Connected with rc = %s", rc)
         client.subscribe(TOPIC)
-        print(f"[MQTT] subscribed to {TOPIC}")
+        log.info("[MQTT] subscribed to %s", TOPIC)
+        self._outbound.replay()
 
     def _on_message(self, client, userdata, msg):
-        payload = msg.payload.decode(errors="ignore").strip()
-        try:
-            seconds = int(payload)
-            self._receivedTime = seconds
-            print(f"[MQTT] received time: {seconds}s")
-        except ValueError:
-            print(f"[MQTT] invalid payload: '{payload}'")
+        event = self._decoders.decode(msg.topic, msg.payload)  # мусор считается и логируется в payloads
+        if event is not None:
+            self._receivedTime = event.value
+            log.info("[MQTT] received time: %ss", event.value)
 
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
+def create_hosted_mode(argv=None) -> HostedMode:
     backend = Backend()
-    engine = QQmlApplicationEngine()
-    engine.rootContext().setContextProperty("backend", backend)
-    qml_file = MODE_DIR / "bomb.qml"
-    engine.load(QUrl.fromLocalFile(str(qml_file)))
-    if not engine.rootObjects():
-        sys.exit(-1)
-    sys.exit(app.exec())
+    return HostedMode(
+        qml_file=MODE_DIR / "bomb.qml",
+        context={"backend": backend},
+        on_stop=backend.shutdown,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(run_standalone(create_hosted_mode))
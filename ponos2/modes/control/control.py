@@ -1,26 +1,21 @@
-# control_fast_switch.py
+# control.py
 import sys
 import time
-import logging
-import multiprocessing as mp
 from pathlib import Path
 from collections import deque
-import threading
-from queue import Empty
-
-import paho.mqtt.client as mqtt
 
 from PySide6.QtWidgets import QApplication
 from PySide6.QtQml import QQmlApplicationEngine
-from PySide6.QtCore import QTimer, QObject, Signal
+from PySide6.QtCore import Property, QObject, Signal
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-# --- Логи ---
-logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
-log = logging.getLogger("control_fast")
+# --- Логи (фоновая запись, кольцевой буфер последних записей) ---
+import fastlog
+import metrics
+log = fastlog.setup("control_fast")
 
 # --- Конфиг: ожидается config.py с ID, BROKER, PORT и опционально Game_time/GAME_TIME ---
 try:
@@ -38,6 +33,14 @@ try:
 except Exception as e:
     raise RuntimeError("Не найден config.py с переменными ID, BROKER, PORT (опционально Game_time/GAME_TIME)") from e
 
+from countdown import Countdown
+from event_pump import EventPump
+from frame_probe import report_first_frame
+from mqtt_bus import make_client
+from outbound import OutboundPublisher
+from outbox import open_outbox
+from payloads import INT, TOKEN, Event, PayloadDecoders
+
 CURRENT_GAME_TIME = GAME_TIME
 
 # QML paths
@@ -49,99 +52,114 @@ ACTION_TOPIC = f"arena/point/{ID}/action"
 SUPER_TOPIC = "arena/supertopic"
 
 
-class QueueNotifier(QObject):
-    messageReady = Signal()
+def make_decoders(hit_topic=HIT_TOPIC, time_topic=TIME_TOPIC, stats=None):
+    """Decoders for control's topics: Event(kind="hit", value=team) / Event(kind="time", value=seconds)."""
+    decoders = PayloadDecoders(stats)
+    decoders.add(hit_topic, "hit", TOKEN, check=frozenset(("red", "blue")).__contains__)
+    if time_topic != hit_topic:
+        decoders.add(time_topic, "time", INT, check=(0).__lt__)
+    return decoders
+
+
+class HitLatencyStats:
+    """Hit receive -> CaptureState.capture latency, summarised in the log every ``every`` hits."""
+
+    def __init__(self, label, every=50, keep=1000):
+        self.label = label
+        self.every = every
+        self.samples = deque(maxlen=keep)
+        self.count = 0
+        self.histogram = None  # metrics.Histogram, подключается в main()
+
+    def record(self, received_at):
+        latency_ms = (time.monotonic() - received_at) * 1000.0
+        self.samples.append(latency_ms)
+        if self.histogram is not None:
+            self.histogram.observe(latency_ms)
+        self.count += 1
+        if self.count % self.every == 0:
+            self.log_summary()
+
+    def summary(self):
+        if not self.samples:
+            return None
+        samples = list(self.samples)
+        return {"n": len(samples), "p50": metrics.percentile(samples, 50), "p95": metrics.percentile(samples, 95),
+                "max": max(samples)}
+
+    def log_summary(self):
+        stats = self.summary()
+        if stats is None:
+            return
+        log.info("⏱ %s: попадание -> смена команды p50=%.2f мс p95=%.2f мс max=%.2f мс (n=%d)",
+                 self.label, stats["p50"], stats["p95"], stats["max"], stats["n"])
 
-# --- MQTT worker (в отдельном процессе) ---
-def mqtt_worker(broker, port, hit_topic, time_topic, out_queue, stop_event):
-    logging.basicConfig(level=logging.WARNING, format="%(asctime)s | %(levelname)s | %(message)s")
-    lw = logging.getLogger("mqtt_worker")
-    client = mqtt.Client()
 
-    def on_connect(client, userdata, flags, rc):
-        lw.warning("MQTT connected rc=%s", rc)
-        try:
-            subs = []
-            if hit_topic:
-                subs.append((hit_topic, 0))
-            if time_topic and time_topic != hit_topic:
-                subs.append((time_topic, 0))
-            if subs:
-                client.subscribe(subs)
-                lw.warning("Subscribed to %s", ", ".join(t for t, _ in subs))
-        except Exception:
-            lw.exception("Subscribe failed")
+hit_latency = HitLatencyStats("direct")
 
-    def on_message(client, userdata, msg):
-        topic = getattr(msg, "topic", "")
-        try:
-            payload = msg.payload.decode(errors="ignore").strip().lower()
-        except Exception:
-            payload = ""
-        if hit_topic and topic == hit_topic:
-            if payload in ("red", "blue"):
-                try:
-                    out_queue.put_nowait({"kind": "hit", "value": payload})
-                except Exception:
-                    pass
-        elif time_topic and topic == time_topic:
-            try:
-                seconds = int(payload)
-            except ValueError:
-                lw.warning("Invalid time payload '%s'", payload)
-                return
-            if seconds <= 0:
-                lw.warning("Non-positive time payload '%s'", payload)
-                return
-            try:
-                out_queue.put_nowait({"kind": "time", "value": seconds})
-            except Exception:
-                pass
 
-    client.on_connect = on_connect
-    client.on_message = on_message
+# --- MQTT в процессе режима: события прямо в GUI-поток ---
+class ControlMqttClient:
+    """MQTT client that posts parsed events from paho's thread straight into an EventPump."""
 
-    try:
-        client.connect(broker, port, keepalive=60)
-        client.loop_start()
-    except Exception:
-        connected = False
-    else:
-        connected = True
+    def __init__(self, pump, broker=BROKER, port=PORT, hit_topic=HIT_TOPIC, time_topic=TIME_TOPIC, stats=None):
+        self._pump = pump
+        self._broker = broker
+        self._port = port
+        self._decoders = make_decoders(hit_topic, time_topic, stats)
+        self._client = make_client()
+        self._client.on_connect = self._on_connect
+        self._client.on_message = self._on_message
 
-    try:
-        while not stop_event.is_set():
-            if not connected:
-                try:
-                    client.reconnect()
-                    client.loop_start()
-                    connected = True
-                except Exception:
-                    time.sleep(1.0)
-                    continue
-            time.sleep(0.05)
-    finally:
+    def start(self):
+        try:
+            self._client.connect(self._broker, self._port, keepalive=60)
+        except Exception:
+            log.exception("MQTT connect failed, paho will retry")
+        self._client.loop_start()
+
+    def stop(self):
         try:
-            client.loop_stop()
-            client.disconnect()
+            self._client.loop_stop()
+            self._client.disconnect()
         except Exception:
             pass
 
+    def _on_connect(self, client, userdata, flags, rc):
+        log.info("MQTT connected rc=%s", rc)
+        subs = [(t, 0) for t in self._decoders.topics()]
+        if subs:
+            client.subscribe(subs)
+
+    def _on_message(self, client, userdata, msg):
+        event = self._decoders.decode(msg.topic, msg.payload)
+        if event is not None:
+            self._pump.post(event)
+
 
 class TopicPublisher:
-    """Minimal helper that keeps a lightweight MQTT connection for publishing arena events."""
+    """Minimal helper that keeps a lightweight MQTT connection for publishing arena events.
+
+    Events are journalled (``outbox.py``) and published by an ``OutboundPublisher``;
+    what the broker did not acknowledge goes out again on the next connect.
+    """
 
-    def __init__(self, broker, port, topic):
+    def __init__(self, broker, port, topic, name, stats=None):
         self._broker = broker
         self._port = port
         self._topic = topic
         self._client = None
         self._loop_started = False
+        self._outbound = OutboundPublisher(None, stats=stats, name=name, outbox=open_outbox(name))
+        self._outbound.failed.connect(self._on_failed)
         self._connect_client()
 
     def _connect_client(self):
-        self.close()
-        client = mqtt.Client()
+        self._disconnect()
+        client = make_client()
+        client.on_connect = lambda client, userdata, flags, rc: self._outbound.replay()
+        client.on_disconnect = lambda client, userdata, rc: self._outbound.offline()
+        self._outbound.client = client  # до connect: повтор из журнала может начаться сразу
         try:
             result = client.connect(self._broker, self._port, keepalive=30)
             if result != 0:
@@ -160,16 +178,18 @@ class TopicPublisher:
             return
         if self._client is None:
             self._connect_client()
-            if self._client is None:
-                return
-        try:
-            self._client.publish(self._topic, payload, qos=1, retain=False)
-            log.info("Отправлено '%s' в %s", payload, self._topic)
-        except Exception:
-            log.exception("Не удалось отправить '%s' в %s", payload, self._topic)
+        # без подключения событие остаётся в журнале и уйдёт после connect
+        self._outbound.publish(self._topic, payload, tag=payload, durable=True)
+
+    def _on_failed(self, tag, reason):
+        if self._client is None:
             self._connect_client()
 
     def close(self):
+        self._outbound.close()
+        self._disconnect()
+
+    def _disconnect(self):
         if self._client is None:
             return
         try:
@@ -180,51 +200,125 @@ class TopicPublisher:
             pass
         finally:
             self._client = None
+            self._outbound.client = None
             self._loop_started = False
 
-def read_int_prop_safe(qobj, name):
-    try:
-        v = qobj.property(name)
-        if v is None:
-            return 0
-        return int(v)
-    except Exception:
-        return 0
-
-def read_str_prop_safe(qobj, name):
-    try:
-        v = qobj.property(name)
-        if v is None:
-            return ""
-        return str(v)
-    except Exception:
-        return ""
-
-def is_game_finished(root):
-    blue = read_int_prop_safe(root, "blueRemaining")
-    red = read_int_prop_safe(root, "redRemaining")
-    return (blue == 0 and red == 0)
-
-def _apply_round_time_to_root(root, seconds):
-    if root is None:
-        return
-    try:
-        value = int(max(1, seconds))
-    except Exception:
-        return
-    try:
-        root.setProperty("defaultRoundTime", value)
-        log.info("QML defaultRoundTime set to %s", value)
-    except Exception:
-        log.exception("Не удалось установить defaultRoundTime в QML")
+class CaptureState(QObject):
+    """Authoritative capture state of the point: active team, per-team countdown, finished flag.
+
+    The hit path decides from these fields alone; control.qml binds to the
+    properties and only plays effects. Each team's time is a ``Countdown``
+    that runs while the team holds the point and is paused otherwise; when
+    it runs out, ``pointCaptured``/``gameFinished`` fire. Until a team is
+    captured for the first time its timer follows ``set_round_time``.
+    """
+    activeTeamChanged = Signal()
+    timersChanged = Signal()
+    pointCaptured = Signal(str)
+    gameFinished = Signal(str)
+
+    TEAMS = ("blue", "red")
+
+    def __init__(self, round_time: int, parent=None):
+        super().__init__(parent)
+        round_time = max(1, int(round_time))
+        self._active = ""
+        self._total = dict.fromkeys(self.TEAMS, round_time)
+        self._countdowns = {}
+        for team in self.TEAMS:
+            countdown = Countdown(self)
+            countdown.reset(round_time)
+            countdown.changed.connect(self.timersChanged)
+            countdown.expired.connect(lambda team=team: self._on_expired(team))
+            self._countdowns[team] = countdown
+        self._armed = set()  # команды, чей таймер уже запускался
+        self._winner = ""    # команда, чьё время вышло первым; после неё захваты не принимаются
+
+    @Property(str, notify=activeTeamChanged)
+    def activeTeam(self):
+        return self._active
+
+    @Property(int, notify=timersChanged)
+    def blueTotal(self):
+        return self._total["blue"]
+
+    @Property(int, notify=timersChanged)
+    def redTotal(self):
+        return self._total["red"]
+
+    @Property(int, notify=timersChanged)
+    def blueRemaining(self):
+        return self._countdowns["blue"].remaining
+
+    @Property(int, notify=timersChanged)
+    def redRemaining(self):
+        return self._countdowns["red"].remaining
+
+    @Property(bool, notify=timersChanged)
+    def finished(self):
+        return not any(c.remaining for c in self._countdowns.values())
+
+    @property
+    def active_team(self) -> str:
+        return self._active
+
+    def remaining(self, team: str) -> int:
+        return self._countdowns[team].remaining
+
+    def set_round_time(self, seconds: int):
+        """New round length; applies to teams that have not captured the point yet."""
+        seconds = max(1, int(seconds))
+        for team in self.TEAMS:
+            if team not in self._armed:
+                self._total[team] = seconds
+                self._countdowns[team].reset(seconds)
+        self.timersChanged.emit()
+
+    def capture(self, team: str, seconds: int):
+        """Make ``team`` active and run its countdown (restarted with ``seconds`` if it is fresh or spent)."""
+        if self._winner:
+            return
+        previous = self._active
+        if team != previous:
+            if previous and self._countdowns[previous].pause():
+                return  # время previous вышло раньше этого попадания — его expired следующим событием
+            self._active = team
+            self.activeTeamChanged.emit()
+        # timersChanged приходит от Countdown.changed, если показываемое число изменилось
+        countdown = self._countdowns[team]
+        if countdown.remaining in (self._total[team], 0):
+            self._total[team] = max(1, int(seconds))
+            countdown.start(self._total[team])
+        else:
+            countdown.resume()
+        self._armed.add(team)
+
+    def stop(self):
+        for countdown in self._countdowns.values():
+            countdown.stop()
+
+    def _on_expired(self, team: str):
+        if self._winner:
+            return
+        self._winner = team
+        self.pointCaptured.emit(team)
+        self.gameFinished.emit(team)
 
 
-def process_message_batch(root, messages):
+def process_message_batch(state, messages):
     global CURRENT_GAME_TIME
     last_hit = None
+    last_hit_at = None
     updated_time = None
     for msg in messages:
-        if isinstance(msg, dict):
+        if isinstance(msg, Event):
+            if msg.kind == "hit":
+                last_hit = msg.value
+                last_hit_at = msg.received_at
+            elif msg.kind == "time":
+                CURRENT_GAME_TIME = msg.value
+                updated_time = msg.value
+        elif isinstance(msg, dict):
             kind = msg.get("kind")
             if kind == "hit":
                 value = (msg.get("value") or "").strip().lower()
@@ -246,104 +340,47 @@ def process_message_batch(root, messages):
 
     if updated_time is not None:
         log.info("Обновлено время раунда с MQTT: %s c", updated_time)
-        _apply_round_time_to_root(root, updated_time)
+        state.set_round_time(updated_time)
     if last_hit is None:
         return
 
-    if root is None:
-        return
-
-    if is_game_finished(root):
+    blue_remaining, red_remaining = state.remaining("blue"), state.remaining("red")
+    if blue_remaining == 0 and red_remaining == 0:
         log.info("Game finished — ignoring incoming '%s'", last_hit)
         return
     # если хотя бы один таймер обнулён — не реагируем
-    blue_remaining = read_int_prop_safe(root, "blueRemaining")
-    red_remaining = read_int_prop_safe(root, "redRemaining")
     if blue_remaining == 0 or red_remaining == 0:
         log.info("⏹ Один из таймеров = 0, игнорируем '%s'", last_hit)
         return
 
-    try:
-        primary = read_str_prop_safe(root, "primaryColor")
-        state_blue = read_str_prop_safe(root, "stateBlue")
-        state_red = read_str_prop_safe(root, "stateRed")
-        blue_remaining = read_int_prop_safe(root, "blueRemaining")
-        red_remaining = read_int_prop_safe(root, "redRemaining")
-    except Exception:
-        primary = state_blue = state_red = ""
-        blue_remaining = red_remaining = 0
-
-    same_active = False
-    if last_hit == "blue" and primary == state_blue and blue_remaining > 0:
-        same_active = True
-    if last_hit == "red" and primary == state_red and red_remaining > 0:
-        same_active = True
-
-    if same_active:
+    if last_hit == state.active_team:
         log.debug("Message %s ignored because same color already active with remaining > 0", last_hit)
         return
 
-    try:
-        if hasattr(root, "changeCircleState"):
-            root.changeCircleState(last_hit)
-    except Exception:
-        log.exception("changeCircleState failed")
-
-    try:
-        delay_ms = 10
-        def start_timer():
-            try:
-                if hasattr(root, "startTimerForActive"):
-                    root.startTimerForActive(int(CURRENT_GAME_TIME))
-            except Exception:
-                log.exception("startTimerForActive failed")
-        QTimer.singleShot(delay_ms, start_timer)
-    except Exception:
-        try:
-            root.startTimerForActive(int(CURRENT_GAME_TIME))
-        except Exception:
-            log.exception("startTimerForActive direct failed")
+    state.capture(last_hit, CURRENT_GAME_TIME)
+    if last_hit_at is not None:
+        hit_latency.record(last_hit_at)
 
 def main():
-    try:
-        mp.set_start_method("spawn")
-    except RuntimeError:
-        pass
-
-    mp_queue = mp.Queue()
-    stop_event = mp.Event()
     super_topic_publisher = None
     action_publisher = None
 
-    mqtt_proc = mp.Process(target=mqtt_worker, args=(BROKER, PORT, HIT_TOPIC, TIME_TOPIC, mp_queue, stop_event), daemon=True)
-    mqtt_proc.start()
-    log.info("Started mqtt process pid=%s", mqtt_proc.pid)
-
     app = QApplication(sys.argv)
+    state = CaptureState(CURRENT_GAME_TIME)
     engine = QQmlApplicationEngine()
     engine.rootContext().setContextProperty("backgroundPath", ASSET_BG)
+    engine.rootContext().setContextProperty("capture", state)
     engine.load(str(QML_FILE))
     if not engine.rootObjects():
         log.error("Failed to load QML: %s", QML_FILE)
-        stop_event.set()
-        mqtt_proc.join(timeout=2.0)
-        if mqtt_proc.is_alive():
-            mqtt_proc.terminate()
         sys.exit(-1)
 
-    root = engine.rootObjects()[0]
     log.info("QML loaded")
+    report_first_frame(engine)
 
-    try:
-        if hasattr(root, "changeCircleState"):
-            root.changeCircleState("white")
-    except Exception:
-        pass
-
-    _apply_round_time_to_root(root, CURRENT_GAME_TIME)
-
-    super_topic_publisher = TopicPublisher(BROKER, PORT, SUPER_TOPIC)
-    action_publisher = TopicPublisher(BROKER, PORT, ACTION_TOPIC)
+    stats, stats_publisher = metrics.mode_metrics("control")
+    super_topic_publisher = TopicPublisher(BROKER, PORT, SUPER_TOPIC, "control_super", stats)
+    action_publisher = TopicPublisher(BROKER, PORT, ACTION_TOPIC, "control_action", stats)
 
     def handle_point_capture(team):
         team_value = (team or "").strip().lower()
@@ -353,13 +390,7 @@ def main():
         payload = f"{team_value}_team_point_{ID}"
         super_topic_publisher.publish(payload)
 
-    if hasattr(root, "pointCaptured"):
-        try:
-            root.pointCaptured.connect(handle_point_capture)
-        except Exception:
-            log.exception("Не удалось подключиться к сигналу pointCaptured")
-    else:
-        log.warning("pointCaptured сигнал не найден в QML — публикации захвата точки не будут отправляться")
+    state.pointCaptured.connect(handle_point_capture)
 
     def handle_game_finished(team):
         team_value = (team or "").strip().lower()
@@ -368,56 +399,29 @@ def main():
         payload = f"game_finished_{team_value}_point_{ID}"
         action_publisher.publish(payload)
 
-    if hasattr(root, "gameFinished"):
-        try:
-            root.gameFinished.connect(handle_game_finished)
-        except Exception:
-            log.exception("Не удалось подключиться к сигналу gameFinished")
-    else:
-        log.warning("gameFinished сигнал не найден в QML — публикации окончания игры не будут отправляться")
-
-    pending_messages = deque()
-    pending_lock = threading.Lock()
-    queue_notifier = QueueNotifier()
-
-    def drain_pending():
-        batch = []
-        with pending_lock:
-            while pending_messages:
-                batch.append(pending_messages.popleft())
-        if batch:
-            process_message_batch(root, batch)
-
-    queue_notifier.messageReady.connect(drain_pending)
-
-    queue_thread_stop = threading.Event()
-
-    def forward_mp_queue():
-        while not queue_thread_stop.is_set():
-            try:
-                msg = mp_queue.get(timeout=0.25)
-            except Empty:
-                continue
-            except (EOFError, OSError):
-                if queue_thread_stop.is_set():
-                    break
-                continue
-            with pending_lock:
-                pending_messages.append(msg)
-            queue_notifier.messageReady.emit()
-
-    queue_thread = threading.Thread(target=forward_mp_queue, name="mp-queue-forwarder", daemon=True)
-    queue_thread.start()
+    state.gameFinished.connect(handle_game_finished)
+
+    events_total = stats.counter("events_total", "MQTT events handled by the GUI thread")
+
+    def handle_batch(batch):
+        events_total.inc(len(batch))
+        process_message_batch(state, batch)
+
+    pump = EventPump(handle_batch)
+    hit_latency.histogram = stats.histogram("hit_latency_ms", "Hit receive -> capture state change, ms",
+                                            path=hit_latency.label)
+    stats.gauge("event_queue_depth", "MQTT events waiting for the GUI thread", fn=pump.depth)
+    mqtt_client = ControlMqttClient(pump, stats=stats)
+    mqtt_client.start()
 
     try:
         exit_code = app.exec()
     finally:
-        queue_thread_stop.set()
-        queue_thread.join(timeout=1.0)
-        stop_event.set()
-        mqtt_proc.join(timeout=2.0)
-        if mqtt_proc.is_alive():
-            mqtt_proc.terminate()
+        hit_latency.log_summary()
+        state.stop()
+        if stats_publisher is not None:
+            stats_publisher.stop()
+        mqtt_client.stop()
         if super_topic_publisher is not None:
             super_topic_publisher.close()
         if action_publisher is not None:
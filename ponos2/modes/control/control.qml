@@ -13,8 +13,6 @@ Window {
     flags: Qt.FramelessWindowHint
 
     signal circleClicked()
-    signal pointCaptured(string team)
-    signal gameFinished(string winner)
 
     // scaling
     property real baseWidth: 1920
@@ -32,13 +30,14 @@ Window {
     property color hudMuted: "#6ea0b7"
     property color cAlarm: stateRed
 
-    // current
-    property color primaryColor: stateWhite
+    // current: команда и таймеры ведёт CaptureState в control.py (context property "capture")
+    readonly property string activeTeam: capture ? capture.activeTeam : ""
+    property color primaryColor: activeTeam === "red" ? stateRed : (activeTeam === "blue" ? stateBlue : stateWhite)
     onPrimaryColorChanged: {
         circleCanvas.requestPaint();
         gridCanvas.requestPaint();
         // if switched to white - hide overlay
-        if (primaryColor === stateWhite) {
+        if (activeTeam === "") {
             flashOverlay.opacity = 0;
             flashOverlay.color = "transparent";
         }
@@ -56,15 +55,12 @@ Window {
     onGridShiftChanged: gridCanvas.requestPaint()
     property real particleShift: 0.0
     // timers data
-    property int defaultRoundTime: 10
-    property int blueTotal: defaultRoundTime
-    property int redTotal: defaultRoundTime
-    property int blueRemaining: defaultRoundTime
-    property int redRemaining: defaultRoundTime
-    property real blueProgress: 1.0
-    property real redProgress: 1.0
-
-    property bool paused: false
+    readonly property int blueTotal: capture ? capture.blueTotal : 0
+    readonly property int redTotal: capture ? capture.redTotal : 0
+    readonly property int blueRemaining: capture ? capture.blueRemaining : 0
+    readonly property int redRemaining: capture ? capture.redRemaining : 0
+    readonly property real blueProgress: blueTotal > 0 ? blueRemaining / blueTotal : 0
+    readonly property real redProgress: redTotal > 0 ? redRemaining / redTotal : 0
 
     function hudSecondsDisplay(value) {
         var v = Math.max(0, Math.floor(value || 0));
@@ -249,7 +245,7 @@ Window {
                 Text {
                     text: hudSecondsDisplay(Math.max(0, blueRemaining))
                     font.pixelSize: Math.max(18, 26 * s)
-                    color: primaryColor === stateBlue ? stateBlue : hudText
+                    color: activeTeam === "blue" ? stateBlue : hudText
                 }
             }
 
@@ -264,7 +260,7 @@ Window {
                 Text {
                     text: hudSecondsDisplay(Math.max(0, redRemaining))
                     font.pixelSize: Math.max(18, 26 * s)
-                    color: primaryColor === stateRed ? stateRed : hudText
+                    color: activeTeam === "red" ? stateRed : hudText
                 }
             }
 
@@ -387,13 +383,13 @@ Window {
             var coreR = size / 2 * 0.38;
             var ringWidth = Math.max(12, 20 * s);
             var accent = neonCyan;
-            if (primaryColor === stateRed) {
+            if (activeTeam === "red") {
                 accent = neonPink;
-            } else if (primaryColor === stateBlue) {
+            } else if (activeTeam === "blue") {
                 accent = stateBlue;
             }
-            var haloAlpha = (primaryColor === stateWhite) ? 0.15 : 0.8;
-            var haloColor = (primaryColor === stateWhite) ? Qt.rgba(1, 1, 1, 0.45) : accent;
+            var haloAlpha = (activeTeam === "") ? 0.15 : 0.8;
+            var haloColor = (activeTeam === "") ? Qt.rgba(1, 1, 1, 0.45) : accent;
 
             // glow halo
             ctx.save();
@@ -446,8 +442,8 @@ Window {
             // progress ring
             var showProgress = false;
             var activeProgress = 0;
-            if (primaryColor === stateBlue) { activeProgress = blueProgress; showProgress = true; }
-            else if (primaryColor === stateRed) { activeProgress = redProgress; showProgress = true; }
+            if (activeTeam === "blue") { activeProgress = blueProgress; showProgress = true; }
+            else if (activeTeam === "red") { activeProgress = redProgress; showProgress = true; }
 
             ctx.beginPath();
             ctx.lineWidth = ringWidth * 0.9;
@@ -469,7 +465,7 @@ Window {
                 ctx.stroke();
             }
 
-            if (primaryColor !== stateWhite) {
+            if (activeTeam !== "") {
                 var sweepStart = -Math.PI / 2 + scanPhase * Math.PI * 2;
                 var sweepEnd = sweepStart + Math.PI / 5;
                 ctx.beginPath();
@@ -511,8 +507,8 @@ Window {
 
             // center data text
             var display = "";
-            if (primaryColor === stateBlue) display = Math.max(0, blueRemaining).toString();
-            else if (primaryColor === stateRed) display = Math.max(0, redRemaining).toString();
+            if (activeTeam === "blue") display = Math.max(0, blueRemaining).toString();
+            else if (activeTeam === "red") display = Math.max(0, redRemaining).toString();
 
             ctx.fillStyle = hudText;
             ctx.font = Math.round(58 * s) + "px 'Orbitron', 'Eurostile', sans-serif";
@@ -565,7 +561,7 @@ Window {
 
         onStopped: {
             // keep overlay visible in finished color, except if user switched to white
-            if (primaryColor !== stateWhite) {
+            if (activeTeam !== "") {
                 flashOverlay.opacity = 0.32;
             } else {
                 flashOverlay.opacity = 0;
@@ -574,61 +570,27 @@ Window {
         }
     }
 
-    // countdown timer that decrements only the active color's remaining
-    Timer {
-        id: countdownTimer
-        interval: 1000
-        repeat: true
-        running: false
-        onTriggered: {
-            if (paused) return;
+    // отсчёт идёт в CaptureState; здесь только эффекты
+    Connections {
+        target: capture
 
-            var finishedThisTick = false;
+        function onActiveTeamChanged() {
+            neonPulse.start();
+            // manual change cancels any running flash and hides overlay
+            if (flashAnim.running) flashAnim.stop();
+            flashOverlay.opacity = 0;
+            flashOverlay.color = "transparent";
+            circleCanvas.requestPaint();
+        }
 
-            if (primaryColor === stateBlue) {
-                if (blueRemaining > 0) {
-                    blueRemaining -= 1;
-                    blueProgress = (blueTotal > 0) ? (blueRemaining / blueTotal) : 0;
-                    circleCanvas.requestPaint();
-                }
-                if (blueRemaining === 0) finishedThisTick = true;
-            } else if (primaryColor === stateRed) {
-                if (redRemaining > 0) {
-                    redRemaining -= 1;
-                    redProgress = (redTotal > 0) ? (redRemaining / redTotal) : 0;
-                    circleCanvas.requestPaint();
-                }
-                if (redRemaining === 0) finishedThisTick = true;
-            }
+        function onTimersChanged() {
+            circleCanvas.requestPaint();
+        }
 
-            if (finishedThisTick) {
-                var finishedTeam = "";
-                if (primaryColor === stateBlue) {
-                    finishedTeam = "blue";
-                } else if (primaryColor === stateRed) {
-                    finishedTeam = "red";
-                }
-                if (finishedTeam !== "") {
-                    pointCaptured(finishedTeam);
-                    gameFinished(finishedTeam);
-                }
-                // Only trigger visual effect when the other timer is NOT > 0.
-                // That is: if both timers are > 0 do nothing.
-                if (!(blueRemaining > 0 && redRemaining > 0)) {
-                    // set overlay to the finished color (based on who finished)
-                    var finishedColor = (primaryColor === stateBlue) ? stateBlue : stateRed;
-                    flashOverlay.color = finishedColor;
-                    // start the flashing animation (10 loops)
-                    flashAnim.start();
-                }
-                // If both timers are 0, stop countdown; otherwise keep it stopped until resumed.
-                if (blueRemaining === 0 && redRemaining === 0) {
-                    countdownTimer.stop();
-                } else {
-                    // we stopped due to finish of active; leave timer stopped until user resumes/changes as desired
-                    countdownTimer.stop();
-                }
-            }
+        function onPointCaptured(team) {
+            // overlay in the finished color, flashing 10 loops
+            flashOverlay.color = (team === "blue") ? stateBlue : stateRed;
+            flashAnim.start();
         }
     }
 
@@ -643,59 +605,6 @@ Window {
         onStopped: { circleCanvas.scale = 1.0; }
     }
 
-    // start a timer for active color (do not overwrite other color)
-    function startTimerForActive(seconds) {
-        var sInt = Math.max(1, Math.floor(seconds));
-        if (primaryColor === stateBlue) {
-            var canResetBlue = (blueRemaining === blueTotal) || (blueRemaining === 0);
-            if (canResetBlue) {
-                blueTotal = sInt;
-                blueRemaining = blueTotal;
-                blueProgress = 1.0;
-            }
-        } else if (primaryColor === stateRed) {
-            var canResetRed = (redRemaining === redTotal) || (redRemaining === 0);
-            if (canResetRed) {
-                redTotal = sInt;
-                redRemaining = redTotal;
-                redProgress = 1.0;
-            }
-        }
-        paused = false;
-        circleCanvas.requestPaint();
-        if (!countdownTimer.running) countdownTimer.start();
-    }
-
-    // change color manually - must NOT start flash animation
-    function changeCircleState(state) {
-        if (state === "red") primaryColor = stateRed;
-        else if (state === "white") primaryColor = stateWhite;
-        else primaryColor = stateBlue;
-
-        neonPulse.start();
-
-        // manual change cancels any running flash and hides overlay
-        if (flashAnim.running) flashAnim.stop();
-        flashOverlay.opacity = 0;
-        flashOverlay.color = "transparent";
-
-        // start/resume timers only for non-white
-        if (primaryColor === stateWhite) {
-            // do not start timer when switching to white
-        } else {
-            var activeRemaining = primaryColor === stateBlue ? blueRemaining : redRemaining;
-            if (activeRemaining > 0) {
-                paused = false;
-                if (!countdownTimer.running) countdownTimer.start();
-            } else {
-                paused = true;
-                countdownTimer.stop();
-            }
-        }
-
-        circleCanvas.requestPaint();
-    }
-
     // Mouse controls
 
 
@@ -717,7 +626,7 @@ Window {
 
             Text {
                 anchors.centerIn: parent
-                text: (primaryColor === stateWhite) ? "ТОЧКА НЕ ЗАХВАЧЕНА" : (primaryColor === stateBlue ? "СИНЯЯ ФАЗА" : "КРАСНАЯ ФАЗА")
+                text: (activeTeam === "") ? "ТОЧКА НЕ ЗАХВАЧЕНА" : (activeTeam === "blue" ? "СИНЯЯ ФАЗА" : "КРАСНАЯ ФАЗА")
                 font.pixelSize: Math.max(14, 20 * s)
                 font.bold: true
                 color: hudText
@@ -1,16 +1,11 @@
 import argparse
-import json
-import logging
 import queue
 import sys
 import threading
 import time
 from pathlib import Path
 
-import paho.mqtt.client as mqtt
-from PySide6.QtCore import QObject, Property, QTimer, QUrl, Signal
-from PySide6.QtQml import QQmlApplicationEngine
-from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QObject, Property, Signal
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
@@ -21,6 +16,16 @@ try:
 except Exception as exc:  # pragma: no cover - config is mandatory on device
     raise RuntimeError("config.py с параметрами BROKER/PORT/ID обязателен для режима Купол") from exc
 
+from damage_ledger import HP_MARK, DamageLedger, LeaderTracker
+from event_pump import make_event_source
+import fastlog
+import metrics
+from mode_host import HostedMode, run_standalone
+from mqtt_bus import make_client
+from outbound import OutboundPublisher
+from outbox import open_outbox
+from payloads import AUTO, JSON, PayloadDecoders
+
 ID = getattr(_cfg, "ID")
 BROKER = getattr(_cfg, "BROKER")
 PORT = getattr(_cfg, "PORT")
@@ -33,15 +38,17 @@ QML_DISPLAY = MODE_DIR / "dome_display.qml"
 DEFAULT_HP_MAX = int(getattr(_cfg, "DOME_HP_MAX", 1000))
 HIT_DAMAGE = max(1, int(getattr(_cfg, "DOME_HIT_DAMAGE", 100)))
 SUPER_TOPIC = "arena/supertopic"
+EVENT_POLL_MS = int(getattr(_cfg, "MODE_EVENT_POLL_MS", 0) or 0)
+LEDGER_PATH = getattr(_cfg, "DOME_LEDGER_PATH", None)
+LEDGER_RESUME_SEC = float(getattr(_cfg, "DOME_LEDGER_RESUME_SEC", 120) or 0)
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
-log = logging.getLogger("dome")
+log = fastlog.setup("dome")
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Купол: дисплей состояния")
     parser.add_argument("--dome-id", help="идентификатор купола (для дисплея)")
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 class DomeDisplayBackend(QObject):
@@ -50,7 +57,7 @@ class DomeDisplayBackend(QObject):
     teamChanged = Signal()
     updateChanged = Signal()
 
-    def __init__(self, dome_id: str, initial_hp: int):
+    def __init__(self, dome_id: str, initial_hp: int, ledger: DamageLedger | None = None):
         super().__init__()
         self._dome_id = dome_id
         self._hp_current = max(0, int(initial_hp))
@@ -64,7 +71,8 @@ class DomeDisplayBackend(QObject):
         self._team_color = TEAM_COLORS.get("default", "#5defff")
         self._last_update = "--"
         self._destroyed_animation_tag = 0
-        self._team_damage = {}
+        self._leader = LeaderTracker()
+        self._ledger = ledger if ledger is not None else DamageLedger()
 
     @Property(str, notify=stateChanged)
     def domeId(self):
@@ -116,27 +124,48 @@ class DomeDisplayBackend(QObject):
 
     def reset_hp(self, hp_max: int | None = None):
         hp_value = max(1, int(hp_max if hp_max is not None else self._hp_max))
-        self._team_damage.clear()
+        self._leader.clear()
+        self._ledger.mark_reset(time.time(), hp_value)
         self.apply_state({"hp_max": hp_value, "hp_current": hp_value, "state": "ACTIVE"})
 
     def apply_hit(self, team_code: str, damage: int):
         """Уменьшаем HP локально при получении MQTT-hit. Возвращает True, если купол разрушен именно этим попаданием."""
-        if not damage or damage <= 0:
+        return self.apply_hits([team_code], damage)
+
+    def apply_hits(self, team_codes, damage: int):
+        """Apply a burst of hits (in arrival order) with one ``apply_state``.
+
+        HP and per-team damage are stepped hit by hit, so the result is the same
+        as calling ``apply_hit`` for each one: ``(destroyed_now, winner)`` reports
+        the hit that brought HP to zero and the leader at that moment.
+        """
+        if not damage or damage <= 0 or not team_codes:
             return False, ""
-        destroyed_before = (self._state == "destroyed")
-        new_hp = max(0, int(self._hp_current) - int(damage))
+        damage = int(damage)
+        destroyed = (self._state == "destroyed")
+        new_hp = int(self._hp_current)
+        leader, ledger = self._leader, self._ledger
+        ts = time.time()
+        destroyed_now, destroyed_by = False, ""
+        winner_team = leader.leader
+        for team_code in team_codes:
+            team_code = (team_code or "").strip().lower()
+            if team_code == HP_MARK:
+                continue  # в журнале это запись HP, а не команда — такой токен не попадание
+            new_hp = max(0, new_hp - damage)
+            if team_code:
+                leader.add(team_code, damage)
+                ledger.append(ts, team_code, damage)
+            winner_team = leader.leader
+            if new_hp <= 0 and not destroyed and not destroyed_now:
+                destroyed_now, destroyed_by = True, winner_team
+            destroyed = new_hp <= 0
+        ledger.flush()
+
         payload = {
             "hp_current": new_hp,
             "hp_max": self._hp_max,
         }
-        team_code = (team_code or "").strip().lower()
-        if team_code:
-            self._team_damage[team_code] = self._team_damage.get(team_code, 0) + int(damage)
-
-        winner_team = team_code
-        if self._team_damage:
-            winner_team = max(self._team_damage.items(), key=lambda kv: kv[1])[0]
-
         if new_hp <= 0:
             payload["state"] = "DESTROYED"
             payload["team_destroyer"] = winner_team
@@ -144,8 +173,30 @@ class DomeDisplayBackend(QObject):
             if team_label:
                 payload["team_name"] = team_label
         self.apply_state(payload)
-        destroyed_now = new_hp <= 0 and not destroyed_before
-        return destroyed_now, winner_team if destroyed_now else ""
+        return destroyed_now, destroyed_by
+
+    def restore_from_ledger(self, max_age: float) -> bool:
+        """Rebuild HP and the leader from the ledger if its last hit is younger than ``max_age`` seconds."""
+        ledger = self._ledger
+        if len(ledger) < 2 or time.time() - ledger.times[-1] > max_age:
+            return False
+        hp_max, hp, self._leader = ledger.replay(self._hp_max)
+        payload = {"hp_max": hp_max, "hp_current": hp}
+        winner_team = self._leader.leader
+        if hp <= 0:
+            payload["state"] = "DESTROYED"
+            payload["team_destroyer"] = winner_team
+            payload["team_name"] = TEAM_NAME_OVERRIDES.get(winner_team, winner_team.upper() if winner_team else "")
+        self.apply_state(payload)
+        hits = sum(row["hits"] for row in ledger.breakdown().values())
+        log.info("♻️ Купол восстановлен из журнала урона: HP %s/%s, попаданий %s", hp, hp_max, hits)
+        return True
+
+    def damage_breakdown(self) -> dict:
+        return self._ledger.breakdown()
+
+    def close(self):
+        self._ledger.close()
 
     def _phase_from_ratio(self, ratio: float) -> int:
         if ratio >= 0.6:
@@ -156,7 +207,8 @@ class DomeDisplayBackend(QObject):
             return 3
         return 3
 
-    def apply_state(self, payload: dict):
+    def apply_state(self, payload: dict, record: bool = False):
+        """Show a dome state; with ``record`` (state from the server) a changed HP also goes to the ledger."""
         try:
             hp_max = int(max(1, int(payload.get("hp_max", self._hp_max))))
         except Exception:
@@ -204,6 +256,14 @@ class DomeDisplayBackend(QObject):
         team_color = TEAM_COLORS.get(destroyer.lower(), TEAM_COLORS.get("default", "#f45b69"))
 
         changed_hp = hp_current != self._hp_current or hp_max != self._hp_max or abs(ratio - self._hp_percent) > 0.0005
+        if record and hp_max != self._hp_max:
+            # новый максимум — новая игра: как reset_hp, но с тем HP, что прислал сервер
+            self._leader.clear()
+            self._ledger.mark_reset(time.time(), hp_max)
+            if hp_current != hp_max:
+                self._ledger.mark_hp(time.time(), hp_current)
+        elif record and hp_current != self._hp_current:
+            self._ledger.mark_hp(time.time(), hp_current)
         changed_state = mapped_state != self._state or phase != self._phase or status_text != self._status
         changed_team = destroyer != self._team_destroyer or destroyer_label != self._team_label or team_color != self._team_color
 
@@ -231,17 +291,19 @@ class DomeDisplayBackend(QObject):
 
 
 class DomeMqttClient:
-    def __init__(self, broker, port, topic_map, event_queue, super_topic=None):
+    def __init__(self, broker, port, decoders: PayloadDecoders, event_sink, super_topic=None, stats=None):
         self._broker = broker
         self._port = port
-        self._topic_map = {k: v for k, v in (topic_map or {}).items() if k}
-        self._queue = event_queue
+        self._decoders = decoders
+        self._sink = event_sink  # EventPump.post или queue.put_nowait — вызывается из потока paho
         self._super_topic = super_topic
-        self._client = mqtt.Client()
+        self._client = make_client()
         self._client.on_connect = self._on_connect
         self._client.on_message = self._on_message
+        self._client.on_disconnect = lambda client, userdata, rc: self.outbound.offline()
         self._connected = threading.Event()
         self._lock = threading.Lock()
+        self.outbound = OutboundPublisher(self._client, stats=stats, name="dome", outbox=open_outbox("dome"))
 
     def start(self):
         try:
@@ -254,6 +316,7 @@ class DomeMqttClient:
             log.exception("Не удалось запустить loop_start")
 
     def stop(self):
+        self.outbound.close()
         try:
             self._client.loop_stop()
         except Exception:
@@ -265,112 +328,113 @@ class DomeMqttClient:
 
     def _on_connect(self, client, userdata, flags, rc):
         log.info("MQTT connected rc=%s", rc)
-        if not self._topic_map:
+        self.outbound.replay()
+        topics = self._decoders.topics()
+        if not topics:
             return
-        subs = [(topic, 0) for topic in self._topic_map]
         try:
-            client.subscribe(subs)
-            log.info("Subscribed to %s", ", ".join(self._topic_map.keys()))
+            client.subscribe([(topic, 0) for topic in topics])
+            log.info("Subscribed to %s", ", ".join(topics))
         except Exception:
             log.exception("Subscribe failed")
 
-    def _parse_payload(self, msg):
-        try:
-            text = msg.payload.decode("utf-8", errors="ignore")
-        except Exception:
-            return ""
-        try:
-            return json.loads(text)
-        except Exception:
-            return (text or "").strip()
-
     def _on_message(self, client, userdata, msg):
-        kind = self._topic_map.get(msg.topic, "raw")
-        payload = self._parse_payload(msg)
-        event = {"kind": kind, "payload": payload, "topic": msg.topic}
+        event = self._decoders.decode(msg.topic, msg.payload)
+        if event is None:
+            return
         try:
-            self._queue.put_nowait(event)
+            self._sink(event)
         except queue.Full:
-            log.warning("Очередь переполнена, отбрасываем событие %s", kind)
+            log.warning("Очередь переполнена, отбрасываем событие %s", event.kind)
 
     def publish_super(self, payload: str) -> bool:
+        """Queue the event for the super topic; the GUI thread does not wait for PUBACK."""
         if not self._super_topic or not payload:
             return False
-        try:
-            info = self._client.publish(self._super_topic, payload, qos=1, retain=False)
-            info.wait_for_publish(timeout=2.0)
-            log.info("Опубликовано событие '%s' в %s", payload, self._super_topic)
-            return True
-        except Exception:
-            log.exception("Не удалось опубликовать '%s' в %s", payload, self._super_topic)
-            return False
+        return self.outbound.publish(self._super_topic, payload, tag=payload, durable=True)
 
 
-def run(dome_id: str):
-    app = QApplication(sys.argv)
-    event_queue = queue.Queue()
+def create_hosted_mode(argv=None) -> HostedMode:
+    args = parse_args(argv)
+    dome_id = (args.dome_id or str(DEFAULT_DOME_ID)).strip() or DEFAULT_DOME_ID
 
-    topic_map = {}
     hit_topic = f"arena/point/{ID}/hit"
     state_topic = f"arena/dome/{dome_id}/state"
-    topic_map[state_topic] = "dome_state"
-    topic_map[hit_topic] = "hit"
-
-    mqtt_client = DomeMqttClient(BROKER, PORT, topic_map, event_queue, super_topic=SUPER_TOPIC)
-    mqtt_client.start()
 
-    engine = QQmlApplicationEngine()
-    context = engine.rootContext()
-
-    backend = DomeDisplayBackend(dome_id, DEFAULT_HP_MAX)
-    backend.reset_hp(DEFAULT_HP_MAX)
-    context.setContextProperty("domeBackend", backend)
-    qml_file = QML_DISPLAY
-
-    engine.load(QUrl.fromLocalFile(str(qml_file)))
-    if not engine.rootObjects():
-        log.error("Не удалось загрузить QML %s", qml_file)
-        mqtt_client.stop()
-        sys.exit(-1)
-
-    def drain_events():
-        while True:
-            try:
-                event = event_queue.get_nowait()
-            except queue.Empty:
-                break
-            payload = event.get("payload") or {}
-            kind = event.get("kind")
+    backend = DomeDisplayBackend(dome_id, DEFAULT_HP_MAX, DamageLedger(LEDGER_PATH))
+    # после падения дисплея продолжаем ту же игру, иначе — новая
+    if not (LEDGER_PATH and backend.restore_from_ledger(LEDGER_RESUME_SEC)):
+        backend.reset_hp(DEFAULT_HP_MAX)
+    mqtt_client = None
+    stats, stats_publisher = metrics.mode_metrics("dome")
+    hits_total = stats.counter("hits_total", "Hits applied to the dome")
+    hit_latency = stats.histogram("hit_latency_ms", "Hit receive -> HP applied, ms")
+    # попадание — обычно просто "red", но принимаем и {"team": ...}
+    decoders = (PayloadDecoders(stats)
+                .add(state_topic, "dome_state", JSON, check=lambda state: isinstance(state, dict))
+                .add(hit_topic, "hit", AUTO))
+
+    def flush_hits(teams, received):
+        # все попадания пачки — одним обновлением состояния и одной волной сигналов
+        destroyed_now, winner = backend.apply_hits(teams, HIT_DAMAGE)
+        hits_total.inc(len(teams))
+        now = time.monotonic()
+        for at in received:
+            hit_latency.observe((now - at) * 1000.0)
+        if destroyed_now:
+            # без лидера (попадания без команды) — купол разрушила команда последнего попадания
+            event_team = winner or teams[-1]
+            mqtt_client.publish_super(f"dome_destroyed_{event_team}_{dome_id}")
+            for team, row in backend.damage_breakdown().items():
+                log.info("📊 %s: попаданий %s, урон %s", team, row["hits"], row["damage"])
+
+    def handle_events(events):
+        teams, received = [], []
+        for event in events:
+            payload = event.value
+            kind = event.kind
             if kind == "dome_state":
-                backend.apply_state(payload)
+                # состояние от сервера применяется поверх уже пришедших попаданий
+                if teams:
+                    flush_hits(teams, received)
+                    teams, received = [], []
+                backend.apply_state(payload, record=True)
             elif kind == "hit":
                 team = ""
                 if isinstance(payload, str):
-                    team = payload.strip().lower()
+                    team = payload  # токен уже без пробелов и в нижнем регистре
                 elif isinstance(payload, dict):
                     team = str(payload.get("team") or payload.get("value") or payload.get("raw") or "").strip().lower()
                 if team:
-                    destroyed_now, winner = backend.apply_hit(team, HIT_DAMAGE)
-                    if destroyed_now:
-                        event_team = winner or team
-                        event_payload = f"dome_destroyed_{event_team}_{dome_id}"
-                        mqtt_client.publish_super(event_payload)
-
-    timer = QTimer()
-    timer.setInterval(50)
-    timer.timeout.connect(drain_events)
-    timer.start()
-
-    exit_code = 0
-    try:
-        exit_code = app.exec()
-    finally:
-        timer.stop()
+                    teams.append(team)
+                    received.append(event.received_at)
+        if teams:
+            flush_hits(teams, received)
+
+    event_sink, timer, queue_depth = make_event_source(handle_events, EVENT_POLL_MS)
+    stats.gauge("event_queue_depth", "MQTT events waiting for the GUI thread", fn=queue_depth)
+    mqtt_client = DomeMqttClient(BROKER, PORT, decoders, event_sink, super_topic=SUPER_TOPIC, stats=stats)
+    mqtt_client.start()
+
+    def on_loaded(root):
+        if timer is not None:
+            timer.start()
+
+    def on_stop():
+        if timer is not None:
+            timer.stop()
+        if stats_publisher is not None:
+            stats_publisher.stop()
         mqtt_client.stop()
-    sys.exit(exit_code)
+        backend.close()
+
+    return HostedMode(
+        qml_file=QML_DISPLAY,
+        context={"domeBackend": backend},
+        on_loaded=on_loaded,
+        on_stop=on_stop,
+    )
 
 
 if __name__ == "__main__":
-    args = parse_args()
-    dome_id = (args.dome_id or str(DEFAULT_DOME_ID)).strip() or DEFAULT_DOME_ID
-    run(dome_id)
+    sys.exit(run_standalone(create_hosted_mode))
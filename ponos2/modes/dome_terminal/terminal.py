@@ -1,22 +1,27 @@
 import argparse
 import json
-import logging
 import queue
 import sys
 import threading
 import time
 from pathlib import Path
 
-import paho.mqtt.client as mqtt
-from PySide6.QtCore import QObject, Property, QTimer, QUrl, Signal, Slot
-from PySide6.QtQml import QQmlApplicationEngine
-from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QObject, Property, Signal, Slot
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 import config as _cfg
+from countdown import Countdown
+from event_pump import make_event_source
+import fastlog
+import metrics
+from mode_host import HostedMode, run_standalone
+from mqtt_bus import make_client
+from outbound import OutboundPublisher
+from outbox import Deduper, open_outbox
+from payloads import AUTO, PayloadDecoders, encode_bonus
 
 ID = getattr(_cfg, "ID")
 BROKER = getattr(_cfg, "BROKER")
@@ -27,19 +32,20 @@ DEFAULT_TIMEOUT = getattr(_cfg, "DOME_TIMEOUT_SEC", 45)
 TEAM_NAME_OVERRIDES = getattr(_cfg, "DOME_TEAM_NAMES", {}) or {}
 TEAM_COLORS = getattr(_cfg, "DOME_TEAM_COLORS", {}) or {}
 SUPER_TOPIC = getattr(_cfg, "SUPER_TOPIC", "arena/supertopic") or "arena/supertopic"
+EVENT_POLL_MS = int(getattr(_cfg, "MODE_EVENT_POLL_MS", 0) or 0)
+BINARY_PAYLOADS = bool(getattr(_cfg, "BINARY_PAYLOADS", False))
 
 MODE_DIR = Path(__file__).resolve().parent
 QML_TERMINAL = MODE_DIR / "dome_terminal.qml"
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
-log = logging.getLogger("dome_terminal")
+log = fastlog.setup("dome_terminal")
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Терминал купола: выбор награды")
     parser.add_argument("--terminal-id", help="идентификатор терминала выбора")
     parser.add_argument("--default-choice", choices=["keep_ammo", "super_shots"], help="вариант по умолчанию")
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 class BonusTerminalBackend(QObject):
@@ -56,11 +62,10 @@ class BonusTerminalBackend(QObject):
         self._team_label = ""
         self._team_color = TEAM_COLORS.get("default", "#50d2ff")
         self._dome_id = ""
-        self._countdown = 0
         self._timeout_total = DEFAULT_TIMEOUT
-        self._timer = QTimer()
-        self._timer.setInterval(1000)
-        self._timer.timeout.connect(self._tick)
+        self._countdown = Countdown(self)
+        self._countdown.changed.connect(self.countdownChanged)
+        self._countdown.expired.connect(self._on_expired)
         self._selected_choice = ""
         self._default_choice = default_choice
         self._auto_selected = False
@@ -88,7 +93,7 @@ class BonusTerminalBackend(QObject):
 
     @Property(int, notify=countdownChanged)
     def countdownSeconds(self):
-        return int(self._countdown)
+        return self._countdown.remaining
 
     @Property(bool, notify=stateChanged)
     def selectionEnabled(self):
@@ -129,41 +134,29 @@ class BonusTerminalBackend(QObject):
             self._default_choice = default_choice
         self._selected_choice = ""
         self._auto_selected = False
-        self._countdown = self._timeout_total
         self._info_text = "Выберите награду для команды"
         self._state = "selection"
         self.stateChanged.emit()
         self.choiceChanged.emit()
-        self.countdownChanged.emit()
-        if not self._timer.isActive():
-            self._timer.start()
+        self._countdown.start(self._timeout_total)
         log.info("Терминал активирован: team=%s dome=%s timeout=%s", self._team, self._dome_id, timeout)
 
     def reset_idle(self):
-        self._timer.stop()
         self._state = "idle"
         self._team = ""
         self._team_label = ""
         self._selected_choice = ""
         self._info_text = "Ожидание команды"
-        self._countdown = 0
+        self._countdown.reset()
         self.stateChanged.emit()
         self.choiceChanged.emit()
-        self.countdownChanged.emit()
 
-    def _tick(self):
+    def _on_expired(self):
         if self._state != "selection":
-            self._timer.stop()
             return
-        self._countdown -= 1
-        if self._countdown < 0:
-            self._countdown = 0
-        self.countdownChanged.emit()
-        if self._countdown == 0:
-            self._timer.stop()
-            self._auto_selected = True
-            self.choiceChanged.emit()
-            self._select_choice(self._default_choice, auto=True)
+        self._auto_selected = True
+        self.choiceChanged.emit()
+        self._select_choice(self._default_choice, auto=True)
 
     def _publish_choice(self, choice_key: str, auto: bool) -> bool:
         payload = {
@@ -187,16 +180,29 @@ class BonusTerminalBackend(QObject):
             return
         if self._state not in ("selection",) and not auto:
             return
-        self._timer.stop()
-        sent = self._publish_choice(choice_key, auto)
+        self._state = "locked"  # раньше остановки: expired после неё придёт уже к выбранному терминалу
+        self._countdown.stop()
+        queued = self._publish_choice(choice_key, auto)
         self._selected_choice = choice_key
-        self._state = "locked"
-        self._info_text = "Выбор отправлен" if sent else "Ошибка отправки, сообщите инструктору"
-        if auto:
-            self._info_text = "Выбор по умолчанию отправлен"
+        self._info_text = "Отправка выбора…" if queued else "Ошибка отправки, сообщите инструктору"
         self.choiceChanged.emit()
         self.stateChanged.emit()
-        log.info("Выбор сделан: %s (auto=%s, sent=%s)", choice_key, auto, sent)
+        log.info("Выбор сделан: %s (auto=%s, queued=%s)", choice_key, auto, queued)
+
+    def confirm_choice(self, sent: bool, retrying: bool = False):
+        """Delivery result of the choice published in ``_select_choice``.
+
+        ``retrying`` — not delivered yet, but still journalled and sent again after the reconnect.
+        """
+        if self._state != "locked":
+            return
+        if not sent:
+            self._info_text = "Повторная отправка выбора…" if retrying else "Ошибка отправки, сообщите инструктору"
+        elif self._auto_selected:
+            self._info_text = "Выбор по умолчанию отправлен"
+        else:
+            self._info_text = "Выбор отправлен"
+        self.choiceChanged.emit()
 
     @Slot()
     def chooseKeep(self):
@@ -214,14 +220,19 @@ class BonusTerminalBackend(QObject):
 
 
 class TerminalMqttClient:
-    def __init__(self, broker, port, event_queue, super_topic: str):
+    def __init__(self, broker, port, event_sink, super_topic: str, stats=None):
         self._broker = broker
         self._port = port
-        self._queue = event_queue
+        self._sink = event_sink  # EventPump.post или queue.put_nowait — вызывается из потока paho
         self._super_topic = super_topic
-        self._client = mqtt.Client()
+        # в супертопике и JSON-команды, и простые токены (dome_destroyed_...)
+        self._decoders = PayloadDecoders(stats).add(super_topic, "super", AUTO)
+        self._client = make_client()
         self._client.on_connect = self._on_connect
         self._client.on_message = self._on_message
+        self._client.on_disconnect = lambda client, userdata, rc: self.outbound.offline()
+        self.outbound = OutboundPublisher(self._client, stats=stats, name="terminal", outbox=open_outbox("terminal"))
+        self._dedup = Deduper()  # повтор события после переподключения отправителя — с тем же id
 
     def start(self):
         try:
@@ -231,6 +242,7 @@ class TerminalMqttClient:
             log.exception("MQTT подключение не удалось")
 
     def stop(self):
+        self.outbound.close()
         try:
             self._client.loop_stop()
         except Exception:
@@ -242,93 +254,96 @@ class TerminalMqttClient:
 
     def _on_connect(self, client, userdata, flags, rc):
         log.info("MQTT connected rc=%s", rc)
+        self.outbound.replay()
         try:
             client.subscribe(self._super_topic)
             log.info("Subscribed to %s", self._super_topic)
         except Exception:
             log.exception("Subscribe failed")
 
-    def _parse_payload(self, msg):
-        try:
-            text = msg.payload.decode("utf-8", errors="ignore")
-        except Exception:
-            return ""
-        try:
-            return json.loads(text)
-        except Exception:
-            return (text or "").strip()
-
     def _on_message(self, client, userdata, msg):
-        payload = self._parse_payload(msg)
-        event = {"payload": payload, "topic": msg.topic}
+        event = self._decoders.decode(msg.topic, msg.payload)
+        if event is None or not isinstance(event.value, dict):
+            return  # терминалу нужны только JSON-команды, токены GUI-поток не будят
+        if self._dedup.seen(event.value.get("id")):
+            return
         try:
-            self._queue.put_nowait(event)
+            self._sink(event)
         except queue.Full:
             log.warning("Очередь переполнена, отбрасываем событие из %s", msg.topic)
 
     def publish_super(self, payload: dict) -> bool:
+        """Queue ``payload`` for the super topic, tagged with its ``type``; False if it was not queued."""
         if not payload:
             return False
-        try:
-            body = json.dumps(payload, ensure_ascii=False)
-        except Exception:
-            log.exception("Не удалось сериализовать payload")
-            return False
-        try:
-            info = self._client.publish(self._super_topic, body, qos=1, retain=False)
-            info.wait_for_publish(timeout=2.0)
-            log.info("Опубликовано событие '%s' в %s", body, self._super_topic)
-            return True
-        except Exception:
-            log.exception("Ошибка публикации в %s", self._super_topic)
-            return False
-
-
-def run(terminal_id: str, default_choice: str):
-    app = QApplication(sys.argv)
-    event_queue = queue.Queue()
-
-    mqtt_client = TerminalMqttClient(BROKER, PORT, event_queue, SUPER_TOPIC)
-    mqtt_client.start()
+        body = encode_bonus(payload) if BINARY_PAYLOADS else None
+        if body is None:
+            try:
+                body = json.dumps(payload, ensure_ascii=False)
+            except Exception:
+                log.exception("Не удалось сериализовать payload")
+                return False
+        return self.outbound.publish(self._super_topic, body, tag=str(payload.get("type") or ""), durable=True)
 
-    engine = QQmlApplicationEngine()
-    context = engine.rootContext()
-    backend = BonusTerminalBackend(terminal_id, mqtt_client.publish_super, default_choice)
-    context.setContextProperty("terminalBackend", backend)
-    engine.load(QUrl.fromLocalFile(str(QML_TERMINAL)))
-    if not engine.rootObjects():
-        log.error("Не удалось загрузить QML %s", QML_TERMINAL)
-        mqtt_client.stop()
-        sys.exit(-1)
 
-    def drain_events():
-        while True:
-            try:
-                event = event_queue.get_nowait()
-            except queue.Empty:
-                break
-            payload = event.get("payload") or {}
-            if isinstance(payload, dict) and str(payload.get("type") or "").lower() == "bonus_activate":
+def create_hosted_mode(argv=None) -> HostedMode:
+    args = parse_args(argv)
+    terminal_id = (args.terminal_id or str(DEFAULT_TERMINAL_ID)).strip() or DEFAULT_TERMINAL_ID
+    default_choice = (args.default_choice or str(DEFAULT_CHOICE)).strip() or DEFAULT_CHOICE
+    mqtt_client = None
+    backend = None
+    stats, stats_publisher = metrics.mode_metrics("dome_terminal")
+    activations = stats.counter("activations_total", "bonus_activate events for this terminal")
+    activation_latency = stats.histogram("activation_latency_ms", "Activation receive -> terminal shown, ms")
+
+    def handle_events(events):
+        for event in events:
+            payload = event.value
+            if str(payload.get("type") or "").lower() == "bonus_activate":
                 tid = str(payload.get("terminal_id") or payload.get("terminalId") or "").strip()
                 if not tid or tid == terminal_id:
                     backend.activate(payload)
+                    activations.inc()
+                    activation_latency.observe((time.monotonic() - event.received_at) * 1000.0)
 
-    timer = QTimer()
-    timer.setInterval(50)
-    timer.timeout.connect(drain_events)
-    timer.start()
+    event_sink, timer, queue_depth = make_event_source(handle_events, EVENT_POLL_MS)
+    stats.gauge("event_queue_depth", "MQTT events waiting for the GUI thread", fn=queue_depth)
+    mqtt_client = TerminalMqttClient(BROKER, PORT, event_sink, SUPER_TOPIC, stats)
+    backend = BonusTerminalBackend(terminal_id, mqtt_client.publish_super, default_choice)
+
+    # результат доставки приходит в GUI-поток сигналами OutboundPublisher
+    def on_delivered(tag, latency_ms):
+        if tag == "bonus_choice":
+            backend.confirm_choice(True)
+
+    def on_failed(tag, reason):
+        if tag == "bonus_choice":
+            # выбор остался в журнале — после переподключения придёт delivered с тем же тегом
+            backend.confirm_choice(False, retrying=mqtt_client.outbound.journalled(tag))
+
+    mqtt_client.outbound.delivered.connect(on_delivered)
+    mqtt_client.outbound.failed.connect(on_failed)
+    mqtt_client.start()
 
-    exit_code = 0
-    try:
-        exit_code = app.exec()
-    finally:
-        timer.stop()
+    def on_loaded(root):
+        if timer is not None:
+            timer.start()
+
+    def on_stop():
+        if timer is not None:
+            timer.stop()
+        if stats_publisher is not None:
+            stats_publisher.stop()
+        backend.reset_idle()
         mqtt_client.stop()
-    sys.exit(exit_code)
+
+    return HostedMode(
+        qml_file=QML_TERMINAL,
+        context={"terminalBackend": backend},
+        on_loaded=on_loaded,
+        on_stop=on_stop,
+    )
 
 
 if __name__ == "__main__":
-    args = parse_args()
-    terminal_id = (args.terminal_id or str(DEFAULT_TERMINAL_ID)).strip() or DEFAULT_TERMINAL_ID
-    default_choice = (args.default_choice or str(DEFAULT_CHOICE)).strip() or DEFAULT_CHOICE
-    run(terminal_id, default_choice)
+    sys.exit(run_standalone(create_hosted_mode))
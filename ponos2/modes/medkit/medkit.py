@@ -1,68 +1,194 @@
+import queue
 import sys
+import threading
 import time
-import multiprocessing
 from pathlib import Path
 
-import paho.mqtt.client as mqtt
-from PySide6.QtCore import QUrl
-from PySide6.QtWidgets import QApplication
-from PySide6.QtQml import QQmlApplicationEngine
+from PySide6.QtCore import QObject, Property, Signal, Slot
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+import config as _cfg
 from config import ID, BROKER, PORT, USER
+import fastlog
+import metrics
+from mode_host import HostedMode, run_standalone
+from mqtt_bus import make_client
+
+log = fastlog.setup("medkit")
 
 ASSET_BG = str(PROJECT_ROOT / "assets" / "medkit.jpg")
 MODE_DIR = Path(__file__).resolve().parent
 
-# --- Функция отправки MQTT-сообщения в отдельном процессе ---
-def send_message_proc(s: str = "heal"):
-    TOPIC = f"arena/point/{ID}/action"
-    client = mqtt.Client()
-    try:
-        client.connect(BROKER, PORT, 60)
-        client.loop_start()
-        client.publish(TOPIC, s)
-        time.sleep(0.05)  # минимальная пауза
-    finally:
+ACTION_TOPIC = f"arena/point/{ID}/action"
+HEAL_PAYLOAD = "heal"
+MAX_PENDING = int(getattr(_cfg, "MEDKIT_MAX_PENDING", 64))
+COALESCE = bool(getattr(_cfg, "MEDKIT_COALESCE", False))
+ACK_TIMEOUT = 2.0
+
+
+class HealPublisher(QObject):
+    """Persistent publisher for heal taps.
+
+    Taps go into a bounded queue drained by one worker thread that owns a single
+    MQTT client (QoS 1). With ``coalesce`` a burst queued between two drains is
+    sent as one ``heal:<count>`` message. Acknowledgements come back to QML via
+    ``healDelivered``/``healFailed`` and the counters below.
+    """
+
+    healDelivered = Signal(int, float)   # сколько лечений подтверждено, задержка тап→PUBACK, мс
+    healFailed = Signal(int)             # сколько лечений потеряно (очередь полна / нет подтверждения)
+    countersChanged = Signal()
+
+    def __init__(self, topic: str = ACTION_TOPIC, payload: str = HEAL_PAYLOAD,
+                 max_pending: int = MAX_PENDING, coalesce: bool = COALESCE, client=None,
+                 stats: metrics.Registry | None = None):
+        super().__init__()
+        self._topic = topic
+        self._payload = payload
+        self._coalesce = coalesce
+        self._queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._delivered = 0
+        self._failed = 0
+        self._last_latency_ms = 0.0
+        self._counters_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        stats = stats if stats is not None else metrics.Registry()
+        self._publish_ms = stats.histogram("heal_publish_ms", "Heal tap -> PUBACK, ms")
+        self._delivered_total = stats.counter("heals_delivered_total", "Heals acknowledged by the broker")
+        self._failed_total = stats.counter("heals_failed_total", "Heals dropped or not acknowledged")
+        stats.gauge("heal_pending", "Heals queued for publishing", fn=self._queue.qsize)
+
+        self._client = client if client is not None else make_client()
+        try:
+            self._client.connect(BROKER, PORT, 60)
+        except Exception as e:
+            log.warning("[MQTT] Connect error: %s", e)
+        self._client.loop_start()
+
+        self._worker = threading.Thread(target=self._run, name="heal-publisher", daemon=True)
+        self._worker.start()
+
+    @Property(int, notify=countersChanged)
+    def pendingCount(self):
+        return self._queue.qsize()
+
+    @Property(int, notify=countersChanged)
+    def deliveredCount(self):
+        return self._delivered
+
+    @Property(int, notify=countersChanged)
+    def failedCount(self):
+        return self._failed
+
+    @Property(float, notify=countersChanged)
+    def lastLatencyMs(self):
+        return self._last_latency_ms
+
+    @Slot()
+    def heal(self):
+        """Queue one heal from QML or the click handler."""
+        self.enqueue()
+
+    def enqueue(self) -> bool:
+        """Queue one heal; never blocks the GUI thread. False if the queue is full."""
+        try:
+            self._queue.put_nowait(time.perf_counter())
+        except queue.Full:
+            with self._counters_lock:
+                self._failed += 1
+            self._failed_total.inc()
+            self.healFailed.emit(1)
+            self.countersChanged.emit()
+            return False
+        self.countersChanged.emit()
+        return True
+
+    def _drain(self):
         try:
-            client.loop_stop()
-            client.disconnect()
+            batch = [self._queue.get(timeout=0.25)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain()
+            if not batch:
+                continue
+            if self._coalesce:
+                body = self._payload if len(batch) == 1 else f"{self._payload}:{len(batch)}"
+                sent = [(self._client.publish(self._topic, body, qos=1), batch)]
+            else:
+                # публикуем всю пачку сразу, подтверждения ждём после — paho отправляет их конвейером
+                sent = [(self._client.publish(self._topic, self._payload, qos=1), [tap]) for tap in batch]
+            for info, taps in sent:
+                try:
+                    info.wait_for_publish(timeout=ACK_TIMEOUT)
+                    ok = info.is_published()
+                except Exception:
+                    ok = False
+                if ok:
+                    latency_ms = (time.perf_counter() - taps[0]) * 1000.0
+                    with self._counters_lock:
+                        self._delivered += len(taps)
+                        self._last_latency_ms = latency_ms
+                    self._delivered_total.inc(len(taps))
+                    self._publish_ms.observe(latency_ms)
+                    self.healDelivered.emit(len(taps), latency_ms)
+                else:
+                    with self._counters_lock:
+                        self._failed += len(taps)
+                    self._failed_total.inc(len(taps))
+                    self.healFailed.emit(len(taps))
+            self.countersChanged.emit()
+
+    def close(self):
+        self._stop.set()
+        self._worker.join(timeout=1.0)
+        try:
+            self._client.loop_stop()
+            self._client.disconnect()
         except Exception:
             pass
 
-def send_message_async(s="heal"):
-    p = multiprocessing.Process(target=send_message_proc, args=(s,))
-    p.start()
-    p.join(0.01)  # не блокируем интерфейс
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    engine = QQmlApplicationEngine()
-    engine.rootContext().setContextProperty("backgroundPath", ASSET_BG)
-    engine.rootContext().setContextProperty("USER", USER)
+def create_hosted_mode(argv=None) -> HostedMode:
+    stats, stats_publisher = metrics.mode_metrics("medkit")
+    publisher = HealPublisher(stats=stats)
 
-    qml_file = MODE_DIR / "medkit.qml"
-    engine.load(QUrl.fromLocalFile(str(qml_file)))
+    def on_stop():
+        if stats_publisher is not None:
+            stats_publisher.stop()
+        publisher.close()
 
-    if not engine.rootObjects():
-        print("Ошибка загрузки QML")
-        sys.exit(-1)
+    def on_loaded(root):
+        # --- Подключение сигнала ---
+        def on_medkit_click():
+            # Анимация через QML
+            if hasattr(root, "animateMedkit"):
+                root.animateMedkit()
+            publisher.heal()
 
-    root = engine.rootObjects()[0]
+        try:
+            root.medkitActivated.connect(on_medkit_click)
+        except Exception as e:
+            log.warning("Не удалось подключиться к сигналу medkitActivated: %s", e)
 
-    # --- Подключение сигнала ---
-    def on_medkit_click():
-        # Анимация через QML
-        if hasattr(root, "animateMedkit"):
-            root.animateMedkit()
-        send_message_async()  # отправка в отдельном процессе
+    return HostedMode(
+        qml_file=MODE_DIR / "medkit.qml",
+        context={"backgroundPath": ASSET_BG, "USER": USER, "healPublisher": publisher},
+        on_loaded=on_loaded,
+        on_stop=on_stop,
+    )
 
-    try:
-        root.medkitActivated.connect(on_medkit_click)
-    except Exception as e:
-        print("Не удалось подключиться к сигналу medkitActivated:", e)
 
-    sys.exit(app.exec())
+if __name__ == "__main__":
+    sys.exit(run_standalone(create_hosted_mode))
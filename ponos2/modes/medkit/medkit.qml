@@ -521,6 +521,16 @@ Window {
                 Text { text: "ИНФО"; color: neonAmber; font.family: "Roboto Mono"; font.pixelSize: dp(12); font.bold: true }
                 Text { text: "Общий статус: стабильный"; color: hudText; font.family: "Roboto Mono"; font.pixelSize: dp(12) }
                 Text { text: userName ? "USER: " + userName : "USER: не задан"; color: hudMuted; font.family: "Roboto Mono"; font.pixelSize: dp(11) }
+                Text {
+                    // подтверждения доставки лечений от брокера (healPublisher из Python)
+                    readonly property bool linked: typeof healPublisher !== "undefined" && healPublisher !== null
+                    text: !linked ? "СВЯЗЬ: нет"
+                          : "ДОСТАВЛЕНО: " + healPublisher.deliveredCount
+                            + (healPublisher.pendingCount > 0 ? "  В ОЧЕРЕДИ: " + healPublisher.pendingCount : "")
+                            + (healPublisher.failedCount > 0 ? "  ПОТЕРЯНО: " + healPublisher.failedCount : "")
+                    color: linked && healPublisher.failedCount > 0 ? cAlarm : hudMuted
+                    font.family: "Roboto Mono"; font.pixelSize: dp(11)
+                }
             }
         }
     }
@@ -1,15 +1,14 @@
 import sys
 from pathlib import Path
 
-from PySide6.QtCore import QObject, Signal, Property, QUrl
-from PySide6.QtWidgets import QApplication
-from PySide6.QtQml import QQmlApplicationEngine
+from PySide6.QtCore import QObject, Signal, Property
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from config import ID, BROKER, PORT  # noqa: F401 - параметры могут пригодиться в QML
+from mode_host import HostedMode, run_standalone
 
 
 # если хочешь, положи сюда своё изображение и используй в QML, сейчас не нужно
@@ -33,23 +32,16 @@ class Backend(QObject):
 
     ID = Property(str, getID, setID, notify=IDChanged)
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    engine = QQmlApplicationEngine()
 
+def create_hosted_mode(argv=None) -> HostedMode:
     backend = Backend()
     # пример: можно изменить ID перед запуском:
     # backend.setID("student42")
 
-    engine.rootContext().setContextProperty("backend", backend)
     # если позже захочешь, можно пробросить backgroundPath или другие свойства:
-    # engine.rootContext().setContextProperty("backgroundPath", ASSET_BG)
-
-    qml_file = MODE_DIR / "wait.qml"
-    engine.load(QUrl.fromLocalFile(str(qml_file)))
+    # context["backgroundPath"] = ASSET_BG
+    return HostedMode(qml_file=MODE_DIR / "wait.qml", context={"backend": backend})
 
-    if not engine.rootObjects():
-        print("Ошибка загрузки QML")
-        sys.exit(-1)
 
-    sys.exit(app.exec())
+if __name__ == "__main__":
+    sys.exit(run_standalone(create_hosted_mode))
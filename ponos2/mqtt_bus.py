@@ -0,0 +1,531 @@
+# mqtt_bus.py
+"""Local relay that lets modes share the supervisor's single MQTT connection.
+
+The supervisor owns the only broker connection and runs ``BusServer`` on a Unix
+socket; the socket path is exported to children via ``PONOS_MQTT_BUS``. Modes
+call ``make_client()`` instead of ``mqtt.Client()``: it returns a ``BusClient``
+with a paho-compatible subset of the API (``on_connect``/``on_message``,
+``subscribe``, ``publish(...).wait_for_publish()``, ``loop_start``/``loop_forever``)
+that is already connected, or a plain ``mqtt.Client`` when no bus is available.
+
+Frames in both directions are ``FRAME_HEADER`` followed by topic and payload.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Set, Tuple
+
+import paho.mqtt.client as mqtt
+
+from topic_router import TopicRouter
+
+log = logging.getLogger(__name__)
+
+BUS_ENV = "PONOS_MQTT_BUS"
+
+# type, flags (qos | retain<<2 | rc), seq, topic length, payload length
+FRAME_HEADER = struct.Struct("!BBIHI")
+
+F_SUB = 1
+F_UNSUB = 2
+F_PUB = 3
+F_MSG = 4
+F_ACK = 5
+F_CONNECTED = 6
+F_DISCONNECTED = 7
+
+OUTBOUND_LIMIT = 1000
+EARLY_ACK_LIMIT = 256
+
+
+def _pack(ftype: int, flags: int = 0, seq: int = 0, topic: str = "", payload: bytes = b"") -> bytes:
+    raw_topic = topic.encode("utf-8")
+    return FRAME_HEADER.pack(ftype, flags, seq, len(raw_topic), len(payload)) + raw_topic + payload
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("bus closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def _read_frame(sock: socket.socket) -> Tuple[int, int, int, str, bytes]:
+    ftype, flags, seq, tlen, plen = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    topic = _recv_exact(sock, tlen).decode("utf-8", errors="ignore") if tlen else ""
+    payload = _recv_exact(sock, plen) if plen else b""
+    return ftype, flags, seq, topic, payload
+
+
+def _to_bytes(payload) -> bytes:
+    if payload is None:
+        return b""
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    return str(payload).encode("utf-8")
+
+
+def default_socket_path(point_id: str) -> str:
+    return os.path.join("/tmp", f"ponos_mqtt_{point_id}.sock")
+
+
+# ---------------------------------------------------------------- supervisor side
+
+class _Conn:
+    def __init__(self, server: "BusServer", sock: socket.socket) -> None:
+        self.server = server
+        self.sock = sock
+        self.subs: Set[str] = set()
+        self.dropped = 0
+        self._out: queue.Queue = queue.Queue(maxsize=OUTBOUND_LIMIT)
+        self._closed = threading.Event()
+
+    def start(self) -> None:
+        threading.Thread(target=self._read_loop, name="bus-conn-read", daemon=True).start()
+        threading.Thread(target=self._write_loop, name="bus-conn-write", daemon=True).start()
+
+    def send(self, frame: bytes) -> None:
+        try:
+            self._out.put_nowait(frame)
+        except queue.Full:
+            # медленный режим не должен тормозить поток paho супервизора
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                log.warning("⚠️ Шина MQTT: режим не успевает читать, отброшено %s сообщений", self.dropped)
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self._out.put_nowait(b"")
+        except queue.Full:
+            pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _write_loop(self) -> None:
+        while not self._closed.is_set():
+            frame = self._out.get()
+            if not frame:
+                break
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                break
+        self.close()
+
+    def _read_loop(self) -> None:
+        try:
+            while True:
+                ftype, flags, seq, topic, payload = _read_frame(self.sock)
+                if ftype == F_SUB:
+                    self.server._subscribe(self, topic, flags & 0x03)
+                elif ftype == F_UNSUB:
+                    self.server._unsubscribe(self, topic)
+                elif ftype == F_PUB:
+                    self.server._publish(self, seq, topic, payload, flags & 0x03, bool(flags & 0x04))
+        except (ConnectionError, OSError, struct.error):
+            pass
+        finally:
+            self.server._detach(self)
+
+
+class BusServer:
+    """Relays subscriptions/publishes of local modes onto the supervisor's client.
+
+    Mode filters are registered on the supervisor's ``TopicRouter``: the first
+    mode to subscribe a filter adds a handler (and the upstream subscription),
+    the last one to drop it removes them again.
+    """
+
+    def __init__(self, client: mqtt.Client, path: str, router: TopicRouter, registry=None) -> None:
+        self._client = client
+        self._ack_latency = registry.histogram("bus_publish_ack_ms", "Mode publish -> broker ack via the bus, ms") \
+            if registry is not None else None
+        self._path = path
+        self._router = router
+        self._conns: List[_Conn] = []
+        # фильтр -> режимы, подписанные на него, и обработчик в роутере
+        self._subs: Dict[str, Set[_Conn]] = {}
+        self._handlers: Dict[str, Callable] = {}
+        self._pending: Dict[int, Tuple[_Conn, int, float]] = {}
+        self._early: OrderedDict = OrderedDict()  # mid -> True, в порядке прихода
+        self._publishing = 0  # публикаций режимов между client.publish() и записью mid в _pending
+        self._lock = threading.RLock()
+        self._sock: socket.socket | None = None
+        self._connected = False
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def start(self) -> bool:
+        if not hasattr(socket, "AF_UNIX"):
+            log.info("ℹ️ Шина MQTT недоступна на этой платформе, режимы подключатся сами.")
+            return False
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("⚠️ Не удалось удалить старый сокет шины: %s", e)
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(self._path)
+            sock.listen(8)
+        except OSError as e:
+            log.warning("⚠️ Не удалось открыть сокет шины MQTT: %s", e)
+            return False
+        self._sock = sock
+        os.environ[BUS_ENV] = self._path
+        threading.Thread(target=self._accept_loop, name="bus-accept", daemon=True).start()
+        log.info("🔌 Шина MQTT для режимов: %s", self._path)
+        return True
+
+    def stop(self) -> None:
+        os.environ.pop(BUS_ENV, None)
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+        with self._lock:
+            conns = list(self._conns)
+        for conn in conns:
+            conn.close()
+
+    def _accept_loop(self) -> None:
+        while self._sock is not None:
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                break
+            conn = _Conn(self, sock)
+            with self._lock:
+                self._conns.append(conn)
+                connected = self._connected
+            conn.start()
+            if connected:
+                conn.send(_pack(F_CONNECTED))
+
+    def _detach(self, conn: _Conn) -> None:
+        with self._lock:
+            if conn not in self._conns:
+                return
+            self._conns.remove(conn)
+            released = [(t, h) for t in conn.subs if (h := self._release(conn, t)) is not None]
+            conn.subs.clear()
+        for topic, handler in released:
+            self._router.remove(topic, handler)
+        conn.close()
+
+    # --- подписки с подсчётом ссылок (вызовы роутера/paho — вне своей блокировки) ---
+    def _subscribe(self, conn: _Conn, topic: str, qos: int) -> None:
+        with self._lock:
+            if topic in conn.subs:
+                return
+            conn.subs.add(topic)
+            subscribers = self._subs.setdefault(topic, set())
+            subscribers.add(conn)
+            handler = None
+            if len(subscribers) == 1:
+                handler = self._handlers[topic] = self._make_handler(topic)
+        if handler is not None:
+            self._router.add(topic, handler, qos)
+
+    def _unsubscribe(self, conn: _Conn, topic: str) -> None:
+        with self._lock:
+            if topic not in conn.subs:
+                return
+            conn.subs.discard(topic)
+            handler = self._release(conn, topic)
+        if handler is not None:
+            self._router.remove(topic, handler)
+
+    def _release(self, conn: _Conn, topic: str) -> Callable | None:
+        """Drop ``conn`` from ``topic``; returns the router handler once nobody is left."""
+        subscribers = self._subs.get(topic)
+        if subscribers is None:
+            return None
+        subscribers.discard(conn)
+        if subscribers:
+            return None
+        self._subs.pop(topic, None)
+        return self._handlers.pop(topic, None)
+
+    def _make_handler(self, topic_filter: str) -> Callable:
+        def deliver(client, userdata, msg):
+            with self._lock:
+                targets = list(self._subs.get(topic_filter, ()))
+            if not targets:
+                return
+            frame = _pack(F_MSG, flags=(msg.qos & 0x03) | (0x04 if msg.retain else 0), topic=msg.topic, payload=msg.payload)
+            for conn in targets:
+                conn.send(frame)
+        return deliver
+
+    # --- публикации ---
+    def _publish(self, conn: _Conn, seq: int, topic: str, payload: bytes, qos: int, retain: bool) -> None:
+        started = time.monotonic()
+        # publish() вызываем без своей блокировки: paho держит свой мьютекс, когда зовёт on_publish.
+        # Вместо неё — счётчик: пока он не ноль, on_publish запоминает подтверждения без ожидающего
+        with self._lock:
+            self._publishing += 1
+        info = None
+        try:
+            info = self._client.publish(topic, payload, qos=qos, retain=retain)
+        except Exception as e:
+            log.warning("⚠️ Шина MQTT: публикация в %s не удалась: %s", topic, e)
+        with self._lock:
+            self._publishing -= 1
+            done = info is not None and self._early.pop(info.mid, False)
+            if info is not None and seq and not done and (info.rc == mqtt.MQTT_ERR_SUCCESS or qos):
+                self._pending[info.mid] = (conn, seq, started)
+            if not self._publishing:
+                # все, кто мог ждать раннего подтверждения, свои mid уже забрали; остальное — публикации
+                # самого супервизора (пульс, метрики, журнал), после оборота mid оно подтвердило бы чужое
+                self._early.clear()
+        if not seq:
+            return
+        if info is None:
+            conn.send(_pack(F_ACK, flags=mqtt.MQTT_ERR_UNKNOWN, seq=seq))
+        elif info.rc != mqtt.MQTT_ERR_SUCCESS and qos == 0:
+            conn.send(_pack(F_ACK, flags=info.rc & 0xFF, seq=seq))
+        elif done:
+            conn.send(_pack(F_ACK, seq=seq))
+
+    # --- колбэки клиента супервизора ---
+    def on_publish(self, client, userdata, mid) -> None:
+        with self._lock:
+            waiter = self._pending.pop(mid, None)
+            if waiter is None and self._publishing:
+                # подтверждение могло прийти раньше, чем _publish успел запомнить mid
+                self._early[mid] = True
+                while len(self._early) > EARLY_ACK_LIMIT:
+                    self._early.popitem(last=False)  # вытесняем самые старые, свежие ещё ждут своего _publish
+        if waiter is not None:
+            conn, seq, started = waiter
+            conn.send(_pack(F_ACK, seq=seq))
+            if self._ack_latency is not None:
+                self._ack_latency.observe((time.monotonic() - started) * 1000.0)
+
+    def on_upstream_connect(self, rc: int) -> None:
+        """Tell the modes the upstream connection is (back) up; the router resubscribes."""
+        with self._lock:
+            self._connected = rc == 0
+            conns = list(self._conns)
+        if rc != 0:
+            return
+        frame = _pack(F_CONNECTED)
+        for conn in conns:
+            conn.send(frame)
+
+    def on_upstream_disconnect(self) -> None:
+        """Tell the modes the upstream connection dropped (their ``on_disconnect``; the bus itself stays)."""
+        with self._lock:
+            self._connected = False
+            conns = list(self._conns)
+        frame = _pack(F_DISCONNECTED)
+        for conn in conns:
+            conn.send(frame)
+
+
+# ---------------------------------------------------------------- mode side
+
+class BusMessage:
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = 0
+
+
+class BusMessageInfo:
+    """Mirror of ``paho.mqtt.client.MQTTMessageInfo`` for bus publishes."""
+
+    def __init__(self, mid: int, rc: int = mqtt.MQTT_ERR_SUCCESS) -> None:
+        self.mid = mid
+        self.rc = rc
+        self._done = threading.Event()
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            self._done.set()
+
+    def _complete(self, rc: int) -> None:
+        self.rc = rc
+        self._done.set()
+
+    def is_published(self) -> bool:
+        return self._done.is_set() and self.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout: float | None = None) -> None:
+        if self.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise RuntimeError(mqtt.error_string(self.rc))
+        self._done.wait(timeout)
+
+
+class BusClient:
+    """paho-like client speaking to ``BusServer`` over an already-open socket."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock: socket.socket | None = sock
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, BusMessageInfo] = {}
+        self._pending_lock = threading.Lock()
+        self._seq = 0
+        self._thread: threading.Thread | None = None
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+        self.on_publish = None
+        self.userdata = None
+
+    def _send(self, frame: bytes) -> int:
+        sock = self._sock
+        if sock is None:
+            return mqtt.MQTT_ERR_NO_CONN
+        try:
+            with self._send_lock:
+                sock.sendall(frame)
+        except OSError:
+            return mqtt.MQTT_ERR_CONN_LOST
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def _next_seq(self) -> int:
+        with self._pending_lock:
+            self._seq = self._seq % 0xFFFFFFFF + 1
+            return self._seq
+
+    # --- paho API ---
+    def connect(self, host=None, port=None, keepalive=60, *args, **kwargs) -> int:
+        if self._sock is None:
+            raise ConnectionRefusedError("MQTT bus connection is closed")
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def reconnect(self) -> int:
+        return self.connect()
+
+    def loop_start(self) -> int:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._read_loop, name="bus-client", daemon=True)
+            self._thread.start()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self, force=False) -> int:
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            self.disconnect()
+            thread.join(timeout=1.0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_forever(self, *args, **kwargs) -> int:
+        self._read_loop()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self, *args, **kwargs) -> int:
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic, qos=0, *args, **kwargs):
+        items = topic if isinstance(topic, list) else [(topic, qos)]
+        rc = mqtt.MQTT_ERR_SUCCESS
+        for item in items:
+            name, item_qos = (item, qos) if isinstance(item, str) else (item[0], item[1])
+            rc = self._send(_pack(F_SUB, flags=int(item_qos) & 0x03, topic=name)) or rc
+        return rc, self._next_seq()
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        topics = topic if isinstance(topic, list) else [topic]
+        rc = mqtt.MQTT_ERR_SUCCESS
+        for name in topics:
+            rc = self._send(_pack(F_UNSUB, topic=name)) or rc
+        return rc, self._next_seq()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, *args, **kwargs) -> BusMessageInfo:
+        seq = self._next_seq()
+        info = BusMessageInfo(seq)
+        with self._pending_lock:
+            self._pending[seq] = info
+        flags = (int(qos) & 0x03) | (0x04 if retain else 0)
+        rc = self._send(_pack(F_PUB, flags=flags, seq=seq, topic=topic, payload=_to_bytes(payload)))
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            with self._pending_lock:
+                self._pending.pop(seq, None)
+            info._complete(rc)
+        return info
+
+    # --- приём ---
+    def _read_loop(self) -> None:
+        sock = self._sock
+        try:
+            while sock is not None:
+                ftype, flags, seq, topic, payload = _read_frame(sock)
+                if ftype == F_MSG:
+                    if self.on_message is not None:
+                        self.on_message(self, self.userdata, BusMessage(topic, payload, flags & 0x03, bool(flags & 0x04)))
+                elif ftype == F_ACK:
+                    with self._pending_lock:
+                        info = self._pending.pop(seq, None)
+                    if info is not None:
+                        info._complete(flags)
+                        if self.on_publish is not None:
+                            self.on_publish(self, self.userdata, seq)
+                elif ftype == F_CONNECTED:
+                    if self.on_connect is not None:
+                        self.on_connect(self, self.userdata, {}, 0)
+                elif ftype == F_DISCONNECTED:
+                    # брокер пропал у супервизора; шина жива, F_CONNECTED придёт после переподключения
+                    if self.on_disconnect is not None:
+                        self.on_disconnect(self, self.userdata, mqtt.MQTT_ERR_CONN_LOST)
+        except (ConnectionError, OSError, struct.error):
+            pass
+        finally:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for info in pending.values():
+                info._complete(mqtt.MQTT_ERR_CONN_LOST)
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, self.userdata, mqtt.MQTT_ERR_CONN_LOST)
+
+
+def make_client():
+    """Bus client when the supervisor exports a bus, otherwise a direct paho client."""
+    path = os.environ.get(BUS_ENV)
+    if path and hasattr(socket, "AF_UNIX"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+        else:
+            return BusClient(sock)
+    return mqtt.Client()
@@ -0,0 +1,289 @@
+# outbound.py
+"""Publishing from the GUI thread without waiting for the broker.
+
+``client.publish(...).wait_for_publish()`` on the GUI thread freezes the
+screen for as long as the broker takes to answer — and the modes publish
+exactly at the climax (bomb exploded, dome destroyed, bonus chosen).
+``OutboundPublisher`` takes the message into a bounded queue and returns
+at once; one worker thread publishes (QoS 1 by default) and waits for the
+acknowledgements. The result comes back on the GUI thread::
+
+    outbound = OutboundPublisher(client, stats=stats)
+    outbound.delivered.connect(on_delivered)   # (tag, мс от постановки до PUBACK)
+    outbound.failed.connect(on_failed)         # (tag, причина)
+    outbound.publish(SUPER_TOPIC, payload, tag="dome_destroyed")
+
+The client is shared with the caller (paho's ``publish`` is thread-safe,
+so is the bus client); the publisher does not connect or stop it. Metrics
+in ``stats``, labelled ``publisher=<name>``: ``outbound_queue_depth``,
+``publish_ms``, ``outbound_published_total`` and ``outbound_failed_total``.
+
+With an ``outbox.Outbox``, ``publish(..., durable=True)`` journals the
+message first and acknowledges it on PUBACK. The owner calls ``replay()``
+from its ``on_connect`` and ``offline()`` from ``on_disconnect``: journalled
+messages are handed to the client only while it is connected (paho would
+keep them itself and send them after the reconnect, next to the replay),
+and whatever was not acknowledged goes out again after a reconnect or a
+restart, under its original tag — at least once, see ``outbox.py``. A journalled message whose PUBACK does
+not come within ``ack_timeout`` is reported as failed but left to paho,
+which is still delivering it: a late PUBACK acknowledges it in the journal
+and is reported as ``delivered``. It returns to ``replay()`` only if the
+client was replaced or paho gave it up, so a slow broker does not get it
+twice. While ``journalled(tag)`` is True a failure is not final — the
+caller can show "retrying" rather than an error.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+from PySide6.QtCore import QObject, Qt, Signal
+
+import metrics
+from outbox import Outbox
+
+log = logging.getLogger(__name__)
+
+ACK_TIMEOUT = 2.0
+
+
+class Outgoing(NamedTuple):
+    topic: str
+    payload: object       # str или bytes — как для client.publish
+    qos: int
+    retain: bool
+    tag: str
+    queued_at: float      # time.monotonic() при постановке в очередь
+    msg_id: str = ""      # id в журнале отправки (Outbox), если сообщение критичное
+
+
+class OutboundPublisher(QObject):
+    """Bounded publish queue drained by one worker thread; results as GUI-thread signals."""
+
+    delivered = Signal(str, float)   # tag, задержка постановка→PUBACK, мс
+    failed = Signal(str, str)        # tag, причина
+    _finished = Signal(str, float, str)  # из рабочего потока; пустая причина — доставлено
+
+    def __init__(self, client, max_pending: int = 64, ack_timeout: float = ACK_TIMEOUT,
+                 stats: metrics.Registry | None = None, name: str = "outbound",
+                 outbox: Outbox | None = None, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.client = client  # можно заменить после переподключения
+        self._ack_timeout = ack_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._stop = threading.Event()
+        self._outbox = outbox
+        self._inflight: set = set()  # id из журнала, которые уже в очереди или ждут PUBACK
+        self._inflight_lock = threading.Lock()
+        self._online = threading.Event()  # между replay() и offline()
+        self._late: list = []  # (item, info, client): PUBACK не пришёл за ack_timeout, paho ещё доставляет
+        self.last_latency_ms = 0.0
+
+        stats = stats if stats is not None else metrics.Registry()
+        self._publish_ms = stats.histogram("publish_ms", "Outbound publish queued -> PUBACK, ms", publisher=name)
+        self._published_total = stats.counter("outbound_published_total", "Outbound messages acknowledged",
+                                              publisher=name)
+        self._failed_total = stats.counter("outbound_failed_total", "Outbound messages dropped or not acknowledged",
+                                           publisher=name)
+        stats.gauge("outbound_queue_depth", "Outbound messages waiting for the worker", fn=self._queue.qsize,
+                    publisher=name)
+        if outbox is not None:
+            stats.gauge("outbox_pending", "Journalled messages not acknowledged yet", fn=outbox.__len__,
+                        publisher=name)
+
+        # сигналы наружу — всегда в потоке владельца, даже если слушатель не QObject
+        self._finished.connect(self._report, Qt.QueuedConnection)
+        self._worker = threading.Thread(target=self._run, name=f"{name}-publisher", daemon=True)
+        self._worker.start()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def publish(self, topic: str, payload, qos: int = 1, retain: bool = False, tag: str = "",
+                durable: bool = False) -> bool:
+        """Queue one message; never blocks. False if the queue is full or the publisher is closed.
+
+        ``durable`` messages are journalled in the outbox first (QoS 1), so
+        even when this returns False they go out on the next ``replay()``.
+        """
+        if self._stop.is_set():
+            return False
+        msg_id = ""
+        if durable and self._outbox is not None:
+            msg_id, payload = self._outbox.put(topic, payload, tag)
+            qos = max(1, qos)
+            with self._inflight_lock:
+                self._inflight.add(msg_id)
+        return self._enqueue(Outgoing(topic, payload, qos, retain, tag, time.monotonic(), msg_id))
+
+    def replay(self) -> int:
+        """The client is connected: queue the journalled messages not on their way already.
+
+        Safe from any thread; call it from ``on_connect``.
+        """
+        self._online.set()
+        if self._outbox is None or self._stop.is_set():
+            return 0
+        count = 0
+        for msg_id, topic, payload, tag in self._outbox.pending():
+            with self._inflight_lock:
+                if msg_id in self._inflight:
+                    continue
+                self._inflight.add(msg_id)
+            if not self._enqueue(Outgoing(topic, payload, 1, False, tag, time.monotonic(), msg_id)):
+                break
+            count += 1
+        if count:
+            log.info("📮 Повторная отправка из журнала: %s", count)
+        return count
+
+    def journalled(self, tag: str) -> bool:
+        """True while a message with ``tag`` waits in the outbox: a failure is not final, it goes out again."""
+        if self._outbox is None or not tag:
+            return False
+        return any(pending_tag == tag for _, _, _, pending_tag in self._outbox.pending())
+
+    def offline(self) -> None:
+        """The client lost the connection; call it from ``on_disconnect``."""
+        self._online.clear()
+
+    def _enqueue(self, item: Outgoing) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._failed_total.inc()
+            self._settle(item.msg_id)
+            kept = " (останется в журнале)" if item.msg_id else ""
+            log.warning("⚠️ Очередь отправки переполнена, '%s' в %s отброшено%s",
+                        item.tag or item.payload, item.topic, kept)
+            return False
+        return True
+
+    def _settle(self, msg_id: str, acked: bool = False) -> None:
+        if not msg_id:
+            return
+        with self._inflight_lock:
+            self._inflight.discard(msg_id)
+        if acked:
+            self._outbox.ack(msg_id)
+
+    def _drain(self):
+        try:
+            batch = [self._queue.get(timeout=0.25)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self) -> None:
+        try:
+            self._publish_batches()
+        finally:
+            # журнал закрывает сам рабочий поток: после close() он ещё может ждать PUBACK и писать подтверждения
+            if self._outbox is not None:
+                self._outbox.close()
+
+    def _publish_batches(self) -> None:
+        while True:
+            self._check_late()
+            batch = self._drain()
+            if not batch:
+                if self._stop.is_set():
+                    return
+                continue
+            if self._outbox is not None:
+                self._outbox.sync()  # один fsync на пачку, до публикации
+            client = self.client
+            # журнальные сообщения без подключения клиенту не отдаём: paho сохранил бы их у себя и отправил
+            # после переподключения вместе с replay() — событие пришло бы дважды
+            offline = not self._online.is_set()
+            # публикуем всю пачку сразу, подтверждения ждём после — paho отправляет их конвейером
+            sent = []
+            for item in batch:
+                if client is None or (offline and item.msg_id):
+                    sent.append((item, None, "нет подключения"))
+                    continue
+                try:
+                    sent.append((item, client.publish(item.topic, item.payload, qos=item.qos,
+                                                      retain=item.retain), ""))
+                except Exception as exc:
+                    sent.append((item, None, str(exc) or type(exc).__name__))
+            for item, info, error in sent:
+                late = False
+                if info is not None:
+                    try:
+                        info.wait_for_publish(timeout=self._ack_timeout)
+                        if not info.is_published():
+                            error = f"нет подтверждения за {self._ack_timeout:g} с"
+                            late = bool(item.msg_id)
+                    except Exception as exc:
+                        error = str(exc) or type(exc).__name__
+                if late:
+                    # остаётся в _inflight: paho дошлёт его сам, replay() отправил бы второй раз
+                    self._late.append((item, info, client))
+                else:
+                    self._settle(item.msg_id, acked=not error)
+                self._done(item, error)
+            if self._outbox is not None:
+                self._outbox.sync()  # и подтверждения: иначе после рестарта событие ушло бы повторно
+
+    def _check_late(self) -> None:
+        """Settle the journalled messages whose PUBACK was late: acked, still in paho, or back to replay."""
+        if not self._late:
+            return
+        waiting, acked, released = [], False, False
+        for item, info, client in self._late:
+            try:
+                published = info.is_published()
+            except Exception:  # paho от сообщения отказался (нет соединения, очередь)
+                published, lost = False, True
+            else:
+                lost = client is not self.client  # клиента заменили — у старого оно не дойдёт
+            if published:
+                self._settle(item.msg_id, acked=True)
+                self._done(item, "")
+                acked = True
+            elif lost:
+                self._settle(item.msg_id)
+                released = True
+            else:
+                waiting.append((item, info, client))
+        self._late = waiting
+        if acked:
+            self._outbox.sync()
+        if released and self._online.is_set():
+            self.replay()
+
+    def _done(self, item: Outgoing, error: str) -> None:
+        latency_ms = (time.monotonic() - item.queued_at) * 1000.0
+        if error:
+            self._failed_total.inc()
+            log.warning("⚠️ Не удалось опубликовать '%s' в %s: %s", item.tag or item.payload, item.topic, error)
+        else:
+            self._published_total.inc()
+            self._publish_ms.observe(latency_ms)
+            log.info("📤 Опубликовано '%s' в %s за %.1f мс", item.tag or item.payload, item.topic, latency_ms)
+        self._finished.emit(item.tag, latency_ms, error)
+
+    def _report(self, tag: str, latency_ms: float, error: str) -> None:
+        if error:
+            self.failed.emit(tag, error)
+            return
+        self.last_latency_ms = latency_ms
+        self.delivered.emit(tag, latency_ms)
+
+    def close(self, timeout: float = 1.0) -> None:
+        """Stop taking messages and wait up to ``timeout`` s for the worker to send what is queued.
+
+        The worker closes the outbox itself once it is done, so a PUBACK that
+        comes after ``timeout`` is still recorded; what is left unacknowledged
+        goes out again after the restart.
+        """
+        self._stop.set()
+        self._worker.join(timeout=timeout)
@@ -0,0 +1,243 @@
+# outbox.py
+"""Store-and-forward for the events a game cannot lose.
+
+Round results (``bomb_defused_spetsnaz_02``, ``red_team_point_02``,
+``game_finished_*``, ``dome_destroyed_*``, the bonus choice) used to be
+fire-and-forget: a broker blip at that moment and the server never learns
+who won. ``Outbox`` is an append-only journal of such messages, one JSON
+line per record, kept until the broker acknowledges them::
+
+    {"id": "02-9f1c2a-7", "t": "arena/supertopic", "p": "bomb_defused_spetsnaz_02", "g": "bomb_defused_spetsnaz_02"}
+    {"ack": "02-9f1c2a-7"}
+
+``g`` is the publisher's tag, so a message replayed after a restart is
+reported under the same tag as the original.
+
+``put()`` only appends to the file buffer, so it is cheap enough for the GUI
+thread; ``sync()`` (flush + fsync) is called by ``OutboundPublisher``'s
+worker once per batch before publishing. What is not acknowledged is
+published again on the next (re)connect and after a restart — delivery is
+at least once, so every record gets an id unique across restarts
+(``<ID>-<random per process>-<seq>``).
+
+Receivers must therefore be idempotent: an event can arrive twice (the
+PUBACK was lost, or the process died between PUBACK and the ``ack`` record),
+and by default the repeat is byte-for-byte the same message. The events are
+statements of a result ("red captured point 02"), so the game server applies
+a repeat as a no-op. No mode acts on them (the terminal reads the super
+topic only for the server's ``bonus_activate``).
+
+With ``OUTBOX_EVENT_IDS`` the id also goes on the wire: added to a JSON
+object, a plain token becomes ``{"event": "<token>", "id": "..."}``; binary
+frames have no room and go as they are. Receivers can then drop repeats with
+``Deduper`` (an event without an id passes through). Like
+``BINARY_PAYLOADS``, switch it on once every receiver understands it.
+
+The journal is compacted to the pending records on open and whenever an
+acknowledgement finds it longer than ``COMPACT_BYTES``. The file is locked
+(``flock``) — a second process of the same mode gets an in-memory outbox
+instead of sharing the journal.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # не POSIX — журнал без блокировки
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+COMPACT_BYTES = 64 * 1024
+
+
+def stamp(payload, msg_id: str):
+    """Put ``msg_id`` into the wire form of ``payload`` (see the module docstring)."""
+    if isinstance(payload, (bytes, bytearray)):
+        return payload
+    if isinstance(payload, dict):
+        return dict(payload, id=msg_id)
+    text = str(payload)
+    if text.startswith("{"):
+        try:
+            doc = json.loads(text)
+        except ValueError:
+            doc = None
+        if isinstance(doc, dict):
+            doc["id"] = msg_id
+            return json.dumps(doc, ensure_ascii=False)
+    return json.dumps({"event": text, "id": msg_id}, ensure_ascii=False)
+
+
+class Deduper:
+    """Remembers the last ``capacity`` event ids; ``seen()`` is True for a repeat."""
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._ids: OrderedDict = OrderedDict()
+        self._capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+
+    def seen(self, msg_id) -> bool:
+        if not msg_id:
+            return False  # событие без id — от старого отправителя, пропускаем как есть
+        with self._lock:
+            if msg_id in self._ids:
+                self._ids.move_to_end(msg_id)
+                return True
+            self._ids[msg_id] = None
+            if len(self._ids) > self._capacity:
+                self._ids.popitem(last=False)
+        return False
+
+
+class Outbox:
+    """Append-only journal of outgoing messages until they are acknowledged."""
+
+    def __init__(self, path: str | os.PathLike | None = None, point_id: str = "", ids_on_wire: bool = False) -> None:
+        self._prefix = f"{point_id or 'p'}-{os.urandom(3).hex()}-"
+        self._seq = 0
+        self._ids_on_wire = ids_on_wire
+        self._pending: OrderedDict = OrderedDict()  # id -> (topic, payload, tag)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._path = os.fspath(path) if path else None
+        self._file = None
+        if self._path:
+            self._open()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def path(self) -> str | None:
+        return self._path if self._file is not None else None
+
+    def put(self, topic: str, payload, tag: str = "") -> Tuple[str, object]:
+        """Record one message; returns ``(id, payload to publish)``."""
+        with self._lock:
+            self._seq += 1
+            msg_id = f"{self._prefix}{self._seq}"
+            if self._ids_on_wire:
+                payload = stamp(payload, msg_id)
+            elif isinstance(payload, dict):
+                payload = json.dumps(payload, ensure_ascii=False)
+            self._pending[msg_id] = (topic, payload, tag)
+            self._write(_record(msg_id, topic, payload, tag))
+        return msg_id, payload
+
+    def ack(self, msg_id: str) -> None:
+        with self._lock:
+            if self._pending.pop(msg_id, None) is None:
+                return
+            if self._file is not None and self._file.tell() > COMPACT_BYTES:
+                self._compact()
+                return
+            self._write({"ack": msg_id})
+
+    def pending(self) -> List[Tuple[str, str, object, str]]:
+        """Unacknowledged ``(id, topic, payload, tag)`` in the order they were put."""
+        with self._lock:
+            return [(msg_id, *record) for msg_id, record in self._pending.items()]
+
+    def sync(self) -> None:
+        """Flush and fsync what was written since the last call."""
+        with self._lock:
+            if not self._dirty or self._file is None:
+                return
+            self._dirty = False
+            try:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                log.warning("⚠️ Журнал отправки не записан: %s", e)
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, record: dict) -> None:
+        if self._file is None:
+            return
+        try:
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._dirty = True
+        except (OSError, ValueError) as e:
+            log.warning("⚠️ Журнал отправки не записан: %s", e)
+
+    def _open(self) -> None:
+        try:
+            Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+            fh = open(self._path, "a+", encoding="utf-8")
+        except OSError as e:
+            log.warning("⚠️ Журнал отправки %s недоступен, события хранятся только в памяти: %s", self._path, e)
+            return
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                log.warning("⚠️ Журнал отправки %s занят другим процессом, события хранятся только в памяти", self._path)
+                fh.close()
+                return
+        fh.seek(0)
+        self._load(fh.read())
+        self._file = fh
+        self._compact()
+        if self._pending:
+            log.info("📮 В журнале %s неотправленных событий: %s", self._path, len(self._pending))
+
+    def _compact(self) -> None:
+        """Rewrite the journal with only the pending records (they are few) and fsync at once."""
+        self._file.seek(0)
+        self._file.truncate()
+        for msg_id, (topic, payload, tag) in self._pending.items():
+            self._write(_record(msg_id, topic, payload, tag))
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        except OSError as e:
+            log.warning("⚠️ Журнал отправки не записан: %s", e)
+
+    def _load(self, text: str) -> None:
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # оборванная при падении строка
+            if not isinstance(record, dict):
+                continue
+            if "ack" in record:
+                self._pending.pop(record["ack"], None)
+            elif "id" in record and "t" in record:
+                payload = base64.b64decode(record["b"]) if "b" in record else record.get("p", "")
+                self._pending[record["id"]] = (record["t"], payload, record.get("g", ""))
+
+
+def _record(msg_id: str, topic: str, payload, tag: str = "") -> dict:
+    if isinstance(payload, (bytes, bytearray)):
+        record = {"id": msg_id, "t": topic, "b": base64.b64encode(bytes(payload)).decode("ascii")}
+    else:
+        record = {"id": msg_id, "t": topic, "p": payload}
+    if tag:
+        record["g"] = tag
+    return record
+
+
+def open_outbox(name: str) -> Outbox:
+    """Outbox for one publisher, at ``OUTBOX_DIR/<name>.jsonl`` (in memory when ``OUTBOX_DIR`` is None)."""
+    import config as _cfg
+
+    directory = getattr(_cfg, "OUTBOX_DIR", None)
+    path = Path(directory) / f"{name}.jsonl" if directory else None
+    return Outbox(path, point_id=_cfg.ID, ids_on_wire=bool(getattr(_cfg, "OUTBOX_EVENT_IDS", False)))
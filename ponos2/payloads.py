@@ -0,0 +1,299 @@
+# payloads.py
+"""Per-topic MQTT payload decoders shared by the modes.
+
+Each subscribed topic is registered once with the kind of payload it carries::
+
+    decoders = PayloadDecoders()
+    decoders.add(HIT_TOPIC, "hit", TOKEN, check=frozenset({"red", "blue"}).__contains__)
+    decoders.add(TIME_TOPIC, "time", INT, check=lambda s: s > 0)
+    event = decoders.decode(msg.topic, msg.payload)   # Event or None
+
+Codecs:
+
+* ``TOKEN`` — plain word, stripped and lower-cased (``red``, ``start``);
+* ``INT`` — decimal integer;
+* ``JSON`` — UTF-8 JSON document;
+* ``AUTO`` — JSON if the payload starts like a JSON object/array/string,
+  otherwise a token; for topics that carry both.
+
+Nothing is tried and caught on the happy path. A payload that does not
+decode, or that ``check`` rejects, yields ``None`` and is counted per topic
+(``failures`` and, with a metrics registry, ``payload_decode_failures_total``).
+
+Binary frames
+-------------
+
+A payload starting with ``BINARY_MAGIC`` (0xC1, never valid in UTF-8) is a
+compact struct frame, so text and binary publishers can share a topic during
+rollout. It decodes to the same value the text form would give, so handlers
+do not care which one arrived. A topic takes only the frames its codec could
+have produced as text: ``TOKEN`` — hits, ``JSON`` — dome state and bonus,
+``AUTO`` — all three, ``INT`` — none; any other frame is a failure::
+
+    hit         C1 01 <team:u8>                      "red"
+    dome state  C1 02 <hp:u32> <hp_max:u32> <state:u8> <phase:u8> <destroyer:u8>
+    bonus       C1 03 <type:u8> <team:u8> <choice:u8> <auto:u8> <timeout:u16>
+                      <timestamp:u32> then terminal_id, dome_id, point_id as <len:u8><utf-8>
+
+Team, state and choice fields index the tables below (0 — absent; a team not
+in the table is sent as 0xFF<len:u8><utf-8>). ``encode_hit``,
+``encode_dome_state`` and ``encode_bonus`` return ``None`` when a message has
+fields the frame cannot carry; the caller then sends JSON. Hits and dome
+state are published by the game server, so the modes only decode them;
+``encode_hit`` and ``encode_dome_state`` are the reference encoders for the
+tools (``tools/hit_storm.py``, ``tools/bench_payloads.py``).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import struct
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+log = logging.getLogger(__name__)
+
+TOKEN = "token"
+INT = "int"
+JSON = "json"
+AUTO = "auto"
+
+_JSON_START = frozenset(b'{["')
+
+BINARY_MAGIC = 0xC1
+_HIT, _DOME_STATE, _BONUS = 1, 2, 3
+_OTHER_TEAM = 0xFF
+
+TEAMS = ("", "red", "blue", "green", "yellow")
+DOME_STATES = ("", "INACTIVE", "ACTIVE", "ACTIVE_PHASE_1", "ACTIVE_PHASE_2", "ACTIVE_PHASE_3", "DESTROYED")
+BONUS_TYPES = ("", "bonus_activate", "bonus_choice")
+CHOICES = ("", "keep_ammo", "super_shots")
+
+_STATE = struct.Struct("<IIBBB")
+_BONUS_HEAD = struct.Struct("<BBBBHI")
+_TEAM_IDS = {name: i for i, name in enumerate(TEAMS) if name}
+_STATE_IDS = {name: i for i, name in enumerate(DOME_STATES) if name}
+_BONUS_IDS = {name: i for i, name in enumerate(BONUS_TYPES) if name}
+_CHOICE_IDS = {name: i for i, name in enumerate(CHOICES) if name}
+_STATE_KEYS = frozenset(("hp_current", "hp_max", "state", "phase", "team_destroyer"))
+_BONUS_KEYS = frozenset(("type", "team", "choice", "default_choice", "auto", "timeout_sec", "timestamp",
+                         "terminal_id", "dome_id", "point_id"))
+
+
+@dataclass(slots=True)
+class Event:
+    kind: str           # метка топика при регистрации: "hit", "time", "dome_state", ...
+    value: Any          # str для TOKEN, int для INT, разобранный JSON
+    topic: str
+    received_at: float  # time.monotonic() в момент разбора
+
+
+def _token(payload: bytes) -> str:
+    return payload.decode("utf-8", errors="ignore").strip().lower()
+
+
+def _int(payload: bytes) -> int:
+    return int(payload)  # int() сам пропускает пробелы и перевод строки
+
+
+def _json(payload: bytes) -> Any:
+    return json.loads(payload.decode("utf-8"))  # из str заметно быстрее, чем из bytes
+
+
+def _team_bytes(team: str) -> bytes:
+    idx = _TEAM_IDS.get(team)
+    if idx is not None:
+        return bytes((idx,))
+    if not team:
+        return b"\0"
+    raw = team.encode("utf-8")
+    return bytes((_OTHER_TEAM, len(raw))) + raw
+
+
+def _read_team(payload: bytes, pos: int) -> tuple[str, int]:
+    idx = payload[pos]
+    if idx != _OTHER_TEAM:
+        return TEAMS[idx], pos + 1
+    end = pos + 2 + payload[pos + 1]
+    if end > len(payload):
+        raise ValueError("обрезанный кадр")
+    return payload[pos + 2:end].decode("utf-8"), end
+
+
+def _read_text(payload: bytes, pos: int) -> tuple[str, int]:
+    end = pos + 1 + payload[pos]
+    if end > len(payload):
+        raise ValueError("обрезанный кадр")
+    return payload[pos + 1:end].decode("utf-8"), end
+
+
+def _text_bytes(text: str) -> bytes | None:
+    raw = text.encode("utf-8")
+    return bytes((len(raw),)) + raw if len(raw) < 256 else None
+
+
+def encode_hit(team: str) -> bytes:
+    return bytes((BINARY_MAGIC, _HIT)) + _team_bytes((team or "").strip().lower())
+
+
+def encode_dome_state(state: dict) -> bytes | None:
+    if not _STATE_KEYS.issuperset(state) or "hp_current" not in state or "hp_max" not in state:
+        return None
+    hp, hp_max, phase = state["hp_current"], state["hp_max"], state.get("phase")
+    code = _STATE_IDS.get(str(state["state"]).upper()) if "state" in state else 0
+    destroyer = state.get("team_destroyer") or ""
+    if code is None or not isinstance(hp, int) or not isinstance(hp_max, int) \
+            or not (0 <= hp < 2 ** 32 and 0 <= hp_max < 2 ** 32) \
+            or (phase is not None and not (isinstance(phase, int) and 0 < phase < 256)) \
+            or (destroyer and destroyer not in _TEAM_IDS):
+        return None
+    return bytes((BINARY_MAGIC, _DOME_STATE)) + _STATE.pack(hp, hp_max, code, phase or 0, _TEAM_IDS.get(destroyer, 0))
+
+
+def encode_bonus(message: dict) -> bytes | None:
+    if not _BONUS_KEYS.issuperset(message):
+        return None
+    kind = _BONUS_IDS.get(message.get("type"))
+    if kind is None:
+        return None
+    is_choice = message["type"] == "bonus_choice"
+    choice_key = "choice" if is_choice else "default_choice"
+    if ("default_choice" if is_choice else "choice") in message or ("auto" in message) != is_choice:
+        return None
+    # пустые поля в кадре не отличить от отсутствующих — такие сообщения уходят JSON
+    if any(key in message and not message[key] for key in ("team", choice_key, "timeout_sec", "timestamp",
+                                                           "terminal_id", "dome_id", "point_id")):
+        return None
+    team = message.get("team", "")
+    choice = message.get(choice_key, "")
+    timeout = message.get("timeout_sec", 0)
+    timestamp = message.get("timestamp", 0)
+    if (team and team not in _TEAM_IDS) or (choice and choice not in _CHOICE_IDS) \
+            or not isinstance(timeout, int) or not isinstance(timestamp, int) \
+            or not (0 <= timeout < 2 ** 16 and 0 <= timestamp < 2 ** 32):
+        return None
+    parts = [bytes((BINARY_MAGIC, _BONUS)),
+             _BONUS_HEAD.pack(kind, _TEAM_IDS.get(team, 0), _CHOICE_IDS.get(choice, 0),
+                              1 if message.get("auto") else 0, timeout, timestamp)]
+    for key in ("terminal_id", "dome_id", "point_id"):
+        value = message.get(key, "")
+        text = _text_bytes(value) if isinstance(value, str) else None
+        if text is None:
+            return None
+        parts.append(text)
+    return b"".join(parts)
+
+
+def _binary(payload: bytes) -> Any:
+    kind = payload[1]
+    if kind == _HIT:
+        return _read_team(payload, 2)[0]
+    if kind == _DOME_STATE:
+        hp, hp_max, code, phase, destroyer = _STATE.unpack_from(payload, 2)
+        state: dict = {"hp_current": hp, "hp_max": hp_max}
+        if code:
+            state["state"] = DOME_STATES[code]
+        if phase:
+            state["phase"] = phase
+        if destroyer:
+            state["team_destroyer"] = TEAMS[destroyer]
+        return state
+    if kind == _BONUS:
+        bonus_type, team, choice, auto, timeout, timestamp = _BONUS_HEAD.unpack_from(payload, 2)
+        pos = 2 + _BONUS_HEAD.size
+        message: dict = {"type": BONUS_TYPES[bonus_type]}
+        for key in ("terminal_id", "dome_id", "point_id"):
+            text, pos = _read_text(payload, pos)
+            if text:
+                message[key] = text
+        if team:
+            message["team"] = TEAMS[team]
+        if choice:
+            message["choice" if bonus_type == _BONUS_IDS["bonus_choice"] else "default_choice"] = CHOICES[choice]
+        if bonus_type == _BONUS_IDS["bonus_choice"]:
+            message["auto"] = bool(auto)
+        if timeout:
+            message["timeout_sec"] = timeout
+        if timestamp:
+            message["timestamp"] = timestamp
+        return message
+    raise ValueError(f"неизвестный тип кадра {kind}")
+
+
+def _auto(payload: bytes) -> Any:
+    head = payload[:1]
+    if head.isspace():
+        head = payload.lstrip()[:1]
+    if head and head[0] in _JSON_START:
+        return json.loads(payload.decode("utf-8"))
+    return _token(payload)
+
+
+_MAGIC_BYTE = bytes((BINARY_MAGIC,))
+
+CODECS: Dict[str, Callable[[bytes], Any]] = {TOKEN: _token, INT: _int, JSON: _json, AUTO: _auto}
+FRAMES: Dict[str, frozenset] = {
+    TOKEN: frozenset((_HIT,)),
+    INT: frozenset(),
+    JSON: frozenset((_DOME_STATE, _BONUS)),
+    AUTO: frozenset((_HIT, _DOME_STATE, _BONUS)),
+}
+
+
+class PayloadDecoders:
+    """Topic -> (kind, codec, frames, check) table; ``decode`` is called from paho's thread."""
+
+    def __init__(self, stats=None) -> None:
+        self._routes: Dict[str, tuple] = {}
+        self._stats = stats
+        self.failures: Dict[str, int] = {}
+
+    def add(self, topic: str, kind: str, codec: str = AUTO,
+            check: Callable[[Any], bool] | None = None) -> "PayloadDecoders":
+        if not topic:
+            return self
+        if codec not in CODECS:
+            raise ValueError(f"неизвестный кодек {codec!r}")
+        failed = None
+        if self._stats is not None:
+            failed = self._stats.counter("payload_decode_failures_total",
+                                         "Payloads that did not decode or were rejected", topic=topic)
+        self._routes[topic] = (kind, CODECS[codec], FRAMES[codec], check, failed)
+        return self
+
+    def topics(self) -> list:
+        return list(self._routes)
+
+    def decode(self, topic: str, payload: bytes) -> Event | None:
+        route = self._routes.get(topic)
+        if route is None:
+            return None
+        kind, codec, frames, check, failed = route
+        try:
+            if payload[:1] == _MAGIC_BYTE:
+                if payload[1] not in frames:
+                    raise ValueError("кадр не для этого топика")
+                value = _binary(payload)
+            else:
+                value = codec(payload)
+        except (ValueError, IndexError, struct.error):  # JSONDecodeError, UnicodeDecodeError — подклассы ValueError
+            self._fail(topic, payload, failed)
+            return None
+        if check is not None:
+            try:
+                accepted = check(value)
+            except Exception:  # проверка вызывающего не должна ронять поток paho
+                accepted = False
+            if not accepted:
+                self._fail(topic, payload, failed)
+                return None
+        return Event(kind, value, topic, time.monotonic())
+
+    def _fail(self, topic: str, payload: bytes, failed) -> None:
+        n = self.failures.get(topic, 0) + 1
+        self.failures[topic] = n
+        if failed is not None:
+            failed.inc()
+        if n & (n - 1) == 0:  # 1, 2, 4, 8... — без лавины предупреждений при мусоре в топике
+            log.warning("⚠️ Нераспознанный payload в %s (%s раз): %r", topic, n, payload[:64])
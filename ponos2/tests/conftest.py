@@ -0,0 +1,57 @@
+# conftest.py
+"""Shared fixtures: offscreen Qt, the project root on sys.path, a fake clock.
+
+    cd ponos2 && python -m pytest -q
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.pop("PONOS_MQTT_BUS", None)  # тесты не ходят на шину супервизора
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class FakeClock:
+    """Monotonic clock the test moves by hand."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PySide6.QtCore import QCoreApplication
+
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def settle(qapp):
+    """Deliver queued signals and 0 ms timers until ``done()`` is true (or ``timeout`` s pass)."""
+
+    def run(done=lambda: False, timeout: float = 0.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            qapp.processEvents()
+            if done() or time.monotonic() >= deadline:
+                return done()
+            time.sleep(0.005)
+
+    return run
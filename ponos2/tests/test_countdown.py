@@ -0,0 +1,67 @@
+import pytest
+
+from countdown import Countdown
+
+
+def make(clock, qapp):
+    countdown = Countdown(clock=clock)
+    fired = []
+    countdown.expired.connect(lambda: fired.append(clock.now))
+    return countdown, fired
+
+
+def test_start_zero_expires_synchronously(qapp, clock):
+    countdown, fired = make(clock, qapp)
+    countdown.start(0)
+    assert fired == [clock.now]
+    assert countdown.remaining == 0
+    assert not countdown.active
+
+
+def test_pause_after_deadline_returns_true_and_defers_expired(qapp, clock, settle):
+    countdown, fired = make(clock, qapp)
+    countdown.start(5)
+    clock.now += 5.5
+    assert countdown.pause() is True
+    assert fired == []  # не внутри pause(): вызывающий успевает записать исход
+    assert countdown.stop() is False  # истечение сообщается один раз
+    settle(lambda: fired)
+    assert len(fired) == 1
+    assert countdown.remaining == 0
+
+
+def test_pause_before_deadline_keeps_remaining(qapp, clock, settle):
+    countdown, fired = make(clock, qapp)
+    countdown.start(5)
+    clock.now += 2.2
+    assert countdown.pause() is False
+    assert countdown.remaining == 3
+    assert countdown.paused
+    clock.now += 60  # на паузе время не идёт
+    countdown.resume()
+    assert countdown.remaining == 3
+    assert countdown.active
+    settle()
+    assert fired == []
+
+
+def test_remaining_rounds_up(qapp, clock):
+    countdown, _ = make(clock, qapp)
+    countdown.start(45)
+    assert countdown.remaining == 45
+    clock.now += 0.999
+    countdown.pause()
+    assert countdown.remaining == 45
+    assert countdown.time_left() == pytest.approx(44.001)
+
+
+def test_reset_cancels_pending_expiry(qapp, clock, settle):
+    countdown, fired = make(clock, qapp)
+    countdown.start(5)
+    clock.now += 6
+    assert countdown.pause() is True
+    countdown.reset(10)
+    settle()
+    assert fired == []
+    assert countdown.remaining == 10
+    assert not countdown.active
@@ -0,0 +1,149 @@
+import threading
+
+import pytest
+
+from outbound import OutboundPublisher
+from outbox import Outbox
+
+
+class FakeInfo:
+    """paho's MQTTMessageInfo: PUBACK when ``published`` is set, ``lost`` — paho gave the message up."""
+
+    def __init__(self, published: bool) -> None:
+        self.published = threading.Event()
+        if published:
+            self.published.set()
+        self.lost = False
+
+    def wait_for_publish(self, timeout=None) -> None:
+        self.published.wait(timeout)
+
+    def is_published(self) -> bool:
+        if self.lost:
+            raise RuntimeError("message lost")
+        return self.published.is_set()
+
+
+class FakeClient:
+    def __init__(self, auto_ack: bool = True) -> None:
+        self.auto_ack = auto_ack
+        self.sent = []  # (topic, payload, info)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        info = FakeInfo(self.auto_ack)
+        self.sent.append((topic, payload, info))
+        return info
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return tmp_path / "outbox.jsonl"
+
+
+@pytest.fixture
+def publisher(qapp, journal):
+    created = []
+
+    def make(client, outbox=None, ack_timeout=0.05):
+        pub = OutboundPublisher(client, ack_timeout=ack_timeout, outbox=outbox or Outbox(journal, "02"))
+        results = []
+        pub.delivered.connect(lambda tag, ms: results.append(("delivered", tag)))
+        pub.failed.connect(lambda tag, reason: results.append(("failed", tag)))
+        created.append(pub)
+        return pub, results
+
+    yield make
+    for pub in created:
+        pub.close()
+        pub._worker.join(5)
+
+
+def test_journal_keeps_pending_across_restart(journal):
+    outbox = Outbox(journal, "02")
+    first, _ = outbox.put("arena/supertopic", "red_team_point_02", tag="red_team_point_02")
+    second, _ = outbox.put("arena/supertopic", b"\xc1\x03\x02", tag="bonus_choice")
+    outbox.ack(first)
+    outbox.close()
+    with open(journal, "a", encoding="utf-8") as fh:
+        fh.write('{"id": "02-torn')  # строка, оборванная падением
+
+    reopened = Outbox(journal, "02")
+    assert reopened.pending() == [(second, "arena/supertopic", b"\xc1\x03\x02", "bonus_choice")]
+    reopened.close()
+
+
+def test_replay_reports_under_the_original_tag(publisher, journal, settle):
+    outbox = Outbox(journal, "02")
+    outbox.put("arena/supertopic", "{}", tag="bonus_choice")
+    outbox.close()
+
+    client = FakeClient()
+    outbox = Outbox(journal, "02")
+    pub, results = publisher(client, outbox)
+    assert pub.journalled("bonus_choice")
+    assert pub.replay() == 1
+    assert settle(lambda: results, timeout=3)
+    assert results == [("delivered", "bonus_choice")]
+    assert [payload for _, payload, _ in client.sent] == ["{}"]
+    assert len(outbox) == 0
+    assert not pub.journalled("bonus_choice")
+
+
+def test_offline_durable_message_waits_for_replay(publisher, settle):
+    client = FakeClient()
+    pub, results = publisher(client)
+    pub.publish("arena/supertopic", "bomb_exploded_02", tag="bomb", durable=True)
+    assert settle(lambda: results, timeout=3)
+    assert results == [("failed", "bomb")]
+    assert client.sent == []  # paho без подключения отправил бы его сам, рядом с replay()
+    assert pub.journalled("bomb")
+
+    pub.replay()
+    assert settle(lambda: len(results) == 2, timeout=3)
+    assert results[1] == ("delivered", "bomb")
+    assert len(client.sent) == 1
+
+
+def test_late_puback_settles_instead_of_replaying(publisher, settle):
+    client = FakeClient(auto_ack=False)
+    pub, results = publisher(client)
+    pub.replay()
+    pub.publish("arena/supertopic", "dome_destroyed_red_DOME_1", tag="dome", durable=True)
+    assert settle(lambda: results, timeout=3)
+    assert results == [("failed", "dome")]
+    assert pub.journalled("dome")
+
+    assert pub.replay() == 0  # paho ещё доставляет его — второй копии нет
+    client.sent[0][2].published.set()
+    assert settle(lambda: len(results) == 2, timeout=3)
+    assert results[1] == ("delivered", "dome")
+    assert len(client.sent) == 1
+    assert not pub.journalled("dome")
+
+
+def test_late_message_given_up_by_paho_is_replayed(publisher, settle):
+    client = FakeClient(auto_ack=False)
+    pub, results = publisher(client)
+    pub.replay()
+    pub.publish("arena/supertopic", "game_finished_red", tag="finish", durable=True)
+    assert settle(lambda: results, timeout=3)
+
+    client.auto_ack = True
+    client.sent[0][2].lost = True
+    assert settle(lambda: len(results) == 2, timeout=3)
+    assert results[1] == ("delivered", "finish")
+    assert [payload for _, payload, _ in client.sent] == ["game_finished_red"] * 2
+    assert not pub.journalled("finish")
+
+
+def test_close_leaves_the_outbox_to_the_worker(publisher, journal, settle):
+    client = FakeClient(auto_ack=False)
+    pub, _ = publisher(client, ack_timeout=2.0)
+    pub.replay()
+    pub.publish("arena/supertopic", "red_team_point_02", tag="point", durable=True)
+    assert settle(lambda: client.sent, timeout=3)
+    pub.close(timeout=0.01)  # рабочий поток ещё ждёт PUBACK
+    client.sent[0][2].published.set()
+    pub._worker.join(5)
+    assert not pub._worker.is_alive()
+    assert Outbox(journal, "02").pending() == []
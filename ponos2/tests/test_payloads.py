@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from payloads import (AUTO, JSON, TOKEN, PayloadDecoders, encode_bonus, encode_dome_state,
+                      encode_hit)
+
+
+def decode(codec, payload):
+    event = PayloadDecoders().add("t", "kind", codec).decode("t", payload)
+    return None if event is None else event.value
+
+
+@pytest.mark.parametrize("team", ["red", "blue", "yellow", "purple", "команда"])
+def test_hit_round_trip(team):
+    frame = encode_hit(team)
+    assert decode(TOKEN, frame) == team
+    assert decode(AUTO, frame) == decode(AUTO, team.encode("utf-8"))
+
+
+@pytest.mark.parametrize("state", [
+    {"hp_current": 0, "hp_max": 100, "state": "DESTROYED", "team_destroyer": "blue"},
+    {"hp_current": 70, "hp_max": 100, "state": "ACTIVE_PHASE_1", "phase": 1},
+    {"hp_current": 2 ** 32 - 1, "hp_max": 2 ** 32 - 1},
+])
+def test_dome_state_round_trip(state):
+    frame = encode_dome_state(state)
+    assert frame is not None
+    assert decode(JSON, frame) == state
+    assert decode(AUTO, frame) == decode(AUTO, json.dumps(state).encode())
+
+
+@pytest.mark.parametrize("state", [
+    {"hp_current": 10},                                            # без hp_max
+    {"hp_current": 10, "hp_max": 100, "state": "BROKEN"},
+    {"hp_current": 10, "hp_max": 100, "team_destroyer": "purple"},  # в кадре только команды из таблицы
+    {"hp_current": -1, "hp_max": 100},
+    {"hp_current": 10, "hp_max": 100, "extra": 1},
+])
+def test_dome_state_not_encodable(state):
+    assert encode_dome_state(state) is None
+
+
+@pytest.mark.parametrize("message", [
+    {"type": "bonus_activate", "team": "red", "dome_id": "DOME_1", "terminal_id": "term_01",
+     "default_choice": "keep_ammo", "timeout_sec": 45, "timestamp": 1760000000},
+    {"type": "bonus_choice", "team": "blue", "terminal_id": "term_01", "point_id": "02", "dome_id": "DOME_1",
+     "choice": "super_shots", "auto": False, "timestamp": 1760000000},
+    {"type": "bonus_choice", "choice": "keep_ammo", "auto": True},
+])
+def test_bonus_round_trip(message):
+    frame = encode_bonus(message)
+    assert frame is not None
+    assert decode(JSON, frame) == message
+
+
+@pytest.mark.parametrize("message", [
+    {"type": "bonus_choice", "choice": "keep_ammo"},                 # у выбора всегда есть auto
+    {"type": "bonus_activate", "team": "", "timeout_sec": 45},       # пустое поле не отличить от отсутствия
+    {"type": "bonus_activate", "terminal_id": "x" * 256},
+    {"type": "bonus_other"},
+])
+def test_bonus_not_encodable(message):
+    assert encode_bonus(message) is None
+
+
+def test_truncated_frames_fail():
+    decoders = PayloadDecoders().add("t", "kind", AUTO)
+    frames = [
+        encode_hit("purple")[:-2],   # имя команды 0xFF короче заявленной длины
+        encode_hit("purple")[:3],    # нет даже длины
+        encode_dome_state({"hp_current": 1, "hp_max": 2})[:-1],
+        encode_bonus({"type": "bonus_activate", "dome_id": "DOME_1"})[:-1],
+    ]
+    for frame in frames:
+        assert decoders.decode("t", frame) is None
+    assert decoders.failures["t"] == len(frames)
+
+
+def test_topic_takes_only_its_frames():
+    state = encode_dome_state({"hp_current": 1, "hp_max": 2})
+    assert decode(TOKEN, state) is None
+    assert decode(JSON, encode_hit("red")) is None
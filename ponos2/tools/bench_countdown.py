@@ -0,0 +1,109 @@
+"""Countdown drift under GUI load: 1000 ms decrement timer vs. ``countdown.Countdown``.
+
+Both count ``--seconds`` down in the same ``QCoreApplication`` while a load
+timer blocks the event loop for ``--stall-ms`` every ``--stall-every``
+seconds (a QML reload, a long repaint). The old way is what bomb, terminal
+and control's QML did: a repeating 1000 ms ``QTimer`` that decrements a
+counter. For each the tool prints when it reached zero relative to the
+nominal length, and for ``Countdown`` how many ``changed`` signals it sent
+(at most one per second; values passed during a stall are skipped).
+
+Qt catches a repeating timer up after a short delay, so the old counter only
+loses whole seconds when the loop is blocked for longer than an interval —
+the default stall is chosen to show that.
+
+Exit code 1 if ``Countdown`` ends later than one stall plus ``--tolerance-ms``
+— its error must not grow with the length of the round.
+
+    python tools/bench_countdown.py
+    python tools/bench_countdown.py --seconds 45 --stall-every 0     # без нагрузки
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Дрейф обратного отсчёта под нагрузкой GUI")
+    parser.add_argument("--seconds", type=int, default=20, help="длина отсчёта, сек")
+    parser.add_argument("--stall-ms", type=float, default=2200.0, help="на сколько блокируется цикл событий")
+    parser.add_argument("--stall-every", type=float, default=4.0, help="как часто, сек (0 — без нагрузки)")
+    parser.add_argument("--tolerance-ms", type=float, default=100.0, help="допуск сверх одной блокировки")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtCore import QCoreApplication, QTimer
+    from countdown import Countdown
+
+    app = QCoreApplication(sys.argv)
+    started = time.monotonic()
+    finished = {}
+
+    # старый способ: счётчик минус один на каждое срабатывание таймера
+    legacy = {"left": args.seconds}
+    legacy_timer = QTimer()
+    legacy_timer.setInterval(1000)
+
+    def legacy_tick():
+        legacy["left"] -= 1
+        if legacy["left"] <= 0:
+            legacy_timer.stop()
+            finished["1000 ms QTimer"] = time.monotonic() - started
+            check_done()
+
+    legacy_timer.timeout.connect(legacy_tick)
+
+    countdown = Countdown()
+    changes = []
+    countdown.changed.connect(changes.append)
+
+    def countdown_expired():
+        finished["Countdown"] = time.monotonic() - started
+        check_done()
+
+    countdown.expired.connect(countdown_expired)
+
+    stall = QTimer()
+    stall.timeout.connect(lambda: time.sleep(args.stall_ms / 1000.0))  # занятой GUI-поток
+
+    def check_done():
+        if len(finished) == 2:
+            stall.stop()
+            app.quit()
+
+    legacy_timer.start()
+    countdown.start(args.seconds)
+    shown_at_start = len(changes)
+    if args.stall_every > 0:
+        stall.start(int(args.stall_every * 1000))
+    QTimer.singleShot(int((args.seconds * 3 + 10) * 1000), app.quit)  # страховка
+    app.exec()
+
+    print(f"{args.seconds} с отсчёта, блокировка {args.stall_ms:g} мс каждые {args.stall_every:g} с")
+    for name in ("1000 ms QTimer", "Countdown"):
+        elapsed = finished.get(name)
+        if elapsed is None:
+            print(f"  {name:<16} не дошёл до нуля")
+            continue
+        print(f"  {name:<16} ноль через {elapsed:7.3f} с  (дрейф {elapsed - args.seconds:+.3f} с)")
+    print(f"  Countdown.changed: {len(changes) - shown_at_start} раз после старта (не больше {args.seconds})")
+
+    drift = finished.get("Countdown", float("inf")) - args.seconds
+    limit = ((args.stall_ms if args.stall_every > 0 else 0.0) + args.tolerance_ms) / 1000.0
+    if drift > limit:
+        print(f"❌ Дрейф Countdown {drift:.3f} с больше допустимого {limit:.3f} с")
+        return 1
+    print("✅ Дрейф Countdown в пределах одной блокировки")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Microbenchmarks for the game-logic hot paths, checked against a stored baseline.
+
+Runs headless (``QT_QPA_PLATFORM=offscreen``, only a ``QCoreApplication``)
+and times, in microseconds per call (median of ``--rounds`` rounds over all cases):
+
+* control ``process_message_batch`` on a ``CaptureState`` — a batch of hits
+  for the team already active (ignored) and one that switches the team;
+* dome ``DomeDisplayBackend.apply_hit`` and ``apply_state``;
+* terminal ``BonusTerminalBackend.activate``;
+* ``Outbox.put`` + ``ack`` of a critical event on a journal file (the part
+  of a durable publish that runs on the GUI thread, plus the worker's ack);
+* ``ModeRegistry.reload`` over ``--manifests`` generated modes, unchanged
+  (stat-only) and forced (every manifest parsed);
+* the supervisor command path: ``app.on_mode_message`` -> ``cmd_queue`` ->
+  ``_supervise`` -> ``start_mode`` (stubbed, nothing is launched).
+
+Results are compared with ``tools/bench_baseline.json``; a case slower than
+its baseline by more than ``--threshold`` (twice that for the outbox, registry
+and supervisor cases, which go through syscalls and threads) and by more than
+``--noise-us`` fails the run (exit code 1) — a few-microsecond case jitters by
+more than 30 % on its own. The baseline also stores a pure-Python calibration loop, and
+expectations are scaled by it, so a baseline recorded on a laptop still
+means something on the Raspberry. Logging runs at ``--log-level`` (WARNING by default, the same
+level the baseline was recorded at).
+
+    python tools/bench_hotpaths.py
+    python tools/bench_hotpaths.py --case dome --threshold 0.5
+    python tools/bench_hotpaths.py --save          # записать новый baseline
+    python tools/bench_hotpaths.py --save --case control   # обновить только эти замеры
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import types
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from tools.benchutil import ns_per_call  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "bench_baseline.json"
+NOISE_US = 3.0  # разброс коротких замеров между прогонами на чистом дереве — до 2-3 мкс
+
+
+class Case(NamedTuple):
+    name: str
+    n: int                      # вызовов на замер
+    fn: Callable[[], object]
+    slack: float = 1.0          # множитель порога: у замеров с syscall и потоками разброс больше
+
+
+def _calibrate() -> float:
+    """ns per iteration of a fixed dict/str workload — «скорость машины» для масштабирования baseline."""
+    table = {f"k{i}": i for i in range(64)}
+
+    def work():
+        total = 0
+        for key in ("k1", "k7", "k33", "k63"):
+            total += table[key]
+        return str(total).strip().lower()
+
+    return ns_per_call(work, 200_000)
+
+
+def _mode_module(name: str, module: str):
+    path = str(PROJECT_ROOT / "modes" / name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(module)
+
+
+def control_cases() -> List[Case]:
+    control = _mode_module("control", "control")
+    from payloads import Event
+
+    control.CURRENT_GAME_TIME = 10 ** 6  # отсчёт идёт по реальному времени — за замер ни одна команда не должна дойти до нуля
+    state = control.CaptureState(control.CURRENT_GAME_TIME)
+    red = [Event("hit", "red", control.HIT_TOPIC, 0.0) for _ in range(8)]
+    blue = [Event("hit", "blue", control.HIT_TOPIC, 0.0) for _ in range(8)]
+    batches = itertools.cycle((red, blue))
+    control.process_message_batch(state, red)
+    return [
+        Case("control batch ignored", 50_000, lambda: control.process_message_batch(state, red)),
+        Case("control batch switch", 20_000, lambda: control.process_message_batch(state, next(batches))),
+    ]
+
+
+def dome_cases() -> List[Case]:
+    dome = _mode_module("dome", "dome")
+    backend = dome.DomeDisplayBackend("DOME_1", 10 ** 9)  # HP хватает на все замеры — купол не падает
+    states = itertools.cycle([{"hp_current": hp, "hp_max": 1000, "state": "ACTIVE"} for hp in (900, 640, 250)])
+    return [
+        Case("dome apply_hit", 20_000, lambda: backend.apply_hit("red", 1)),
+        Case("dome apply_state", 20_000, lambda: backend.apply_state(next(states))),
+    ]
+
+
+def terminal_cases() -> List[Case]:
+    terminal = _mode_module("dome_terminal", "terminal")
+    backend = terminal.BonusTerminalBackend("term_01", lambda payload: True, "keep_ammo")
+    payload = {"type": "bonus_activate", "team": "red", "dome_id": "DOME_1", "timeout_sec": 15}
+    return [Case("terminal activate", 20_000, lambda: backend.activate(payload))]
+
+
+def outbox_cases(workdir: Path) -> List[Case]:
+    from outbox import Outbox
+
+    outbox = Outbox(workdir / "outbox.jsonl", "02")
+
+    def put_ack():
+        msg_id, _ = outbox.put("arena/supertopic", "red_team_point_02")
+        outbox.ack(msg_id)
+
+    return [Case("outbox put+ack", 20_000, put_ack, slack=2.0)]
+
+
+def registry_cases(count: int, workdir: Path) -> List[Case]:
+    from mode_registry import ModeRegistry
+
+    for i in range(count):
+        mode_dir = workdir / f"mode_{i:04d}"
+        mode_dir.mkdir()
+        (mode_dir / "main.py").write_text("", encoding="utf-8")
+        manifest = {"id": f"mode_{i:04d}", "name": f"Mode {i}", "entry": "main.py", "args": ["--fast"]}
+        (mode_dir / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    registry = ModeRegistry(workdir)
+    return [
+        Case(f"registry reload x{count}", 50, registry.reload, slack=2.0),
+        Case(f"registry reload x{count} force", 10, lambda: registry.reload(force=True), slack=2.0),
+    ]
+
+
+def supervisor_cases(stack: List[Callable[[], None]]) -> List[Case]:
+    import app
+    from mode_pool import ModePool
+
+    handled = threading.Event()
+    app.start_mode = lambda mode_id: handled.set()
+    app.pool = ModePool(size=0)
+    app.REGISTRY_WATCH = False
+    mode_id = next(iter(app.registry.list_modes())).id
+    msg = types.SimpleNamespace(topic=app.TOPIC_MODE, payload=mode_id.encode())
+
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(app._supervise())
+    thread = threading.Thread(target=loop.run_forever, name="bench-supervise", daemon=True)
+    thread.start()
+
+    def stop():
+        loop.call_soon_threadsafe(task.cancel)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+    stack.append(stop)
+
+    def command():
+        handled.clear()
+        app.on_mode_message(None, None, msg)
+        handled.wait(5)
+
+    return [Case("supervisor command", 2_000, command, slack=2.0)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих путей с проверкой регрессий")
+    parser.add_argument("--case", action="append", default=[], help="только замеры, в имени которых есть строка")
+    parser.add_argument("--threshold", type=float, default=0.3, help="допустимое замедление (0.3 — на 30%%)")
+    parser.add_argument("--manifests", type=int, default=300, help="сколько manifest'ов для ModeRegistry")
+    parser.add_argument("--rounds", type=int, default=5, help="кругов по всем замерам (берётся медиана)")
+    parser.add_argument("--noise-us", type=float, default=NOISE_US,
+                        help="замедление меньше стольких мкс — шум, не регрессия")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="записать результаты как новый baseline")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ.pop("PONOS_MQTT_BUS", None)
+    import fastlog
+    from PySide6.QtCore import QCoreApplication
+
+    fastlog.setup("bench_hotpaths", level=args.log_level)
+    qapp = QCoreApplication.instance() or QCoreApplication(sys.argv)  # noqa: F841 - QTimer в моделях режимов
+
+    cleanup: List[Callable[[], None]] = []
+    with tempfile.TemporaryDirectory(prefix="ponos_bench_") as tmp:
+        cases = (control_cases() + dome_cases() + terminal_cases() + outbox_cases(Path(tmp))
+                 + registry_cases(args.manifests, Path(tmp)) + supervisor_cases(cleanup))
+        cases = [case for case in cases if not args.case or any(part in case.name for part in args.case)]
+        # калибровка между замерами и медианы по кругам: минимум из N прогонов зависит от N и от удачи,
+        # сравнение лучшего прогона с записанным baseline на чистом дереве то проходило, то нет
+        calibrations = [_calibrate()]
+        samples: Dict[str, List[float]] = {case.name: [] for case in cases}
+        for _ in range(max(1, args.rounds)):
+            # круги по всем замерам: кратковременная нагрузка на машине портит один круг, а не один замер
+            for case in cases:
+                samples[case.name].append(ns_per_call(case.fn, case.n) / 1000.0)
+                calibrations.append(_calibrate())
+        for stop in cleanup:
+            stop()
+        results = {name: statistics.median(values) for name, values in samples.items()}
+        calibration = statistics.median(calibrations)
+
+    try:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        baseline = {}
+    scale = calibration / baseline["calibration_ns"] if baseline.get("calibration_ns") else 1.0
+    expected_us = baseline.get("cases_us", {})
+
+    if args.save:
+        if args.case and expected_us:
+            # частичное обновление: остальные замеры и калибровка остаются, новые приводятся к ней
+            cases_us = dict(expected_us, **{k: v / scale for k, v in results.items()})
+            data = {"calibration_ns": baseline["calibration_ns"], "cases_us": cases_us}
+        else:
+            data = {"calibration_ns": calibration, "cases_us": results}
+        data["calibration_ns"] = round(data["calibration_ns"], 2)
+        data["cases_us"] = {k: round(v, 3) for k, v in data["cases_us"].items()}
+        args.baseline.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        for name, us in results.items():
+            print(f"{name:<30} {us:10.2f} us")
+        print(f"💾 Baseline записан в {args.baseline}")
+        return 0
+
+    print(f"калибровка {calibration:.0f} ns (baseline x{scale:.2f}), порог +{args.threshold:.0%} "
+          f"и не меньше {args.noise_us:g} мкс, медиана {max(1, args.rounds)} кругов")
+    print(f"{'case':<30} {'now':>10} {'baseline':>10} {'ratio':>7}")
+    regressions = []
+    for case in cases:
+        name, us = case.name, results[case.name]
+        base = expected_us.get(name)
+        if base is None:
+            print(f"{name:<30} {us:7.2f} us {'—':>10}")
+            continue
+        expected = base * scale
+        ratio = us / expected
+        mark = ""
+        if ratio > 1.0 + args.threshold * case.slack and us - expected > args.noise_us:
+            mark = "  ❌"
+            regressions.append(name)
+        print(f"{name:<30} {us:7.2f} us {expected:7.2f} us {ratio:6.2f}x{mark}")
+    if regressions:
+        print(f"❌ Регрессия: {', '.join(regressions)}")
+        return 1
+    print("✅ Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
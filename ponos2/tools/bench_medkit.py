@@ -0,0 +1,108 @@
+"""Heal publisher benchmark: heals/sec and tap -> PUBACK latency.
+
+Runs ``HealPublisher`` from ``modes/medkit/medkit.py`` against a local stub
+broker and counts what actually arrives on ``arena/point/{ID}/action``.
+
+    python tools/bench_medkit.py --taps 2000
+    python tools/bench_medkit.py --taps 2000 --rate 20 --coalesce
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from tools.benchutil import format_ms  # noqa: E402
+from tools.stub_broker import StubBroker  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк отправки лечений аптечки")
+    parser.add_argument("--taps", type=int, default=1000, help="сколько тапов сымитировать")
+    parser.add_argument("--rate", type=float, default=0.0, help="тапов в секунду (0 — без пауз)")
+    parser.add_argument("--coalesce", action="store_true", help="склеивать пачки в heal:<count>")
+    parser.add_argument("--max-pending", type=int, default=64, help="размер очереди издателя")
+    args = parser.parse_args()
+
+    broker = StubBroker().start()
+    os.environ["PONOS_BROKER"] = broker.host
+    os.environ["PONOS_PORT"] = str(broker.port)
+    os.environ.pop("PONOS_MQTT_BUS", None)
+
+    import paho.mqtt.client as mqtt
+    from PySide6.QtCore import QCoreApplication, Qt
+
+    sys.path.insert(0, str(PROJECT_ROOT / "modes" / "medkit"))
+    import medkit
+
+    app = QCoreApplication(sys.argv)  # noqa: F841 - QObject-сигналы без цикла событий
+    received = [0]
+    done = threading.Event()
+
+    def on_message(client, userdata, msg):
+        body = msg.payload.decode(errors="ignore")
+        _, _, count = body.partition(":")
+        received[0] += int(count) if count.isdigit() else 1
+
+    sink = mqtt.Client()
+    sink.on_message = on_message
+    sink.connect(broker.host, broker.port, 60)
+    sink.subscribe(medkit.ACTION_TOPIC, qos=1)
+    sink.loop_start()
+
+    latencies: List[float] = []
+    delivered = [0]
+    failed = [0]
+
+    def on_delivered(count, latency_ms):
+        delivered[0] += count
+        latencies.extend([latency_ms] * count)
+        if delivered[0] + failed[0] >= args.taps:
+            done.set()
+
+    def on_failed(count):
+        failed[0] += count
+        if delivered[0] + failed[0] >= args.taps:
+            done.set()
+
+    publisher = medkit.HealPublisher(max_pending=args.max_pending, coalesce=args.coalesce)
+    publisher.healDelivered.connect(on_delivered, Qt.DirectConnection)
+    publisher.healFailed.connect(on_failed, Qt.DirectConnection)
+    time.sleep(0.3)
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    started = time.perf_counter()
+    for i in range(args.taps):
+        publisher.heal()
+        if interval:
+            next_at = started + (i + 1) * interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    tapped = time.perf_counter() - started
+    done.wait(timeout=30)
+    finished = time.perf_counter() - started
+    time.sleep(0.3)
+
+    publisher.close()
+    sink.loop_stop()
+    broker.stop()
+
+    print()
+    print(f"тапов: {args.taps} за {tapped:.3f} с ({args.taps / max(tapped, 1e-9):.0f}/с), coalesce={args.coalesce}")
+    print(f"подтверждено: {delivered[0]}  потеряно: {failed[0]}  дошло до брокера: {received[0]}")
+    print(f"пропускная способность: {delivered[0] / max(finished, 1e-9):.0f} лечений/с")
+    print("  " + format_ms("тап -> PUBACK", latencies))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
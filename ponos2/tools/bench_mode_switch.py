@@ -0,0 +1,186 @@
+"""Mode-switch latency benchmark for the supervisor.
+
+Starts a local stub broker, drives ``app.on_mode_message`` -> ``cmd_queue`` ->
+``start_mode()`` exactly like ``app.main()`` does and runs every mode under the
+offscreen Qt platform. For each switch it records:
+
+* switch: payload arrival on ``arena/point/{ID}/mode`` -> first frame of the new mode;
+* blocked: how long ``start_mode()`` waited on the outgoing mode's teardown;
+* teardown: how long the outgoing process actually took to exit (``app.teardown_stats``).
+
+Modes hosted in-process (``"inprocess": true``) are timed through the host pid.
+
+    python tools/bench_mode_switch.py --rounds 5
+    python tools/bench_mode_switch.py --modes wait bomb --no-pool
+    python tools/bench_mode_switch.py --handover overlap
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from tools.benchutil import format_ms  # noqa: E402
+from tools.stub_broker import StubBroker  # noqa: E402
+
+
+def _read_probe(path: Path, pid: int, offset: int = 0) -> float | None:
+    """First mark written by ``pid`` after byte ``offset`` of the probe file."""
+    try:
+        with open(path, "rb") as fh:
+            fh.seek(offset)
+            lines = fh.read().decode("ascii", errors="ignore").splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == str(pid):
+            return float(parts[1])
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк переключения режимов супервизора")
+    parser.add_argument("--modes", nargs="*", help="режимы из modes/*/manifest.json (по умолчанию все)")
+    parser.add_argument("--rounds", type=int, default=3, help="сколько раз переключиться в каждый режим")
+    parser.add_argument("--timeout", type=float, default=30.0, help="ожидание первого кадра, сек")
+    parser.add_argument("--settle", type=float, default=4.0,
+                        help="пауза после кадра перед следующим переключением (дольше MODE_POOL_REFILL_DELAY)")
+    parser.add_argument("--no-pool", action="store_true", help="отключить прогретый пул (холодный запуск)")
+    parser.add_argument("--handover", choices=("sequential", "parallel", "overlap"),
+                        help="политика смены режима (по умолчанию MODE_HANDOVER из config.py)")
+    args = parser.parse_args()
+
+    broker = StubBroker().start()
+    probe_path = Path(tempfile.mkstemp(prefix="ponos_probe_", suffix=".log")[1])
+    os.environ["PONOS_BROKER"] = broker.host
+    os.environ["PONOS_PORT"] = str(broker.port)
+    os.environ["PONOS_FRAME_PROBE"] = str(probe_path)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import config
+    if args.no_pool:
+        config.MODE_POOL_SIZE = 0
+    if args.handover:
+        config.MODE_HANDOVER = args.handover
+
+    import paho.mqtt.client as mqtt
+    import app
+    import fastlog
+
+    fastlog.setup("bench")
+
+    arrivals: Dict[str, float] = {}
+    orig_on_mode_message = app.on_mode_message
+
+    def on_mode_message(client, userdata, msg):
+        arrivals[msg.payload.decode(errors="ignore").strip()] = time.monotonic()
+        orig_on_mode_message(client, userdata, msg)
+
+    app.on_mode_message = on_mode_message
+
+    blocked_last = [0.0]
+    orig_retire = app._retire
+
+    def retire(victims, policy=app.HANDOVER, wait=True):
+        t0 = time.monotonic()
+        orig_retire(victims, policy, wait)
+        blocked_last[0] = time.monotonic() - t0
+
+    app._retire = retire
+
+    connected = threading.Event()
+    supervisor = mqtt.Client()
+
+    def on_connect(client, userdata, flags, rc):
+        app.on_connect(client, userdata, flags, rc)
+        connected.set()
+
+    supervisor.on_connect = on_connect
+    app.setup_routing(supervisor)
+    supervisor.connect(broker.host, broker.port, 60)
+    supervisor.loop_start()
+    publisher = mqtt.Client()
+    publisher.connect(broker.host, broker.port, 60)
+    publisher.loop_start()
+    if not connected.wait(5):
+        print("❌ Супервизор не подключился к заглушке брокера")
+        return 1
+
+    modes = args.modes or [m.id for m in app.registry.list_modes()]
+    missing = [m for m in modes if m not in app.registry]
+    if missing:
+        print("❌ Неизвестные режимы:", ", ".join(missing))
+        return 1
+
+    # прогреваем пул и хост так же, как это делает app.main()
+    app.pool.maintain()
+    if app.HOST_ENABLED and any(app.registry.get(m).inprocess for m in modes):
+        app._ensure_host()
+    time.sleep(args.settle)
+
+    switch: Dict[str, List[float]] = {m: [] for m in modes}
+    blocked: Dict[str, List[float]] = {m: [] for m in modes}
+    previous = None
+    try:
+        for _ in range(max(1, args.rounds)):
+            for mode_id in modes:
+                probe_offset = probe_path.stat().st_size
+                blocked_last[0] = 0.0
+                publisher.publish(app.TOPIC_MODE, mode_id, qos=1)
+                cmd = app.cmd_queue.get(timeout=args.timeout).strip()
+                app.start_mode(cmd)
+                if previous is not None:
+                    blocked[previous].append(blocked_last[0])
+                proc = app.processes.get(mode_id) or app.processes.get(app.HOST_NAME)
+                if proc is None:
+                    print(f"⚠️ Режим {mode_id} не запустился")
+                    previous = None
+                    continue
+                deadline = time.monotonic() + args.timeout
+                frame_at = None
+                while frame_at is None and time.monotonic() < deadline and proc.poll() is None:
+                    frame_at = _read_probe(probe_path, proc.pid, probe_offset)
+                    if frame_at is None:
+                        time.sleep(0.005)
+                if frame_at is None:
+                    print(f"⚠️ Режим {mode_id}: первый кадр не получен (pid={proc.pid})")
+                else:
+                    switch[mode_id].append(frame_at - arrivals[mode_id])
+                previous = mode_id
+                app.pool.maintain()
+                time.sleep(args.settle)
+                app.pool.maintain()
+    finally:
+        app._host_send("quit")
+        app.stop_all_processes(except_name=None)
+        app._join_retiring()
+        app.pool.close()
+        supervisor.loop_stop()
+        publisher.loop_stop()
+        broker.stop()
+        probe_path.unlink(missing_ok=True)
+
+    print()
+    print("Переключение (сообщение mode -> первый кадр):")
+    for mode_id in modes:
+        print("  " + format_ms(mode_id, [v * 1000.0 for v in switch[mode_id]]))
+    print(f"Ожидание завершения уходящего режима в start_mode() (MODE_HANDOVER={app.HANDOVER}):")
+    for mode_id in modes:
+        print("  " + format_ms(mode_id, [v * 1000.0 for v in blocked[mode_id]]))
+    print("Фактическое завершение процессов (среднее / максимум):")
+    for name, st in sorted(app.teardown_stats.items()):
+        print(f"  {name}: {st['total'] / st['count'] * 1000.0:.1f} / {st['max'] * 1000.0:.1f} мс (n={st['count']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Payload parsing benchmark: per-topic decoders vs. the old try-json-then-fallback.
+
+``legacy_*`` below are the parsers the modes used before ``payloads.py``
+(dome/terminal ``_parse_payload`` plus the event dict, control
+``parse_event``, bomb ``_on_message``), kept here as the "before" numbers.
+Both sides include building the event the mode hands to the GUI thread.
+Each workload is a typical message for that topic; the result is
+nanoseconds per message. A second table compares the text form of the
+high-rate messages with their binary frames (size and decode time).
+
+    python tools/bench_payloads.py
+    python tools/bench_payloads.py --n 500000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from tools.benchutil import ns_per_call  # noqa: E402
+from payloads import (AUTO, INT, JSON, TOKEN, Event, PayloadDecoders, encode_bonus,  # noqa: E402
+                      encode_dome_state, encode_hit)
+
+HIT_TOPIC = "arena/point/01/hit"
+TIME_TOPIC = "arena/point/01/time"
+STATE_TOPIC = "arena/dome/DOME_1/state"
+SUPER_TOPIC = "arena/supertopic"
+
+
+def legacy_try_json(topic: str, payload: bytes):
+    """dome/terminal ``_parse_payload`` and the event dict built in ``_on_message``."""
+    try:
+        text = payload.decode("utf-8", errors="ignore")
+    except Exception:
+        text = ""
+    try:
+        value = json.loads(text)
+    except Exception:
+        value = (text or "").strip()
+    return {"kind": "hit", "payload": value, "topic": topic, "at": time.monotonic()}
+
+
+def legacy_control(topic: str, payload: bytes):
+    received_at = time.monotonic()
+    value = payload.decode(errors="ignore").strip().lower()
+    if topic == HIT_TOPIC:
+        return Event("hit", value, topic, received_at) if value in ("red", "blue") else None
+    if topic == TIME_TOPIC:
+        try:
+            seconds = int(value)
+        except ValueError:
+            return None
+        return Event("time", seconds, topic, received_at) if seconds > 0 else None
+    return None
+
+
+def legacy_bomb(payload: bytes):
+    text = payload.decode(errors="ignore").strip()
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора MQTT-payload")
+    parser.add_argument("--n", type=int, default=100_000, help="сообщений на каждый замер")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # предупреждения о мусорных payload в замере не нужны
+
+    dome = PayloadDecoders().add(HIT_TOPIC, "hit", AUTO).add(STATE_TOPIC, "dome_state", JSON)
+    terminal = PayloadDecoders().add(SUPER_TOPIC, "super", AUTO)
+    control = (PayloadDecoders()
+               .add(HIT_TOPIC, "hit", TOKEN, check=frozenset({"red", "blue"}).__contains__)
+               .add(TIME_TOPIC, "time", INT, check=lambda s: s > 0))
+    bomb = PayloadDecoders().add(TIME_TOPIC, "time", INT)
+
+    state = json.dumps({"hp_current": 640, "hp_max": 1000, "state": "ACTIVE"}).encode()
+    bonus = json.dumps({"type": "bonus_activate", "terminal_id": "term_01"}).encode()
+    cases = [
+        ("dome hit 'red'", lambda: legacy_try_json(HIT_TOPIC, b"red"), lambda: dome.decode(HIT_TOPIC, b"red")),
+        ("dome state JSON", lambda: legacy_try_json(STATE_TOPIC, state), lambda: dome.decode(STATE_TOPIC, state)),
+        ("terminal token", lambda: legacy_try_json(SUPER_TOPIC, b"dome_destroyed_red_DOME_1"),
+         lambda: terminal.decode(SUPER_TOPIC, b"dome_destroyed_red_DOME_1")),
+        ("terminal JSON", lambda: legacy_try_json(SUPER_TOPIC, bonus), lambda: terminal.decode(SUPER_TOPIC, bonus)),
+        ("control hit", lambda: legacy_control(HIT_TOPIC, b"blue"), lambda: control.decode(HIT_TOPIC, b"blue")),
+        ("control time", lambda: legacy_control(TIME_TOPIC, b"300"), lambda: control.decode(TIME_TOPIC, b"300")),
+        ("bomb time", lambda: legacy_bomb(b"45"), lambda: bomb.decode(TIME_TOPIC, b"45")),
+        ("bomb garbage", lambda: legacy_bomb(b"oops"), lambda: bomb.decode(TIME_TOPIC, b"oops")),
+    ]
+
+    print(f"{'payload':<18} {'before':>10} {'after':>10}")
+    for name, before, after in cases:
+        old_ns = ns_per_call(before, args.n)
+        new_ns = ns_per_call(after, args.n)
+        print(f"{name:<18} {old_ns:8.0f} ns {new_ns:8.0f} ns  x{old_ns / new_ns:.2f}")
+    print(f"ошибки разбора (bomb): {bomb.failures}")
+
+    choice = {"type": "bonus_choice", "terminal_id": "term_01", "point_id": "01", "dome_id": "DOME_1",
+              "team": "red", "choice": "keep_ammo", "auto": False, "timestamp": 1700000000}
+    frames = [
+        ("hit", dome, HIT_TOPIC, b"red", encode_hit("red")),
+        ("dome state", dome, STATE_TOPIC, state, encode_dome_state(json.loads(state))),
+        ("bonus choice", terminal, SUPER_TOPIC, json.dumps(choice).encode(), encode_bonus(choice)),
+    ]
+    print()
+    print(f"{'frame':<18} {'text':>16} {'binary':>16}")
+    for name, decoders, topic, text, binary in frames:
+        assert decoders.decode(topic, text).value == decoders.decode(topic, binary).value
+        text_ns = ns_per_call(lambda: decoders.decode(topic, text), args.n)
+        bin_ns = ns_per_call(lambda: decoders.decode(topic, binary), args.n)
+        print(f"{name:<18} {len(text):4d} B {text_ns:6.0f} ns {len(binary):4d} B {bin_ns:6.0f} ns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Small helpers shared by the benchmark scripts in tools/."""
+from __future__ import annotations
+
+import subprocess
+import sys
+import time
+from typing import List
+
+from metrics import percentile  # noqa: F401 - общий nearest-rank, инструменты берут его отсюда
+
+
+def format_ms(name: str, values_ms: List[float]) -> str:
+    return (f"{name:<16} n={len(values_ms):<5} p50={percentile(values_ms, 50):8.2f} ms  "
+            f"p95={percentile(values_ms, 95):8.2f} ms  p99={percentile(values_ms, 99):8.2f} ms")
+
+
+def ns_per_call(fn, n: int, repeat: int = 5) -> float:
+    """Best of ``repeat`` runs of ``n`` calls — на загруженной плате разброс между прогонами большой."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for _ in range(n):
+            fn()
+        elapsed = (time.perf_counter_ns() - started) / n
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def connect(host: str, port: int, client_id: str = "", on_connect=None, on_message=None):
+    """paho client with callbacks set before connecting and its network loop running."""
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client(client_id=client_id)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(host, port, 60)
+    client.loop_start()
+    return client
+
+
+def start_mode(mode: str, env: dict) -> subprocess.Popen:
+    """Run a mode from modes/*/manifest.json as its own process with ``env``."""
+    from mode_registry import ModeRegistry
+
+    config = ModeRegistry().get(mode)
+    if config is None:
+        raise SystemExit(f"режим {mode!r} не найден в modes/")
+    cmd = [sys.executable, str(config.entry)] + list(config.args)
+    return subprocess.Popen(cmd, cwd=str(config.workdir), env=env)
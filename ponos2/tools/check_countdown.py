@@ -0,0 +1,183 @@
+"""Regression check: stopping a countdown never fires ``expired`` under the caller.
+
+Runs on a fake clock (no waiting): every scenario moves the clock past the
+deadline *before* the single-shot timer has had a chance to fire — the case
+where ``Countdown.pause()`` used to emit ``expired`` synchronously from
+inside the caller's own handler:
+
+* ``Countdown`` itself — ``pause()``/``stop()`` return True, ``expired`` comes
+  once, from the event loop;
+* bomb — the correct code entered in that millisecond: spetsnaz win and only
+  their event is published;
+* terminal — a choice made in that millisecond: the player's choice is
+  published, not the default one;
+* control — a hit for the other team in that millisecond: the team whose
+  time ran out wins, the hit does not start the new team's countdown.
+
+Exit code 1 if any scenario fails.
+
+    python tools/check_countdown.py
+"""
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _mode_module(name: str, module: str):
+    path = str(PROJECT_ROOT / "modes" / name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(module)
+
+
+def _settle(app) -> None:
+    """Deliver what was queued (the 0 ms timer and queued signals), without waiting for real time."""
+    for _ in range(5):
+        app.processEvents()
+
+
+def check_countdown(app, clock: FakeClock) -> List[str]:
+    from countdown import Countdown
+
+    errors = []
+    countdown = Countdown(clock=clock)
+    fired = []
+    countdown.expired.connect(lambda: fired.append(clock.now))
+    countdown.start(5)
+    clock.now += 5.5
+    if not countdown.pause():
+        errors.append("pause() после срока вернул False")
+    if fired:
+        errors.append("expired внутри pause()")
+    if countdown.stop():
+        errors.append("повторный stop() снова сообщил об истечении")
+    _settle(app)
+    if len(fired) != 1:
+        errors.append(f"expired после цикла событий: {len(fired)} раз вместо 1")
+    if countdown.remaining != 0:
+        errors.append(f"после истечения показано {countdown.remaining}")
+
+    countdown.start(5)
+    clock.now += 2.2
+    if countdown.pause() or countdown.remaining != 3:
+        errors.append(f"пауза до срока: remaining={countdown.remaining}")
+    clock.now += 60
+    countdown.resume()
+    if countdown.remaining != 3:
+        errors.append(f"пауза не остановила отсчёт: remaining={countdown.remaining}")
+    countdown.reset(10)
+    _settle(app)
+    if len(fired) != 1:
+        errors.append("reset() не отменил отсчёт")
+    return errors
+
+
+def check_bomb(app, clock: FakeClock) -> List[str]:
+    import config
+
+    config.OUTBOX_DIR = None  # журнал в памяти — проверка не пишет в рабочий каталог
+    bomb = _mode_module("bomb", "bomb")
+    bomb.BROKER, bomb.PORT = "127.0.0.1", 1  # отказ сразу, без ожидания таймаута
+    backend = bomb.Backend()
+    published = []
+    backend._publish_super_event = published.append
+    backend.countdown._clock = clock
+    errors = []
+    try:
+        for digit in "1234":
+            backend._pressNumber(int(digit))
+        backend.buttonEnter()  # первый ввод — установка кода и старт таймера
+        backend.startTimer(30)
+        clock.now += 30.2
+        for digit in "1234":
+            backend._pressNumber(int(digit))
+        backend.buttonEnter()
+        _settle(app)
+        if backend.winnerText != "СПЕЦНАЗ ПОБЕДИЛ!":
+            errors.append(f"победитель: {backend.winnerText!r}")
+        if published != [f"bomb_defused_spetsnaz_{bomb.ID}"]:
+            errors.append(f"опубликовано: {published}")
+    finally:
+        backend.shutdown()
+    return errors
+
+
+def check_terminal(app, clock: FakeClock) -> List[str]:
+    terminal = _mode_module("dome_terminal", "terminal")
+    published = []
+    backend = terminal.BonusTerminalBackend("term_01", published.append, "keep_ammo")
+    backend._countdown._clock = clock
+    backend.activate({"type": "bonus_activate", "team": "red", "dome_id": "DOME_1", "timeout_sec": 15})
+    clock.now += 15.2
+    backend._select_choice("super_shots")
+    _settle(app)
+    choices = [(p["choice"], p["auto"]) for p in published]
+    if choices != [("super_shots", False)]:
+        return [f"опубликован выбор: {choices}"]
+    return []
+
+
+def check_control(app, clock: FakeClock) -> List[str]:
+    control = _mode_module("control", "control")
+    state = control.CaptureState(10)
+    for countdown in state._countdowns.values():
+        countdown._clock = clock
+    finished = []
+    state.gameFinished.connect(finished.append)
+    state.capture("red", 10)
+    clock.now += 10.2
+    state.capture("blue", 10)
+    errors = []
+    if finished:
+        errors.append("gameFinished внутри capture()")
+    _settle(app)
+    if finished != ["red"]:
+        errors.append(f"gameFinished: {finished}")
+    if state.active_team != "red" or state.remaining("blue") != 10:
+        errors.append(f"захват после истечения принят: active={state.active_team} blue={state.remaining('blue')}")
+    return errors
+
+
+def main() -> int:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ.pop("PONOS_MQTT_BUS", None)
+    import fastlog
+    from PySide6.QtCore import QCoreApplication
+
+    fastlog.setup("check_countdown", level="WARNING")
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+    checks: List[Tuple[str, Callable]] = [
+        ("countdown", check_countdown),
+        ("bomb", check_bomb),
+        ("terminal", check_terminal),
+        ("control", check_control),
+    ]
+    failed = 0
+    for name, check in checks:
+        errors = check(app, FakeClock())
+        if errors:
+            failed += 1
+            print(f"❌ {name}: {'; '.join(errors)}")
+        else:
+            print(f"✅ {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
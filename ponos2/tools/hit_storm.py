@@ -0,0 +1,224 @@
+"""Hit-storm load generator: floods arena/point/{ID}/hit and /time for many points.
+
+Starts the bundled stub broker (``tools/stub_broker.py``) unless ``--host``
+is given, optionally runs modes against it (``--mode control --mode dome``)
+and publishes hits for ``--points`` point ids at ``--rate`` hits/s each,
+teams drawn from ``--teams``. Every ``--time-every`` seconds each point also
+gets a round time on ``/time``.
+
+At the end it compares, for the local point (``ID`` from config.py):
+
+* delivered — messages the generator published to that point's topics;
+* processed — events the mode's GUI thread actually handled, from the
+  mode's metrics (control ``events_total``, dome ``hits_total``);
+
+and prints the mode's hit latency and the deepest event queue it reported.
+
+    python tools/hit_storm.py --points 50 --rate 20 --duration 10 --mode control --mode dome
+    python tools/hit_storm.py --points 200 --rate 5 --teams red=3,blue=1 --binary
+    python tools/hit_storm.py --host 127.0.0.1 --port 1883 --points 10 --rate 100
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from tools.benchutil import connect, format_ms, start_mode  # noqa: E402
+from tools.stub_broker import StubBroker  # noqa: E402
+
+# что считать «обработанным» в метриках режима
+PROCESSED_COUNTERS = {"control": "events_total", "dome": "hits_total"}
+
+
+def parse_teams(spec: str) -> Tuple[List[str], List[float]]:
+    """``red=3,blue=1`` -> (["red", "blue"], [3.0, 1.0])."""
+    teams, weights = [], []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            teams.append(name.strip().lower())
+            weights.append(float(weight or 1))
+    if not teams:
+        raise SystemExit("пустой --teams")
+    return teams, weights
+
+
+class ModeWatch:
+    """Collects the metrics snapshots modes publish to arena/point/{ID}/metrics/<mode>."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[Tuple[float, dict]]] = {}
+        self._lock = threading.Lock()
+
+    def on_message(self, client, userdata, msg) -> None:
+        try:
+            snapshot = json.loads(msg.payload)
+        except ValueError:
+            return
+        with self._lock:
+            self.samples.setdefault(msg.topic.rsplit("/", 1)[-1], []).append((time.monotonic(), snapshot))
+
+    def counter(self, mode: str, name: str, since: float, until: float | None = None) -> Tuple[float, float]:
+        """(count at the first snapshot after ``since``, count at the last one before ``until``) and their times."""
+        with self._lock:
+            rows = [(t, s.get("c", {}).get(name, 0.0)) for t, s in self.samples.get(mode, [])
+                    if t >= since and (until is None or t <= until)]
+        return rows[0] if rows else (since, 0.0), rows[-1] if rows else (since, 0.0)
+
+    def last(self, mode: str) -> dict:
+        with self._lock:
+            rows = self.samples.get(mode) or []
+            return rows[-1][1] if rows else {}
+
+    def max_gauge(self, mode: str, name: str) -> float:
+        with self._lock:
+            return max((s.get("g", {}).get(name, 0.0) for _, s in self.samples.get(mode, [])), default=0.0)
+
+
+def storm(client, ids: List[str], rate: float, duration: float, teams, weights, time_every: float,
+          time_value: int, binary: bool, seed: int) -> Tuple[Dict[str, int], Dict[str, int], List[float], float]:
+    """Publish at ``rate`` hits/s per point; returns (hits per id, /time per id, schedule lag ms, elapsed)."""
+    from payloads import encode_hit
+
+    rng = random.Random(seed)
+    hit_topics = [f"arena/point/{pid}/hit" for pid in ids]
+    time_topics = [f"arena/point/{pid}/time" for pid in ids]
+    hits = {pid: 0 for pid in ids}
+    times = {pid: 0 for pid in ids}
+    total_rate = rate * len(ids)
+    interval = 1.0 / total_rate if total_rate > 0 else 0.0
+    lags: List[float] = []
+    started = time.monotonic()
+    next_time = started
+    i = 0
+    while True:
+        now = time.monotonic()
+        if now - started >= duration:
+            break
+        if time_every > 0 and now >= next_time:
+            for pid, topic in zip(ids, time_topics):
+                client.publish(topic, str(time_value))
+                times[pid] += 1
+            next_time += time_every
+        k = i % len(ids)
+        team = rng.choices(teams, weights)[0]
+        client.publish(hit_topics[k], encode_hit(team) if binary else team)
+        hits[ids[k]] += 1
+        i += 1
+        if interval:
+            due = started + i * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif i % 100 == 0:
+                lags.append(-delay * 1000.0)
+    return hits, times, lags, time.monotonic() - started
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный генератор попаданий для control/dome")
+    parser.add_argument("--points", type=int, default=20, help="сколько точек (ID 01..N, ID из config.py добавляется)")
+    parser.add_argument("--rate", type=float, default=10.0, help="попаданий в секунду на точку")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность шторма, сек")
+    parser.add_argument("--teams", default="red=1,blue=1", help="команды и веса: red=3,blue=1")
+    parser.add_argument("--time-every", type=float, default=0.0, help="период публикаций /time, сек (0 — нет)")
+    parser.add_argument("--time-value", type=int, default=120, help="значение для /time")
+    parser.add_argument("--binary", action="store_true", help="бинарные кадры попаданий (payloads.encode_hit)")
+    parser.add_argument("--mode", action="append", default=[], help="запустить режим на время теста (повторяемый)")
+    parser.add_argument("--host", help="внешний брокер; по умолчанию поднимается локальная заглушка")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--warmup", type=float, default=4.0, help="пауза на запуск режимов, сек")
+    parser.add_argument("--drain", type=float, default=3.0, help="ожидание после шторма, сек")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import config as _cfg
+
+    teams, weights = parse_teams(args.teams)
+    ids = [f"{i:02d}" for i in range(1, max(1, args.points) + 1)]
+    if _cfg.ID not in ids:
+        ids[-1] = _cfg.ID
+
+    broker = None
+    if args.host:
+        host, port = args.host, args.port or 1883
+    else:
+        broker = StubBroker().start()
+        host, port = broker.host, broker.port
+
+    watch = ModeWatch()
+    metrics_filter = f"arena/point/{_cfg.ID}/metrics/+"
+    watcher = connect(host, port, on_connect=lambda c, u, f, rc: c.subscribe(metrics_filter),
+                      on_message=watch.on_message)
+    env = dict(os.environ, PONOS_BROKER=host, PONOS_PORT=str(port), PONOS_METRICS_INTERVAL="1")
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env.pop("PONOS_MQTT_BUS", None)
+    procs: List[subprocess.Popen] = [start_mode(mode, env) for mode in args.mode]
+    if procs:
+        time.sleep(args.warmup)
+
+    client = connect(host, port, "ponos-hit-storm")
+    print(f"🌩 {len(ids)} точек × {args.rate:g} попаданий/с = {len(ids) * args.rate:g}/с на {host}:{port}, "
+          f"{args.duration:g} с, команды {args.teams}{', бинарно' if args.binary else ''}")
+    storm_started = time.monotonic()
+    hits, times, lags, elapsed = storm(client, ids, args.rate, args.duration, teams, weights, args.time_every,
+                                args.time_value, args.binary, args.seed)
+    storm_finished = time.monotonic()
+    total = sum(hits.values()) + sum(times.values())
+    print(f"⏹ Отправлено {total} сообщений за {elapsed:.2f} с ({total / elapsed:.0f}/с)")
+    if lags:
+        print("  " + format_ms("генератор отстал", lags))
+    if broker is not None:
+        print(f"  брокер принял {broker.published} публикаций")
+
+    time.sleep(args.drain)
+    for mode in args.mode:
+        counter = PROCESSED_COUNTERS.get(mode)
+        last = watch.last(mode)
+        print(f"📈 {mode} (точка {_cfg.ID}):")
+        if not last:
+            print("  ⚠️ метрик нет (режим не запустился или METRICS_ENABLED выключен)")
+            continue
+        if counter:
+            (t0, c0), (t1, c1) = watch.counter(mode, counter, storm_started, storm_finished)
+            during = (c1 - c0) / (t1 - t0) if t1 > t0 else 0.0
+            processed = last.get("c", {}).get(counter, 0.0)
+            # dome не подписан на /time
+            delivered = hits[_cfg.ID] + (times[_cfg.ID] if mode == "control" else 0)
+            print(f"  доставлено {delivered} ({delivered / elapsed:.0f}/с), обработано {processed:g} "
+                  f"(во время шторма {during:.0f}/с), потеряно/в очереди {delivered - processed:g}")
+        for key, value in sorted((last.get("h") or {}).items()):
+            count, _, p50, p95, p99 = value
+            print(f"  {key:<24} n={count:<6} p50≤{p50:g} мс  p95≤{p95:g} мс  p99≤{p99:g} мс")
+        print(f"  event_queue_depth max     {watch.max_gauge(mode, 'event_queue_depth'):g}")
+
+    for proc in procs:
+        proc.send_signal(signal.SIGINT)
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    client.loop_stop()
+    client.disconnect()
+    watcher.loop_stop()
+    if broker is not None:
+        broker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""Record arena MQTT traffic to a compact log and replay it faster than real time.
+
+    python tools/mqtt_record.py record night.mqr                 # broker from config.py
+    python tools/mqtt_record.py record night.mqr --host 192.168.1.21 --filter 'arena/#'
+    python tools/mqtt_record.py info night.mqr
+    python tools/mqtt_record.py replay night.mqr --speed 10 --mode dome --point 02
+    python tools/mqtt_record.py replay night.mqr --speed 0 --host 127.0.0.1 --port 1883
+
+Log format (little-endian, append-only, read through ``mmap``)::
+
+    header   "PONOSMQR" <version:u16> <started:f64 unix time>
+    topic    01 <topic_id:u16> <len:u16> <utf-8 topic>            — first time a topic is seen
+    message  02 <t_ns:u64> <topic_id:u16> <flags:u8> <len:u32> <payload>
+
+``t_ns`` is monotonic time since the start of the recording; ``flags`` holds
+QoS (bits 0-1) and retain (bit 2). A record cut off by a crash is ignored.
+
+``replay`` publishes the log to a local stub broker (or ``--host/--port``)
+at ``--speed`` x real time (0 — as fast as possible). With ``--mode`` it
+first starts that mode against the broker and, at the end, prints the
+mode's metrics snapshot (hit latency, queue depth): that is how far the
+mode fell behind the replay. Telemetry the points published themselves
+(``.../metrics``, ``.../heartbeat``, ``.../log``) is recorded but not replayed. ``--point`` rewrites ``arena/point/<any>/``
+to the given point id so a recording from another board reaches the mode.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import re
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from tools.benchutil import connect, format_ms, start_mode  # noqa: E402
+from tools.stub_broker import StubBroker  # noqa: E402
+
+MAGIC = b"PONOSMQR"
+VERSION = 1
+HEADER = struct.Struct("<8sHd")
+TOPIC_HEAD = struct.Struct("<BHH")
+MESSAGE_HEAD = struct.Struct("<BQHBI")
+_TOPIC, _MESSAGE = 1, 2
+
+DEFAULT_FILTERS = ("arena/point/+/#", "arena/dome/#", "arena/supertopic")
+
+
+class LogWriter:
+    """Appends messages; topics are interned so each record carries a 2-byte id."""
+
+    def __init__(self, path: str) -> None:
+        self._fh = open(path, "wb")
+        self._fh.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self._topics: Dict[str, int] = {}
+        self._started = time.monotonic_ns()
+        self._lock = threading.Lock()
+        self.count = 0
+        self.bytes = HEADER.size
+
+    def write(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> None:
+        t_ns = time.monotonic_ns() - self._started
+        with self._lock:
+            topic_id = self._topics.get(topic)
+            if topic_id is None:
+                topic_id = self._topics[topic] = len(self._topics)
+                raw = topic.encode("utf-8")
+                self._fh.write(TOPIC_HEAD.pack(_TOPIC, topic_id, len(raw)) + raw)
+                self.bytes += TOPIC_HEAD.size + len(raw)
+            flags = (qos & 3) | (4 if retain else 0)
+            self._fh.write(MESSAGE_HEAD.pack(_MESSAGE, t_ns, topic_id, flags, len(payload)))
+            self._fh.write(payload)
+            self.count += 1
+            self.bytes += MESSAGE_HEAD.size + len(payload)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._fh.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
+
+
+class LogReader:
+    """Iterates a log through ``mmap``: the file is paged in lazily, however long the game night was."""
+
+    def __init__(self, path: str) -> None:
+        self._fh = open(path, "rb")
+        size = os.fstat(self._fh.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError(f"{path}: не журнал MQTT (слишком короткий)")
+        self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.started = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не журнал MQTT или неизвестная версия {version}")
+
+    def __iter__(self) -> Iterator[Tuple[int, str, bytes, int, bool]]:
+        """Yield ``(t_ns, topic, payload, qos, retain)``."""
+        data = self._map
+        topics: Dict[int, str] = {}
+        pos, end = HEADER.size, len(self._map)
+        while pos < end:
+            kind = data[pos]
+            if kind == _TOPIC:
+                if pos + TOPIC_HEAD.size > end:
+                    break
+                _, topic_id, length = TOPIC_HEAD.unpack_from(data, pos)
+                pos += TOPIC_HEAD.size
+                if pos + length > end:
+                    break
+                topics[topic_id] = data[pos:pos + length].decode("utf-8")
+                pos += length
+            elif kind == _MESSAGE:
+                if pos + MESSAGE_HEAD.size > end:
+                    break
+                _, t_ns, topic_id, flags, length = MESSAGE_HEAD.unpack_from(data, pos)
+                pos += MESSAGE_HEAD.size
+                if pos + length > end:
+                    break  # запись оборвана при падении рекордера
+                yield t_ns, topics[topic_id], data[pos:pos + length], flags & 3, bool(flags & 4)
+                pos += length
+            else:
+                raise ValueError(f"повреждённый журнал: неизвестная запись {kind} на смещении {pos}")
+
+    def close(self) -> None:
+        self._map.close()
+        self._fh.close()
+
+
+def record(args) -> int:
+    from config import BROKER, PORT
+
+    writer = LogWriter(args.log)
+    filters = args.filter or list(DEFAULT_FILTERS)
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    client = connect(args.host or BROKER, args.port or PORT,
+                      on_connect=lambda c, u, f, rc: c.subscribe([(t, 0) for t in filters]),
+                      on_message=lambda c, u, msg: writer.write(msg.topic, msg.payload, msg.qos, msg.retain))
+    print(f"⏺ Запись {', '.join(filters)} в {args.log} (Ctrl+C — стоп)")
+    started = time.monotonic()
+    try:
+        while not stop.wait(1.0):
+            writer.flush()
+            if args.duration and time.monotonic() - started >= args.duration:
+                break
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        writer.close()
+    print(f"⏹ Записано {writer.count} сообщений, {writer.bytes} байт за {time.monotonic() - started:.1f} с")
+    return 0
+
+
+def info(args) -> int:
+    reader = LogReader(args.log)
+    per_topic: Dict[str, List[int]] = {}
+    last_ns = 0
+    for t_ns, topic, payload, _, _ in reader:
+        row = per_topic.setdefault(topic, [0, 0])
+        row[0] += 1
+        row[1] += len(payload)
+        last_ns = t_ns
+    reader.close()
+    duration = last_ns / 1e9
+    total = sum(row[0] for row in per_topic.values())
+    print(f"{args.log}: {total} сообщений за {duration:.1f} с, начало записи {time.ctime(reader.started)}")
+    for topic, (count, size) in sorted(per_topic.items(), key=lambda kv: -kv[1][0]):
+        rate = count / duration if duration > 0 else 0.0
+        print(f"  {topic:<40} {count:>8}  {rate:8.1f}/с  {size / max(count, 1):6.1f} Б/сообщ.")
+    return 0
+
+
+def replay(args) -> int:
+    import config as _cfg
+
+    broker = None
+    if args.host:
+        host, port = args.host, args.port or 1883
+    else:
+        broker = StubBroker().start()
+        host, port = broker.host, broker.port
+
+    point_re = re.compile(r"^arena/point/[^/]+/")
+    telemetry_re = re.compile(r"^arena/point/[^/]+/(metrics|heartbeat|log)(/|$)")
+    point_prefix = f"arena/point/{args.point}/" if args.point else None
+    metrics_topic = f"arena/point/{args.point or _cfg.ID}/metrics/"
+    snapshots: Dict[str, dict] = {}
+
+    proc = None
+    watcher = None
+    if args.mode:
+        env = dict(os.environ, PONOS_BROKER=host, PONOS_PORT=str(port),
+                   PONOS_METRICS_INTERVAL=str(args.metrics_interval))
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+        env.pop("PONOS_MQTT_BUS", None)  # режим ходит к брокеру напрямую, без супервизора
+        watcher = connect(host, port,
+                           on_connect=lambda c, u, f, rc: c.subscribe(metrics_topic + "+"),
+                           on_message=lambda c, u, msg: snapshots.__setitem__(
+                               msg.topic.rsplit("/", 1)[-1], json.loads(msg.payload)))
+        proc = start_mode(args.mode, env)
+        time.sleep(args.warmup)
+
+    client = connect(host, port, "ponos-replay")
+    reader = LogReader(args.log)
+    speed = args.speed
+    lags: List[float] = []
+    sent = 0
+    started = time.monotonic()
+    print(f"▶ Воспроизведение {args.log} на {host}:{port}, скорость {'без ограничений' if speed <= 0 else f'x{speed:g}'}")
+    try:
+        for t_ns, topic, payload, qos, retain in reader:
+            if telemetry_re.match(topic):
+                continue
+            if point_prefix:
+                topic = point_re.sub(point_prefix, topic, count=1)
+            if speed > 0:
+                due = started + t_ns / 1e9 / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                lags.append(max(0.0, time.monotonic() - due) * 1000.0)
+            client.publish(topic, payload, qos=qos, retain=retain)
+            sent += 1
+            if args.limit and sent >= args.limit:
+                break
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.monotonic() - started
+    reader.close()
+    print(f"⏹ Отправлено {sent} сообщений за {elapsed:.2f} с ({sent / max(elapsed, 1e-9):.0f}/с)")
+    if lags:
+        print("  " + format_ms("отставание", lags))
+
+    if proc is not None:
+        # даём режиму догнать очередь и прислать свежий снимок метрик
+        time.sleep(args.metrics_interval * 2 + 0.5)
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        watcher.loop_stop()
+        for name, snapshot in sorted(snapshots.items()):
+            print(f"📈 {name}:")
+            for key, value in sorted((snapshot.get("h") or {}).items()):
+                count, total, p50, p95, p99 = value
+                print(f"  {key:<28} n={count:<6} p50≤{p50:g} мс  p95≤{p95:g} мс  p99≤{p99:g} мс")
+            for key, value in sorted((snapshot.get("g") or {}).items()):
+                print(f"  {key:<28} {value:g}")
+            for key, value in sorted((snapshot.get("c") or {}).items()):
+                print(f"  {key:<28} {value:g}")
+        if not snapshots:
+            print("⚠️ Режим не прислал метрик (METRICS_ENABLED выключен?)")
+
+    client.loop_stop()
+    client.disconnect()
+    if broker is not None:
+        broker.stop()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Запись и ускоренное воспроизведение MQTT-трафика арены")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="записать трафик в журнал")
+    rec.add_argument("log")
+    rec.add_argument("--host", help="брокер (по умолчанию BROKER из config.py)")
+    rec.add_argument("--port", type=int)
+    rec.add_argument("--filter", action="append", help=f"фильтр топиков (по умолчанию {', '.join(DEFAULT_FILTERS)})")
+    rec.add_argument("--duration", type=float, default=0.0, help="остановиться через N секунд")
+    rec.set_defaults(func=record)
+
+    inf = sub.add_parser("info", help="сводка по журналу")
+    inf.add_argument("log")
+    inf.set_defaults(func=info)
+
+    rep = sub.add_parser("replay", help="воспроизвести журнал")
+    rep.add_argument("log")
+    rep.add_argument("--speed", type=float, default=1.0, help="множитель скорости (0 — без пауз)")
+    rep.add_argument("--host", help="внешний брокер; по умолчанию поднимается локальная заглушка")
+    rep.add_argument("--port", type=int)
+    rep.add_argument("--mode", help="запустить режим (control, dome, dome_terminal...) на время воспроизведения")
+    rep.add_argument("--point", help="подменить ID точки в arena/point/<ID>/...")
+    rep.add_argument("--warmup", type=float, default=3.0, help="пауза на запуск режима, сек")
+    rep.add_argument("--metrics-interval", type=float, default=1.0, help="период метрик режима, сек")
+    rep.add_argument("--limit", type=int, default=0, help="остановиться после N сообщений")
+    rep.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
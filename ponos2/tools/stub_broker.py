@@ -0,0 +1,301 @@
+"""Minimal in-process MQTT 3.1.1 broker for benchmarks and bench-top testing.
+
+Supports what the arena code uses: CONNECT with last will, SUBSCRIBE with
+``+``/``#`` wildcards, retained messages, QoS 0/1 (QoS 2 is acknowledged and
+delivered as QoS 1), PINGREQ and DISCONNECT. No persistence, no auth.
+
+    python tools/stub_broker.py --port 1883
+"""
+from __future__ import annotations
+
+import argparse
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+def topic_matches(sub: str, topic: str) -> bool:
+    """MQTT filter match (``+`` one level, ``#`` the rest)."""
+    if sub == topic:
+        return True
+    sub_parts = sub.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(sub_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(sub_parts) == len(topic_parts)
+
+
+def _encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def _encode_str(value: bytes) -> bytes:
+    return struct.pack("!H", len(value)) + value
+
+
+def _read_str(data: bytes, pos: int) -> Tuple[bytes, int]:
+    (n,) = struct.unpack_from("!H", data, pos)
+    pos += 2
+    return data[pos:pos + n], pos + n
+
+
+class _Session:
+    def __init__(self, broker: "StubBroker", sock: socket.socket) -> None:
+        self.broker = broker
+        self.sock = sock
+        self.client_id = ""
+        self.subs: Dict[str, int] = {}
+        self.will: Tuple[str, bytes, int, bool] | None = None
+        self._send_lock = threading.Lock()
+        self._next_mid = 0
+
+    def send(self, data: bytes) -> None:
+        with self._send_lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                pass
+
+    def deliver(self, topic: bytes, payload: bytes, qos: int, retain: bool = False) -> None:
+        header = 0x30 | (qos << 1) | (1 if retain else 0)
+        body = _encode_str(topic)
+        if qos:
+            with self._send_lock:
+                self._next_mid = self._next_mid % 0xFFFF + 1
+                mid = self._next_mid
+            body += struct.pack("!H", mid)
+        body += payload
+        self.send(bytes([header]) + _encode_length(len(body)) + body)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: "_Server"
+
+    def _read_exact(self, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.request.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError
+            buf += chunk
+        return bytes(buf)
+
+    def _read_packet(self) -> Tuple[int, bytes]:
+        first = self._read_exact(1)[0]
+        mult, length = 1, 0
+        while True:
+            byte = self._read_exact(1)[0]
+            length += (byte & 0x7F) * mult
+            if not byte & 0x80:
+                break
+            mult *= 128
+        return first, self._read_exact(length) if length else b""
+
+    def handle(self) -> None:
+        broker = self.server.broker
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = _Session(broker, self.request)
+        clean = False
+        try:
+            while True:
+                first, body = self._read_packet()
+                ptype = first >> 4
+                if ptype == 1:
+                    self._on_connect(session, body)
+                elif ptype == 3:
+                    self._on_publish(session, first, body)
+                elif ptype == 6:
+                    session.send(b"\x70\x02" + body[:2])
+                elif ptype == 8:
+                    self._on_subscribe(session, body)
+                elif ptype == 10:
+                    self._on_unsubscribe(session, body)
+                elif ptype == 12:
+                    session.send(b"\xd0\x00")
+                elif ptype == 14:
+                    clean = True
+                    break
+        except (ConnectionError, OSError, struct.error):
+            pass
+        finally:
+            broker._detach(session)
+            if not clean and session.will is not None:
+                topic, payload, qos, retain = session.will
+                broker.publish(topic, payload, qos=qos, retain=retain)
+
+    def _on_connect(self, session: _Session, body: bytes) -> None:
+        _, pos = _read_str(body, 0)
+        pos += 1  # protocol level
+        flags = body[pos]
+        pos += 3  # flags + keepalive
+        client_id, pos = _read_str(body, pos)
+        session.client_id = client_id.decode("utf-8", errors="ignore")
+        if flags & 0x04:
+            will_topic, pos = _read_str(body, pos)
+            will_payload, pos = _read_str(body, pos)
+            session.will = (
+                will_topic.decode("utf-8", errors="ignore"),
+                will_payload,
+                (flags >> 3) & 0x03,
+                bool(flags & 0x20),
+            )
+        self.server.broker._attach(session)
+        session.send(b"\x20\x02\x00\x00")
+
+    def _on_publish(self, session: _Session, first: int, body: bytes) -> None:
+        qos = (first >> 1) & 0x03
+        retain = bool(first & 0x01)
+        topic, pos = _read_str(body, 0)
+        mid = b""
+        if qos:
+            mid = body[pos:pos + 2]
+            pos += 2
+        self.server.broker.publish(topic.decode("utf-8", errors="ignore"), body[pos:], qos=qos, retain=retain)
+        if qos == 1:
+            session.send(b"\x40\x02" + mid)
+        elif qos == 2:
+            session.send(b"\x50\x02" + mid)
+
+    def _on_subscribe(self, session: _Session, body: bytes) -> None:
+        mid = body[:2]
+        pos = 2
+        granted = bytearray()
+        filters: List[str] = []
+        while pos < len(body):
+            raw, pos = _read_str(body, pos)
+            qos = min(body[pos], 1)
+            pos += 1
+            sub = raw.decode("utf-8", errors="ignore")
+            session.subs[sub] = qos
+            filters.append(sub)
+            granted.append(qos)
+        payload = mid + bytes(granted)
+        session.send(b"\x90" + _encode_length(len(payload)) + payload)
+        self.server.broker._send_retained(session, filters)
+
+    def _on_unsubscribe(self, session: _Session, body: bytes) -> None:
+        mid = body[:2]
+        pos = 2
+        while pos < len(body):
+            raw, pos = _read_str(body, pos)
+            session.subs.pop(raw.decode("utf-8", errors="ignore"), None)
+        session.send(b"\xb0\x02" + mid)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    broker: "StubBroker"
+
+
+class StubBroker:
+    """Threaded broker; ``port=0`` picks a free port (see ``.port`` after ``start()``)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = _Server((host, port), _Handler)
+        self._server.broker = self
+        self._sessions: List[_Session] = []
+        self._retained: Dict[str, Tuple[bytes, int]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.published = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "StubBroker":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-broker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _attach(self, session: _Session) -> None:
+        with self._lock:
+            self._sessions.append(session)
+
+    def _detach(self, session: _Session) -> None:
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+
+    def _send_retained(self, session: _Session, filters: List[str]) -> None:
+        with self._lock:
+            retained = list(self._retained.items())
+        for topic, (payload, qos) in retained:
+            for sub in filters:
+                if topic_matches(sub, topic):
+                    session.deliver(topic.encode("utf-8"), payload, min(qos, session.subs[sub]), retain=True)
+                    break
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> None:
+        """Route a message to every matching subscriber (also usable from tests)."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            self.published += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = (payload, qos)
+                else:
+                    self._retained.pop(topic, None)
+            sessions = list(self._sessions)
+        raw_topic = topic.encode("utf-8")
+        for session in sessions:
+            granted = -1
+            for sub, sub_qos in list(session.subs.items()):
+                if topic_matches(sub, topic):
+                    granted = max(granted, sub_qos)
+            if granted >= 0:
+                session.deliver(raw_topic, payload, min(qos, granted, 1))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальный MQTT-брокер для стенда и бенчмарков")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    broker = StubBroker(args.host, args.port).start()
+    print(f"🧪 Заглушка брокера слушает {broker.host}:{broker.port} (Ctrl+C — выход)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, List
+
+import paho.mqtt.client as mqtt
+
+Handler = Callable[[mqtt.Client, object, mqtt.MQTTMessage], None]
+
+
+class TopicRouter:
+    """Per-filter message handlers on one paho client.
+
+    Each filter is registered with ``message_callback_add`` and subscribed
+    upstream only while at least one handler wants it, so the broker never
+    sends the supervisor topics nobody consumes. Messages that match no
+    filter fall through to ``client.on_message``, which the router leaves
+    empty. paho is never called under the lock the dispatchers read state
+    with; ``add``/``remove``/``on_connect`` hold a separate ``_paho_lock``
+    around both the state change and their paho calls, so a mode detaching
+    and another attaching the same filter cannot leave paho unsubscribed
+    while the router thinks the filter is live.
+    """
+
+    def __init__(self, client: mqtt.Client, registry=None) -> None:
+        self._client = client
+        self._registry = registry
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._qos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._paho_lock = threading.Lock()  # порядок: _paho_lock -> _lock, не наоборот
+        self._connected = False
+        client.on_message = None
+
+    def add(self, topic_filter: str, handler: Handler, qos: int = 0) -> None:
+        with self._paho_lock:
+            with self._lock:
+                handlers = self._handlers.get(topic_filter)
+                first = handlers is None
+                # список заменяется целиком: поток paho может как раз его обходить
+                self._handlers[topic_filter] = (handlers or []) + [handler]
+                self._qos[topic_filter] = max(qos, self._qos.get(topic_filter, 0))
+                connected = self._connected
+            if first:
+                self._client.message_callback_add(topic_filter, self._make_dispatcher(topic_filter))
+                if connected:
+                    self._client.subscribe(topic_filter, qos)
+
+    def remove(self, topic_filter: str, handler: Handler) -> None:
+        with self._paho_lock:
+            with self._lock:
+                handlers = [h for h in self._handlers.get(topic_filter, []) if h != handler]
+                last = topic_filter in self._handlers and not handlers
+                if last:
+                    self._handlers.pop(topic_filter, None)
+                    self._qos.pop(topic_filter, None)
+                elif topic_filter in self._handlers:
+                    self._handlers[topic_filter] = handlers
+                connected = self._connected
+            if last:
+                self._client.message_callback_remove(topic_filter)
+                if connected:
+                    self._client.unsubscribe(topic_filter)
+
+    def filters(self) -> List[str]:
+        with self._lock:
+            return list(self._handlers)
+
+    def _make_dispatcher(self, topic_filter: str) -> Handler:
+        received = self._registry.counter("mqtt_messages_total", "MQTT messages received per topic filter",
+                                          topic=topic_filter) if self._registry is not None else None
+
+        def dispatch(client, userdata, msg):
+            if received is not None:
+                received.inc()
+            for handler in self._handlers.get(topic_filter, ()):
+                handler(client, userdata, msg)
+        return dispatch
+
+    def on_connect(self, rc: int) -> None:
+        """(Re)subscribe every filter that has handlers; call from the client's on_connect."""
+        with self._paho_lock:
+            with self._lock:
+                self._connected = rc == 0
+                subs = list(self._qos.items())
+            if rc == 0 and subs:
+                self._client.subscribe(subs)
+
+    def on_disconnect(self) -> None:
+        with self._lock:
+            self._connected = False